@@ -0,0 +1,288 @@
+from src.ra_pst_py import utils
+from src.ra_pst_py.core import RA_PST
+from src.ra_pst_py.heuristic import TaskNode, CPType_Enum, EvaluationCache, evaluate_branch
+from src.ra_pst_py.schedule import ArrayTimeline
+
+from lxml import etree
+import numpy as np
+import copy
+import heapq
+import random
+import time
+
+
+# Placeholder for the instance id in the ilp_rep of the ProblemTable
+INSTANCE_ID_PLACEHOLDER = "\x00"
+
+
+class TableBranch():
+    """
+    One valid branch of a task in the ProblemTable.
+    job_nodes are the TaskNodes of the ilp_rep jobs of the branch, in the same order.
+    """
+    def __init__(self, task_node:TaskNode, branch_id:str, job_nodes:list[TaskNode], delete_labels:list[str]):
+        self.task_node = task_node
+        self.branch_id = branch_id
+        self.job_nodes = job_nodes
+        self.delete_labels = delete_labels
+
+
+class ProblemTable():
+    """
+    Everything the heuristic needs from an RA-PST, built once and shared by all instances:
+    the TaskNode trees of the valid branches of each task, the ilp_rep jobs they map to
+    and the task labels to resolve deletes.
+    """
+    def __init__(self, ra_pst:RA_PST):
+        self.ra_pst = ra_pst
+        self.task_ids: list[str] = ra_pst.get_tasklist(attribute="id")
+        self.ilp_rep: dict = ra_pst.get_ilp_rep(instance_id=INSTANCE_ID_PLACEHOLDER)
+        min_branch_costs = ra_pst.get_min_branch_costs()
+        self.min_costs = np.array([min_branch_costs.get(task_id, 0.0) for task_id in self.task_ids], dtype=float)
+        # Minimal work of each task and all tasks after it
+        self.remaining_work = np.cumsum(self.min_costs[::-1])[::-1]
+
+        # Deletes remove the first remaining task with the label, compared like in the Delete change operation
+        self.task_idxs_by_label: dict[str, list[int]] = {}
+        for task_idx, task in enumerate(ra_pst.get_tasklist()):
+            self.task_idxs_by_label.setdefault(utils.get_label(task).lower(), []).append(task_idx)
+
+        self.branches: list[list[TableBranch]] = []
+        for task_id in self.task_ids:
+            valid_branches = [branch for branch in ra_pst.branches[task_id] if branch.check_validity()]
+            branch_ids = self.ilp_rep["tasks"][f"{INSTANCE_ID_PLACEHOLDER}-{task_id}"]["branches"]
+            if len(valid_branches) != len(branch_ids):
+                raise ValueError(f"Number of valid branches <{len(valid_branches)}> does not match the ilp_rep <{len(branch_ids)}> for task {task_id}")
+            self.branches.append([self.build_table_branch(branch, branch_id) for branch, branch_id in zip(valid_branches, branch_ids)])
+
+    def build_table_branch(self, branch, branch_id:str) -> TableBranch:
+        task_node = TaskNode(branch.node)
+        task_nodes = task_node.get_task_nodes()
+        nodes_by_element = {node.task: node for node in task_nodes}
+        job_nodes = [nodes_by_element[task] for task in branch.get_serialized_tasklist()]
+        if len(job_nodes) != len(self.ilp_rep["branches"][branch_id]["jobs"]):
+            raise ValueError(f"Jobs of branch {branch_id} do not match the ilp_rep")
+        delete_labels = [node.label.lower() for node in task_nodes if node.cp_type == CPType_Enum.DELETE]
+        return TableBranch(task_node, branch_id, job_nodes, delete_labels)
+
+    def get_instance_ilp_rep(self, instance_id:int, release_time:int) -> dict:
+        """ Returns the ilp_rep of RA_PST.get_ilp_rep for an instance with the given id and release time"""
+        ilp_rep = relabel(self.ilp_rep, str(instance_id))
+        ilp_rep["instanceId"] = instance_id
+        ilp_rep["release_time"] = release_time
+        for element in list(ilp_rep["branches"].values()) + list(ilp_rep["jobs"].values()):
+            element["release_time"] = release_time
+        return ilp_rep
+
+
+def get_problem_xml(ra_pst:RA_PST) -> tuple[str, str]:
+    """ Returns the process and resource XML the RA-PST was built from"""
+    return etree.tostring(ra_pst.raw_process, encoding="unicode"), etree.tostring(ra_pst.resource_data, encoding="unicode")
+
+
+def get_problem_tables(ra_psts:list[RA_PST]) -> tuple[list[ProblemTable], list[int], list[tuple[str, str]]]:
+    """
+    Builds one ProblemTable per distinct RA-PST, copies of the same process and resources share a table.
+    Returns the tables, the table index of each RA-PST and the XML of each table.
+    """
+    tables, table_idxs, problems = [], [], []
+    for ra_pst in ra_psts:
+        problem = get_problem_xml(ra_pst)
+        if problem not in problems:
+            problems.append(problem)
+            tables.append(ProblemTable(ra_pst))
+        table_idxs.append(problems.index(problem))
+    return tables, table_idxs, problems
+
+
+def relabel(element, instance_id:str):
+    """ Replaces the id placeholder in all keys and strings of a (nested) ilp_rep"""
+    if isinstance(element, str):
+        return element.replace(INSTANCE_ID_PLACEHOLDER, instance_id)
+    if isinstance(element, dict):
+        return {relabel(key, instance_id): relabel(value, instance_id) for key, value in element.items()}
+    if isinstance(element, list):
+        return [relabel(value, instance_id) for value in element]
+    return copy.copy(element)
+
+
+class ArrayHeuristic():
+    """
+    Runs the earliest finish time heuristic of AllocationTypeEnum.HEURISTIC for many instances
+    of one RA-PST without Instance objects, process XML or schedule files.
+    Tasks are allocated one at a time in order of their release time, ties by instance index as in the EventQueue,
+    against an ArrayTimeline. get_schedule_dict returns the same schedule as the Simulator.
+    With an rng, ties between equal release times and between branches with equal finish
+    are broken randomly instead of by instance index and branch order.
+    With retire_instances, the state of each instance is kept in dicts by instance id,
+    so finished instances can be removed with retire_instance and only active instances are held.
+    """
+    def __init__(self, problem_table:ProblemTable=None, memoize:bool=False, rng:random.Random=None, retire_instances:bool=False):
+        self.table = problem_table
+        self.timeline = ArrayTimeline()
+        self.evaluation_cache = EvaluationCache() if memoize else None
+        self.rng = rng
+        self.retire_instances = retire_instances
+        self.n_instances = 0
+        if retire_instances:
+            self.instance_release_times: dict[int, float] = {}
+            self.tables: dict[int, ProblemTable] = {}
+            self.release_times: dict[int, float] = {}
+            self.current_tasks: dict[int, int] = {}
+            self.deleted: dict[int, set[int]] = {}
+            self.allocations: dict[int, list[tuple[str, list[tuple[float, float]]]]] = {}
+        else:
+            self.instance_release_times: list[float] = []
+            self.tables: list[ProblemTable] = []
+            # Per instance: release time of the next task, index of the next task, deleted task indices
+            self.release_times = np.empty(0)
+            self.current_tasks = np.empty(0, dtype=int)
+            self.deleted: list[set[int]] = []
+            # Per instance: (branch_id, [(start, cost)]) of each allocated task
+            self.allocations: list[list[tuple[str, list[tuple[float, float]]]]] = []
+        self.queue: list[tuple[float, float, int, int]] = []
+        self.queue_counter = 0
+        self.objective = 0
+        self.computing_time: float = None
+
+    def add_instances(self, release_times:list[float], problem_table:ProblemTable=None) -> None:
+        """ Adds one instance per release time, of problem_table or the table of the engine"""
+        if self.retire_instances:
+            for release_time in release_times:
+                self.activate_instance(release_time, problem_table)
+            return
+        first_idx = len(self.instance_release_times)
+        self.n_instances += len(release_times)
+        self.instance_release_times.extend(release_times)
+        self.tables.extend([problem_table or self.table] * len(release_times))
+        self.release_times = np.concatenate((self.release_times, np.asarray(release_times, dtype=float)))
+        self.current_tasks = np.concatenate((self.current_tasks, np.zeros(len(release_times), dtype=int)))
+        for instance_idx, release_time in enumerate(release_times, first_idx):
+            self.deleted.append(set())
+            self.allocations.append([])
+            self.push(release_time, instance_idx)
+
+    def activate_instance(self, release_time:float, problem_table:ProblemTable=None) -> int:
+        """ Adds one instance with retire_instances and returns its id, ids are given in order of activation """
+        if not self.retire_instances:
+            raise ValueError("Instances are activated one by one only with retire_instances, use add_instances")
+        instance_id = self.n_instances
+        self.n_instances += 1
+        self.instance_release_times[instance_id] = release_time
+        self.tables[instance_id] = problem_table or self.table
+        self.release_times[instance_id] = release_time
+        self.current_tasks[instance_id] = 0
+        self.deleted[instance_id] = set()
+        self.allocations[instance_id] = []
+        self.push(release_time, instance_id)
+        return instance_id
+
+    def retire_instance(self, instance_id:int) -> dict:
+        """ Removes an instance with retire_instances and returns its ilp_rep, its tasks must all be allocated """
+        if not self.retire_instances:
+            raise ValueError("Instances can only be retired with retire_instances")
+        ilp_rep = self.get_instance_ilp_rep(instance_id, self.instance_release_times[instance_id])
+        for state in (self.instance_release_times, self.tables, self.release_times, self.current_tasks, self.deleted, self.allocations):
+            del state[instance_id]
+        return ilp_rep
+
+    def push(self, release_time:float, instance_idx:int) -> None:
+        tie_breaker = self.rng.random() if self.rng is not None else instance_idx
+        heapq.heappush(self.queue, (release_time, tie_breaker, self.queue_counter, instance_idx))
+        self.queue_counter += 1
+
+    def simulate(self, deadline:float=None) -> bool:
+        """ Allocates all tasks, returns False if it stopped because time.time() passed the deadline """
+        start = time.time()
+        while self.queue:
+            if deadline is not None and time.time() > deadline:
+                self.computing_time = time.time() - start
+                return False
+            release_time, _, _, instance_idx = heapq.heappop(self.queue)
+            # Releases only grow, older intervals can not block any later task
+            self.timeline.set_horizon(release_time)
+            if self.allocate_next_task(instance_idx):
+                self.push(self.release_times[instance_idx], instance_idx)
+        self.computing_time = time.time() - start
+        return True
+
+    def allocate_next_task(self, instance_idx:int, branch_position:int=None) -> bool:
+        """
+        Allocates the next task of the instance with the branch of the earliest finish,
+        or with the branch at branch_position if it can be allocated.
+        Returns False if the instance has no tasks left.
+        """
+        table = self.tables[instance_idx]
+        task_idx = self.current_tasks[instance_idx]
+        release_time = self.release_times[instance_idx]
+        best_key, best_branch, best_interval = None, None, None
+        for position, table_branch in enumerate(table.branches[task_idx]):
+            if branch_position is not None and position != branch_position:
+                continue
+            if self.evaluation_cache is not None:
+                interval = self.evaluation_cache.evaluate(table_branch.task_node, release_time, self.timeline, table.ra_pst)
+            else:
+                interval = evaluate_branch(table_branch.task_node, release_time, self.timeline, table.ra_pst)
+            if table_branch.task_node.backwards_delete:
+                continue
+            # Ties go to the branch that comes first in the RA-PST
+            tie_breaker = self.rng.random() if self.rng is not None else position
+            key = (sum(interval[0:3]), tie_breaker)
+            if best_key is None or key < best_key:
+                best_key, best_branch, best_interval = key, table_branch, interval
+        if best_branch is None:
+            if branch_position is not None:
+                return self.allocate_next_task(instance_idx)
+            raise ValueError("No valid branch for this task")
+
+        # Starts and costs as they are written to and read from the schedule by the Simulator
+        jobs = []
+        for node in best_branch.job_nodes:
+            cost = (node.earliest_start + node.duration) - node.earliest_start
+            jobs.append((node.earliest_start, cost))
+            self.timeline.add_job(node.resource, node.earliest_start, cost)
+        self.allocations[instance_idx].append((best_branch.branch_id, jobs))
+
+        deleted = self.deleted[instance_idx]
+        for label in best_branch.delete_labels:
+            remaining = [idx for idx in table.task_idxs_by_label.get(label, []) if idx not in deleted]
+            if remaining:
+                deleted.add(remaining[0])
+
+        release_time = best_interval[0] + best_interval[1]
+        self.release_times[instance_idx] = release_time
+        if release_time > self.objective:
+            self.objective = release_time
+
+        task_idx += 1
+        while task_idx in deleted:
+            task_idx += 1
+        self.current_tasks[instance_idx] = task_idx
+        return task_idx < len(table.task_ids)
+
+    def get_instance_ilp_rep(self, instance_id:int, release_time:float) -> dict:
+        """ Returns the ilp_rep of the instance with its allocated jobs selected """
+        ilp_rep = self.tables[instance_id].get_instance_ilp_rep(instance_id, int(release_time))
+        for branch_id, jobs in self.allocations[instance_id]:
+            branch_id = relabel(branch_id, str(instance_id))
+            for job_id, (start, cost) in zip(ilp_rep["branches"][branch_id]["jobs"], jobs):
+                ilp_rep["jobs"][job_id].update({"start": start, "cost": cost, "selected": True})
+        return ilp_rep
+
+    def get_schedule_dict(self) -> dict:
+        """ Returns the schedule in the format of the Simulator """
+        instance_release_times = self.instance_release_times.items() if self.retire_instances else enumerate(self.instance_release_times)
+        allocations = self.allocations.values() if self.retire_instances else self.allocations
+        tables = self.tables.values() if self.retire_instances else self.tables
+        instances = [self.get_instance_ilp_rep(instance_id, release_time) for instance_id, release_time in instance_release_times]
+        total_interval_length = sum(cost for instance_allocations in allocations for _, jobs in instance_allocations for _, cost in jobs)
+        return {
+            "instances": instances,
+            "resources": list(dict.fromkeys(resource for table in tables for resource in table.ilp_rep["resources"])),
+            "objective": self.objective,
+            "solution": {
+                "objective": self.objective,
+                "computing time": self.computing_time,
+                "total interval length": total_interval_length
+            }
+        }
@@ -0,0 +1,128 @@
+from src.ra_pst_py.core import Branch
+from src.ra_pst_py.heuristic import CPType_Enum, evaluate_branch
+from src.ra_pst_py.schedule import Timeline, TimelineOverlay
+
+import time
+
+
+class BeamState():
+    """
+    Partial allocation of one instance: the chosen branch per task,
+    the timeline including the own jobs and the release time of the next task.
+    """
+    def __init__(self, timeline:TimelineOverlay, release_time:float, branch_positions:dict[str, int], deleted:frozenset, score:float=0):
+        self.timeline = timeline
+        self.release_time = release_time
+        self.branch_positions = branch_positions
+        self.deleted = deleted
+        self.score = score
+
+
+class BeamSearch():
+    """
+    Allocates all remaining tasks of an instance with a beam search over the branches.
+    Keeps the <width> best partial allocations after each task, scored by their end plus
+    the minimal work left. The width is doubled until the time budget is used up.
+    The first pass has width 1 and uses the ranking of the greedy heuristic,
+    so the result is never worse than SINGLE_INSTANCE_HEURISTIC.
+    """
+    def __init__(self, instance, time_budget:float=1.0, max_width:int=64):
+        self.instance = instance
+        self.ra_pst = instance.ra_pst
+        self.allocator = instance.allocator
+        self.time_budget = time_budget
+        self.max_width = max_width
+        self.valid_branches: dict[str, list[tuple[int, Branch]]] = {}
+        self.start_time: float = None
+
+    def get_valid_branches(self, task_id:str) -> list[tuple[int, Branch]]:
+        if task_id not in self.valid_branches:
+            self.valid_branches[task_id] = [(position, branch) for position, branch in enumerate(self.ra_pst.branches[task_id]) if branch.check_validity()]
+        return self.valid_branches[task_id]
+
+    def budget_exceeded(self) -> bool:
+        return time.time() - self.start_time > self.time_budget
+
+    def search(self, schedule_dict:dict) -> dict[str, int]:
+        """
+        Returns the position of the chosen branch in ra_pst.branches for each remaining task.
+        """
+        self.start_time = time.time()
+        task = self.instance.current_task
+        if task == "end":
+            return {}
+        task_ids = self.ra_pst.get_tasklist(attribute="id")
+        task_ids = task_ids[self.ra_pst.get_task_positions()[task.attrib["id"]]:]
+        release_time = float(task.xpath("cpee1:release_time", namespaces=self.ra_pst.ns)[0].text)
+        root = BeamState(TimelineOverlay(Timeline.from_schedule_dict(schedule_dict)), release_time, {}, frozenset())
+
+        best_state = None
+        width = 1
+        while width <= self.max_width:
+            state, pruned = self.run_beam(root, task_ids, width, must_finish=best_state is None)
+            if state is None:
+                break
+            if best_state is None or state.release_time < best_state.release_time:
+                best_state = state
+            if not pruned or self.budget_exceeded():
+                break
+            width *= 2
+        return best_state.branch_positions
+
+    def run_beam(self, root:BeamState, task_ids:list[str], width:int, must_finish:bool) -> tuple[BeamState, bool]:
+        """
+        One pass over all tasks with a fixed width.
+        Returns the best complete state, or None if the time budget ran out first.
+        """
+        beam = [root]
+        pruned = False
+        for i, task_id in enumerate(task_ids):
+            children = []
+            for state in beam:
+                if task_id in state.deleted:
+                    children.append(state)
+                else:
+                    children.extend(self.expand(state, task_id, task_ids[i+1:], greedy=width == 1))
+            if not children:
+                raise ValueError(f"No valid branch for task {task_id}")
+            children.sort(key=lambda child: child.score)
+            pruned = pruned or len(children) > width
+            beam = children[:width]
+            if not must_finish and self.budget_exceeded():
+                return None, pruned
+        return min(beam, key=lambda state: state.release_time), pruned
+
+    def expand(self, state:BeamState, task_id:str, later_task_ids:list[str], greedy:bool=False) -> list[BeamState]:
+        """ Creates one child state for each valid branch of the task"""
+        task_ids_by_label = self.ra_pst.get_task_ids_by_label()
+        min_branch_costs = self.ra_pst.get_min_branch_costs()
+        children = []
+        for position, branch in self.get_valid_branches(task_id):
+            task_node = self.allocator.get_task_node(branch)
+            interval = evaluate_branch(task_node, state.release_time, state.timeline, self.ra_pst)
+            if task_node.backwards_delete:
+                continue
+            task_nodes = task_node.get_task_nodes()
+            jobs = [(node.resource, node.earliest_start, node.duration) for node in task_nodes if node.cp_type != CPType_Enum.DELETE]
+
+            # A delete removes the first remaining task with the label
+            deleted = set(state.deleted)
+            for node in task_nodes:
+                if node.cp_type == CPType_Enum.DELETE:
+                    remaining = [delete_id for delete_id in task_ids_by_label.get(node.label, []) if delete_id not in deleted]
+                    if remaining:
+                        deleted.add(remaining[0])
+
+            release_time = interval[0] + interval[1]
+            if greedy:
+                score = sum(interval[0:3])
+            else:
+                score = release_time + sum([min_branch_costs[later_id] for later_id in later_task_ids if later_id not in deleted])
+            children.append(BeamState(
+                state.timeline.with_jobs(jobs),
+                release_time,
+                {**state.branch_positions, task_id: position},
+                frozenset(deleted),
+                score
+            ))
+        return children
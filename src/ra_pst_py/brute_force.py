@@ -1,6 +1,7 @@
 from src.ra_pst_py.instance import Instance
 from src.ra_pst_py.core import RA_PST
 from src.ra_pst_py.builder import build_rapst
+from src.ra_pst_py.workspace import Workspace
 
 import multiprocessing as mp
 import numpy as np
@@ -13,18 +14,20 @@ import uuid
 import pathlib
 from lxml import etree
 
-def build_optimized_instance_brute(ra_pst:RA_PST):
-    search = BruteForceSearch(ra_pst)
+def build_optimized_instance_brute(ra_pst:RA_PST, workspace:Workspace=None):
+    search = BruteForceSearch(ra_pst, workspace=workspace)
     all_options = search.get_all_branch_combinations()
     print(len(all_options))
     results = search.find_solutions(all_options)
-    search.save_best_solution_process(out_file="tmp/brute_process.xml")
+    search.save_best_solution_process(out_file=search.workspace.path("tmp", "brute_process.xml"))
     instance = search.get_best_instance()
     return instance
 
 class BruteForceSearch():
-    def __init__(self, ra_pst:RA_PST, measure="cost"):
+    def __init__(self, ra_pst:RA_PST, measure="cost", workspace:Workspace=None):
         self.ra_pst = ra_pst
+        # Directory for the process, resources and result pickles shared with the worker processes
+        self.workspace = workspace or Workspace()
         self.solutions = []
         self.ns = {"cpee1" : list(self.ra_pst.process.nsmap.values())[0]}
         self.pickle_writer = 0
@@ -59,22 +62,18 @@ class BruteForceSearch():
             part_size = 1
         list_parts = []
         
-        folder_name = 'tmp'
-        if not os.path.exists(folder_name):
-            os.makedirs(folder_name)
-            os.makedirs(folder_name + "/results")
-        
+        self.workspace.directory("tmp", "results")
 
         tree = etree.ElementTree(self.ra_pst.raw_process)
         etree.indent(tree, space="\t", level=0)
-        tree.write("tmp/process.xml")
+        tree.write(self.workspace.path("tmp", "process.xml"))
     
         tree = etree.ElementTree(self.ra_pst.resource_url)
         etree.indent(tree, space="\t", level=0)
-        tree.write("tmp/resources.xml")
+        tree.write(self.workspace.path("tmp", "resources.xml"))
         list_parts = [solutions[part_size * i : part_size * (i + 1)] for i in range(num_parts)]
 
-        results[1] = pool.map(find_best_solution, [(part, measure, i) for i, part in enumerate(list_parts)])
+        results[1] = pool.map(find_best_solution, [(part, measure, i, self.workspace) for i, part in enumerate(list_parts)])
         pool.close()
         pool.join()
         print(results [1])
@@ -93,8 +92,9 @@ class BruteForceSearch():
         brute_solutions = [dict(zip(tasklist, solution)) for solution in brute_solutions]
         return brute_solutions
 
-    def combine_pickles(self, folder_path="tmp/results", measure="cost"):
+    def combine_pickles(self, folder_path=None, measure="cost"):
         print("combine_pickles")
+        folder_path = folder_path or self.workspace.directory("tmp", "results")
         files = os.listdir(folder_path) # Get all Pickle files
         best_solutions = []
         for file in files:
@@ -117,9 +117,9 @@ class BruteForceSearch():
         return best_solutions
 
 def find_best_solution(solutions): # branches ,measure, n):
-    solution_branches, measure, n = solutions
+    solution_branches, measure, n, workspace = solutions
 
-    dummy_ra_pst = build_rapst("tmp/process.xml", "tmp/resources.xml")
+    dummy_ra_pst = build_rapst(workspace.path("tmp", "process.xml"), workspace.path("tmp", "resources.xml"))
     best_solutions = [] 
     start, start1 = time.time(), time.time()
     timetrack = []
@@ -153,17 +153,18 @@ def find_best_solution(solutions): # branches ,measure, n):
         #    start = time.time()
     #print("Best solutions: ", best_solutions)
     if best_solutions:
-        dump_to_pickle(best_solutions, n)
+        dump_to_pickle(best_solutions, n, workspace)
     return (f"done_{n}")
 
-def dump_to_pickle(best_solutions, i):
+def dump_to_pickle(best_solutions, i, workspace:Workspace=None):
     #for solution in best_solutions:
     #    solution["solution"] = solution["solution"].get_pickleable_object()
 
     solution = best_solutions[-1]
     solution = instance_to_pickle(solution["solution"])
     solution = {"solution": solution, "cost": best_solutions[-1]["cost"]}
-    with open(f"tmp/results/results_{i}.pkl", "wb") as f:
+    workspace = workspace or Workspace()
+    with open(workspace.path("tmp", "results", f"results_{i}.pkl"), "wb") as f:
         pickle.dump([solution], f)
 
 def instance_to_pickle(solution):
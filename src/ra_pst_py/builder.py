@@ -1,5 +1,6 @@
 from .core import RA_PST
 from .graphix import TreeGraph
+from .workspace import Workspace
 from .file_parser import parse_process_file, parse_resource_file
 from src.ra_pst_py.ilp import configuration_ilp, scheduling_ilp, combined_ilp
 from src.ra_pst_py.cp_google_or import conf_cp
@@ -29,13 +30,14 @@ def get_rapst_str(process_file, resource_file):
     return ra_pst.get_ra_pst_str()
 
 
-def show_tree_as_graph(ra_pst, format="png", output_file="graphs/output_graph", view=True, res_option="children"):
+def show_tree_as_graph(ra_pst, format="png", output_file=None, view=True, res_option="children", workspace:Workspace=None):
     """Creates graphical representation from RA-PST description or Object
 
     Args:
         tree_xml (RA_PST, str, etree._Element, file): Input RA-PST, 
         format (str): Format of resulting graphic
-        output_file (str): Path where graphic will be saved
+        output_file (str): Path where graphic will be saved, by default graphs/output_graph in the workspace
+        workspace (Workspace): Directory for the intermediate DOT file and the default output_file
     """
     if type(ra_pst) is RA_PST:
         tree_xml = ra_pst.ra_pst
@@ -43,7 +45,7 @@ def show_tree_as_graph(ra_pst, format="png", output_file="graphs/output_graph",
         tree_xml = ra_pst
     process_data = parse_process_file(tree_xml)
     graph = TreeGraph()
-    graph.show(process_data, format, output_file, view, res_option)
+    graph.show(process_data, format, output_file, view, res_option, workspace=workspace)
 
 
 # TODO create representation of RA-PST for Scheduling with ILP or CP
@@ -75,18 +77,19 @@ def get_ilp_rep(ra_pst: RA_PST):
     }
 
 """
-def build_optimized_instance(ra_pst:RA_PST, solver:str = "ilp") -> Instance:        
+def build_optimized_instance(ra_pst:RA_PST, solver:str = "ilp", workspace:Workspace=None) -> Instance:        
     ilp_rep = ra_pst.get_ilp_rep() 
-    pathlib.Path("tmp").mkdir(parents=True, exist_ok=True)
-    with open("tmp/ilp_rep.json", "w") as f:
+    workspace = workspace or Workspace()
+    ilp_path = workspace.path("tmp", "ilp_rep.json")
+    with open(ilp_path, "w") as f:
         json.dump(ilp_rep, f, indent=2)
         f.close()
     if solver == "ilp":
-        conf_ilp = combined_ilp("tmp/ilp_rep.json")
-        with open("out/ilp_result.json", "w") as f:
+        conf_ilp = combined_ilp(ilp_path)
+        with open(workspace.path("out", "ilp_result.json"), "w") as f:
             json.dump(conf_ilp, f)
     elif solver == "cp":
-        conf_ilp = conf_cp("tmp/ilp_rep.json")
+        conf_ilp = conf_cp(ilp_path)
     else:
         raise NotImplementedError(f"Specified solver {solver} not implemented.")
     
@@ -0,0 +1,39 @@
+from lxml import etree
+
+import os
+import pickle
+
+
+class StatePickler(pickle.Pickler):
+    """
+    Pickler for simulation states that hold lxml elements.
+    Each document is serialized once through its root, other elements refer to the root by their path,
+    so elements of the same tree are in the same tree again after loading.
+    """
+    def reducer_override(self, obj):
+        if isinstance(obj, etree._ElementTree):
+            return etree.ElementTree, (obj.getroot(),)
+        if isinstance(obj, etree._Element):
+            tree = obj.getroottree()
+            root = tree.getroot()
+            if obj is root:
+                return etree.fromstring, (etree.tostring(root),)
+            return get_element, (root, tree.getpath(obj))
+        return NotImplemented
+
+
+def get_element(root:etree._Element, path:str) -> etree._Element:
+    return root.getroottree().xpath(path)[0]
+
+
+def save_state(state, filepath:os.PathLike | str) -> None:
+    """ Pickles the state to filepath, the previous state is replaced atomically """
+    temp_filepath = f"{filepath}.tmp"
+    with open(temp_filepath, "wb") as f:
+        StatePickler(f, protocol=pickle.HIGHEST_PROTOCOL).dump(state)
+    os.replace(temp_filepath, filepath)
+
+
+def load_state(filepath:os.PathLike | str):
+    with open(filepath, "rb") as f:
+        return pickle.load(f)
@@ -0,0 +1,87 @@
+from src.ra_pst_py import utils
+
+import bisect
+import os
+
+
+def left_shift_schedule(schedule:dict | os.PathLike | str, frozen_before:float=None) -> dict:
+    """
+    Moves every selected job to the earliest start that respects its release time,
+    the ends of its predecessors and the other jobs on its resource.
+    Two selected jobs related through "after" keep the order they have in the schedule:
+    the heuristic can order the jobs of a branch differently than the "after" lists of the ilp_rep.
+    Jobs are placed in order of their current start, so no job starts later than before.
+    Frozen jobs keep their start: jobs fixed by the replanning CP ("fixed" in the job)
+    and jobs that start before frozen_before, e.g. because they are already running.
+    Other jobs are not moved before frozen_before.
+    Updates the schedule in place and returns it, with objective and total interval length updated.
+    """
+    schedule = utils.load_json(schedule)
+    jobs = {}
+    for instance in schedule["instances"]:
+        for job_id, job in instance["jobs"].items():
+            if job["selected"] and job["start"] is not None:
+                jobs[job_id] = job
+    if not jobs:
+        return schedule
+
+    predecessors = {job_id: [] for job_id in jobs}
+    for job_id, job in jobs.items():
+        for other_id in job["after"]:
+            if other_id not in jobs:
+                continue
+            other = jobs[other_id]
+            if other["start"] + other["cost"] <= job["start"]:
+                predecessors[job_id].append(other_id)
+            elif job["start"] + job["cost"] <= other["start"]:
+                predecessors[other_id].append(job_id)
+
+    # Precedence depth orders jobs with the same start, e.g. zero-cost predecessors
+    depths = {}
+    def get_depth(job_id:str) -> int:
+        if job_id not in depths:
+            depths[job_id] = 1 + max([get_depth(predecessor) for predecessor in predecessors[job_id]], default=0)
+        return depths[job_id]
+
+    # Busy intervals per resource
+    intervals: dict[str, tuple[list[float], list[float]]] = {}
+    free_jobs = []
+    for job_id, job in jobs.items():
+        if job.get("fixed") or (frozen_before is not None and job["start"] < frozen_before):
+            add_interval(intervals, job)
+        else:
+            free_jobs.append(job_id)
+    free_jobs.sort(key=lambda job_id: (jobs[job_id]["start"], get_depth(job_id)))
+
+    for job_id in free_jobs:
+        job = jobs[job_id]
+        earliest_start = max([job["release_time"] or 0, frozen_before or 0] + [jobs[predecessor]["start"] + jobs[predecessor]["cost"] for predecessor in predecessors[job_id]])
+        job["start"] = get_earliest_gap(intervals.get(job["resource"], ([], [])), earliest_start, job["cost"])
+        add_interval(intervals, job)
+
+    objective = max(job["start"] + job["cost"] for job in jobs.values())
+    total_interval_length = sum(job["cost"] for job in jobs.values())
+    schedule["objective"] = objective
+    schedule.setdefault("solution", {})
+    schedule["solution"]["objective"] = objective
+    schedule["solution"]["total interval length"] = total_interval_length
+    return schedule
+
+
+def add_interval(intervals:dict[str, tuple[list, list]], job:dict):
+    """ Adds the job to the sorted (starts, ends) of its resource. Intervals do not overlap, so the ends are sorted as well"""
+    starts, ends = intervals.setdefault(job["resource"], ([], []))
+    position = bisect.bisect_right(starts, job["start"])
+    starts.insert(position, job["start"])
+    ends.insert(position, job["start"] + job["cost"])
+
+
+def get_earliest_gap(intervals:tuple[list, list], earliest_start:float, duration:float) -> float:
+    """ Returns the earliest start >= earliest_start at which duration fits between the busy intervals"""
+    starts, ends = intervals
+    start = earliest_start
+    for position in range(bisect.bisect_right(ends, start), len(starts)):
+        if start + duration <= starts[position]:
+            break
+        start = max(start, ends[position])
+    return start
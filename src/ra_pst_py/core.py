@@ -1,6 +1,7 @@
 # Import modules
 from . import utils
 from src.ra_pst_py.change_operations import ChangeOperationError, ChangeOperation
+from src.ra_pst_py.workspace import Workspace
 
 # Import external packages
 from lxml import etree
@@ -38,6 +39,9 @@ class RA_PST:
         self.transformed_items = []
         self.problem_size = None
         self.flex_factor = None
+        self.task_positions: dict[str, int] = None
+        self.task_ids_by_label: dict[str, list[str]] = None
+        self.min_branch_costs: dict[str, float] = None
 
     def get_ra_pst_str(self) -> str:
         if not self.ra_pst:
@@ -60,6 +64,30 @@ class RA_PST:
         else:
             return [task.attrib[f"{attribute}"] for task in tasklist]
 
+    def get_task_positions(self) -> dict[str, int]:
+        "Returns the position of each task in get_tasklist() by task id"
+        if self.task_positions is None:
+            self.task_positions = {task.attrib["id"]: position for position, task in enumerate(self.get_tasklist())}
+        return self.task_positions
+
+    def get_task_ids_by_label(self) -> dict[str, list[str]]:
+        "Returns the ids of all tasks with the same label, in process order"
+        if self.task_ids_by_label is None:
+            task_ids_by_label = defaultdict(list)
+            for task in self.get_tasklist():
+                task_ids_by_label[utils.get_label(task)].append(task.attrib["id"])
+            self.task_ids_by_label = dict(task_ids_by_label)
+        return self.task_ids_by_label
+
+    def get_min_branch_costs(self) -> dict[str, float]:
+        "Returns the cost of the cheapest branch for each task id"
+        if self.min_branch_costs is None:
+            self.min_branch_costs = {
+                task_id: min([branch.get_branch_costs() for branch in branches]) 
+                for task_id, branches in self.branches.items() if branches
+            }
+        return self.min_branch_costs
+
     def get_resourcelist(self) -> list:
         "Returns list of all Resource-IDs in self.resource_data"
         tree = self.resource_data
@@ -741,13 +769,15 @@ class Branch:
         earliest_possible_start=None,
         change_op=None,
         delete: bool = False,
+        workspace: Workspace = None,
     ) -> etree:
         """
         -> Find task to allocate in process
         -> apply change operations
         """
         ns = {"cpee1": list(ra_pst.nsmap.values())[0]}
-        with open("branch_raw.xml", "wb") as f:
+        workspace = workspace or Workspace()
+        with open(workspace.path("branch_raw.xml"), "wb") as f:
             f.write(etree.tostring(self.node))
         new_node = copy.deepcopy(self.node)
         self.check_validity()
@@ -833,7 +863,7 @@ class Branch:
             except ChangeOperationError:
                 solution.invalid_branches = True
 
-        with open("process.xml", "wb") as f:
+        with open(workspace.path("process.xml"), "wb") as f:
             f.write(etree.tostring(ra_pst))
         # print("Checkpoint for application")
         return ra_pst
@@ -842,7 +872,8 @@ class Branch:
         self,
         instance,
         earliest_possible_start=None,
-        delete:bool = False
+        delete:bool = False,
+        workspace:Workspace = None
     ) -> etree: #Should be instance
         """
         -> Find task to allocate in process
@@ -915,7 +946,8 @@ class Branch:
             except ChangeOperationError:
                 instance.invalid_branches = True
 
-        with open("tmp/process.xml", "wb") as f:
+        workspace = workspace or getattr(instance, "workspace", None) or Workspace()
+        with open(workspace.path("tmp", "process.xml"), "wb") as f:
             f.write(etree.tostring(instance.ra_pst.process))
         return instance.ra_pst
 
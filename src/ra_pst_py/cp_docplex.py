@@ -1,4 +1,5 @@
 from docplex.cp.model import *
+from src.ra_pst_py import utils
 import json
 import gurobipy as gp
 from gurobipy import GRB
@@ -7,8 +8,12 @@ from gurobipy import GRB
 context.solver.local.execfile = '/opt/ibm/ILOG/CPLEX_Studio2211/cpoptimizer/bin/x86-64_linux/cpoptimizer'
 
 
-def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", timeout=100, break_symmetries:bool=False, sigma:int=0):
+def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", timeout=100, break_symmetries:bool=False, sigma:int=0, rolling_horizon:bool=False):
     """
+    With rolling_horizon, only the window from the earliest release time of the unfixed instances is modeled:
+    selected jobs of fixed instances that cannot move anymore are frozen, see build_cp_model.
+    Frozen jobs that end before the window are dropped, the others block their resource through a step function.
+    The objective still includes the latest end of the frozen jobs.
     ra_pst_json input format:
     {
         "resources": [resourceId],
@@ -46,8 +51,7 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
         ra_psts = json.load(f)
     
     if warm_start_json:
-        with open(warm_start_json, "r") as f:
-            warm_start_ra_psts = json.load(f)
+        warm_start_ra_psts = utils.load_json(warm_start_json)
     
     # Fix taskIds for deletes: 
     for i, instance in enumerate(ra_psts["instances"]):
@@ -60,10 +64,102 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
     #-----------------------------------------------------------------------------
     # Build the model
     #-----------------------------------------------------------------------------
+    model, fixed_intervals = build_cp_model(ra_psts, sigma=sigma, rolling_horizon=rolling_horizon)
+
+    if warm_start_json:
+        starting_solution = CpoModelSolution()
+        for i, ra_pst in enumerate(ra_psts["instances"]):
+            if not ra_pst["fixed"]:
+                for jobId, job in ra_pst["jobs"].items():
+                    interval_var = job["interval"]
+                    warm_start_job = warm_start_ra_psts["instances"][i]["jobs"][jobId]
+                    if warm_start_job["selected"]:
+                        starting_solution.add_interval_var_solution(interval_var, start=int(warm_start_job["start"]), end=int(warm_start_job["start"] + warm_start_job["cost"]), size=int(warm_start_job["cost"]), presence=True)
+                    else:
+                        starting_solution.add_interval_var_solution(interval_var, presence=False)
+        if len(starting_solution.get_all_var_solutions()) != len(model.get_all_variables())-fixed_intervals:
+            raise ValueError(f"Solution size <{len(starting_solution.get_all_var_solutions())}> does not match model size <{len(model.get_all_variables())-fixed_intervals}>")
+        model.set_starting_point(starting_solution)
+
+    with open(log_file, "w") as f:
+        result = model.solve(TimeLimit=timeout, log_output=f)
+    # result.print_solution()
+    if result.get_solve_status() == "Infeasible":
+        raise ValueError("Infeasible model")
+    intervals = []
+    for ra_pst in ra_psts["instances"]:
+        if not ra_pst["fixed"]:
+            for jobId, job in ra_pst["jobs"].items():
+                itv = result.get_var_solution(ra_pst["jobs"][jobId]["interval"])
+                job["selected"] = itv.is_present()
+                job["start"] = itv.get_start()
+                del job["interval"]
+
+        else:
+            for jobId, job in ra_pst["jobs"].items():
+                if "interval" in job.keys():
+                    itv = result.get_var_solution(ra_pst["jobs"][jobId]["interval"])
+                    job["selected"] = itv.is_present()
+                    job["start"] = itv.get_start()
+                    del job["interval"]
+        ra_pst["fixed"] = True
+    
+        for jobId, job in ra_pst["jobs"].items():
+            if job["selected"]:
+                intervals.append(job)
+    
+    solve_details = result.get_solver_infos()
+    total_interval_length = sum([element["cost"] for element in intervals])
 
+    # Metadata per instance:
+    ra_psts["instances"][-1]["solution"] = {
+            "objective": result.get_objective_value(),
+            "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
+            "computing time": solve_details.get('TotalTime', 'N/A'),
+            "solver status": result.get_solve_status(),
+            "branches": solve_details.get('NumberOfBranches', 'N/A'),
+            "propagations": solve_details.get('NumberOfPropagations','N/A'),
+            "total interval length": total_interval_length,
+            "lower_bound" : result.get_objective_bound()
+        }
+
+
+    if "solution" in ra_psts.keys():
+        computing_time = ra_psts["solution"]["computing time"] + solve_details.get('TotalTime', 'N/A')
+    else:
+        computing_time = solve_details.get('TotalTime', 'N/A')
+    ra_psts["solution"] = {
+        "objective": result.get_objective_value(),
+        "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
+        "lower_bound" : result.get_objective_bound(),
+        "computing time": computing_time,
+        "solver status": result.get_solve_status(),
+        "branches": solve_details.get('NumberOfBranches', 'N/A'),
+        "propagations": solve_details.get('NumberOfPropagations','N/A'),
+        "total interval length": total_interval_length
+        #"objective_no_symmetry_breaking": result.get_objective_value() - alpha * sum([interval.get_size()[0] * presence_of(interval) for interval in job_intervals])
+    }
+    # TODO maybe add resource usage
+    return ra_psts
+
+
+def build_cp_model(ra_psts:dict, sigma:int=0, rolling_horizon:bool=False) -> tuple[CpoModel, int]:
+    """
+    Builds the CP model of cp_solver and returns it with the number of interval variables of fixed instances.
+    Adds an "interval" to each modeled job of ra_psts.
+    With rolling_horizon and sigma = 0, all selected jobs of fixed instances are frozen.
+    With sigma > 0, only the jobs that end before the window even when shifted by sigma are frozen (and dropped),
+    the others keep an interval that can move by sigma.
+    """
     model = CpoModel()
     job_intervals = []
     fixed_intervals = 0
+    # Rolling horizon: busy intervals of the frozen jobs per resource and their latest end
+    window_start = None
+    frozen_blocks = {}
+    frozen_end = 0
+    if rolling_horizon:
+        window_start = min([job["release_time"] or 0 for ra_pst in ra_psts["instances"] if not ra_pst["fixed"] for job in ra_pst["jobs"].values()], default=0)
 
     for ra_pst in ra_psts["instances"]:
         min_time = 0
@@ -71,6 +167,12 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
             # Create fixed intervals for selected jobs:
             for jobId, job in ra_pst["jobs"].items():
                 if job["selected"]:
+                    if window_start is not None and job["start"] is not None and (sigma == 0 or int(job["start"]) + int(job["cost"]) + sigma <= window_start):
+                        end_hr = int(job["start"]) + int(job["cost"])
+                        frozen_end = max(frozen_end, end_hr)
+                        if end_hr > window_start:
+                            frozen_blocks.setdefault(job["resource"], []).append((int(job["start"]), end_hr))
+                        continue
                     job["interval"] = model.interval_var(name=jobId, optional=False, size=int(job["cost"]))
                     # print(f'Add job {jobId}')
                     
@@ -102,7 +204,8 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
         for jobId, job in ra_pst["jobs"].items():
             for jobId2 in job["after"]:
                 if ra_pst["fixed"]:
-                    if ra_pst["jobs"][jobId]["selected"] & ra_pst["jobs"][jobId2]["selected"]:
+                    # Frozen jobs have no interval, a job that can still move starts after its frozen predecessors anyway
+                    if "interval" in ra_pst["jobs"][jobId] and "interval" in ra_pst["jobs"][jobId2]:
                         model.add(end_before_start(ra_pst["jobs"][jobId2]["interval"], ra_pst["jobs"][jobId]["interval"]))
                 else:    
                     model.add(end_before_start(ra_pst["jobs"][jobId2]["interval"], ra_pst["jobs"][jobId]["interval"]))
@@ -112,14 +215,21 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
         resource_intervals = []
         for ra_pst in ra_psts["instances"]:
             if ra_pst["fixed"]:
-                resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if (job["resource"] == r and job["selected"])])
+                resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if (job["resource"] == r and "interval" in job)])
             else:
                 resource_intervals.extend([job["interval"] for job in ra_pst["jobs"].values() if job["resource"] == r])
         if len(resource_intervals) > 0:
             model.add(no_overlap(resource_intervals))
+        if r in frozen_blocks:
+            availability = CpoStepFunction()
+            availability.set_value(0, INTERVAL_MAX, 100)
+            for start, end in frozen_blocks[r]:
+                availability.set_value(start, end, 0)
+            for interval in resource_intervals:
+                model.add(forbid_extent(interval, availability))
     
 
-    model.add(minimize(max([end_of(interval) for interval in job_intervals])))
+    model.add(minimize(max([end_of(interval) for interval in job_intervals] + ([frozen_end] if frozen_end else []))))
 
     # Configuration constraints
     # Select exactly one branch from each non-deleted task
@@ -155,82 +265,7 @@ def cp_solver(ra_pst_json, warm_start_json=None, log_file = "cpo_solver.log", ti
                 if len(branch_jobs) > 0:
                     model.add(equal(presence_of(ra_pst["jobs"][jobId]["interval"]), presence_of(ra_pst["jobs"][branch_jobs[-1]]["interval"])))
                 branch_jobs.append(jobId)
-
-    if warm_start_json:
-        starting_solution = CpoModelSolution()
-        for i, ra_pst in enumerate(ra_psts["instances"]):
-            if not ra_pst["fixed"]:
-                for jobId, job in ra_pst["jobs"].items():
-                    interval_var = job["interval"]
-                    warm_start_job = warm_start_ra_psts["instances"][i]["jobs"][jobId]
-                    if warm_start_job["selected"]:
-                        starting_solution.add_interval_var_solution(interval_var, start=warm_start_job["start"], end= warm_start_job["start"] + warm_start_job["cost"], size=warm_start_job["cost"], presence= warm_start_job["selected"])
-                    else:
-                        starting_solution.add_interval_var_solution(interval_var, start=warm_start_job["start"], end=None, size=warm_start_job["cost"], presence= warm_start_job["selected"])
-        if len(starting_solution.get_all_var_solutions()) != len(model.get_all_variables())-fixed_intervals:
-            raise ValueError(f"Solution size <{len(starting_solution.get_all_var_solutions())}> does not match model size <{len(model.get_all_variables())-fixed_intervals}>")
-        model.set_starting_point(starting_solution)
-
-    with open(log_file, "w") as f:
-        result = model.solve(TimeLimit=timeout, log_output=f)
-    # result.print_solution()
-    if result.get_solve_status() == "Infeasible":
-        raise ValueError("Infeasible model")
-    intervals = []
-    for ra_pst in ra_psts["instances"]:
-        if not ra_pst["fixed"]:
-            for jobId, job in ra_pst["jobs"].items():
-                itv = result.get_var_solution(ra_pst["jobs"][jobId]["interval"])
-                job["selected"] = itv.is_present()
-                job["start"] = itv.get_start()
-                del job["interval"]
-
-        else:
-            for jobId, job in ra_pst["jobs"].items():
-                if "interval" in job.keys():
-                    itv = result.get_var_solution(ra_pst["jobs"][jobId]["interval"])
-                    job["selected"] = itv.is_present()
-                    job["start"] = itv.get_start()
-                    del job["interval"]
-        ra_pst["fixed"] = True
-    
-        for jobId, job in ra_pst["jobs"].items():
-            if job["selected"]:
-                intervals.append(job)
-    
-    solve_details = result.get_solver_infos()
-    total_interval_length = sum([element["cost"] for element in intervals])
-
-    # Metadata per instance:
-    ra_psts["instances"][-1]["solution"] = {
-            "objective": result.get_objective_value(),
-            "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
-            "computing time": solve_details.get('TotalTime', 'N/A'),
-            "solver status": result.get_solve_status(),
-            "branches": solve_details.get('NumberOfBranches', 'N/A'),
-            "propagations": solve_details.get('NumberOfPropagations','N/A'),
-            "total interval length": total_interval_length,
-            "lower_bound" : result.get_objective_bound()
-        }
-
-
-    if "solution" in ra_psts.keys():
-        computing_time = ra_psts["solution"]["computing time"] + solve_details.get('TotalTime', 'N/A')
-    else:
-        computing_time = solve_details.get('TotalTime', 'N/A')
-    ra_psts["solution"] = {
-        "objective": result.get_objective_value(),
-        "optimality gap": solve_details.get('RelativeOptimalityGap', 'N/A'),
-        "lower_bound" : result.get_objective_bound(),
-        "computing time": computing_time,
-        "solver status": result.get_solve_status(),
-        "branches": solve_details.get('NumberOfBranches', 'N/A'),
-        "propagations": solve_details.get('NumberOfPropagations','N/A'),
-        "total interval length": total_interval_length
-        #"objective_no_symmetry_breaking": result.get_objective_value() - alpha * sum([interval.get_size()[0] * presence_of(interval) for interval in job_intervals])
-    }
-    # TODO maybe add resource usage
-    return ra_psts
+    return model, fixed_intervals
 
 
 def cp_solver_alternative_new(ra_pst_json, warm_start_json=None, log_file = "cpo_solver_new.log", timeout = 100, replan = False, release_time:int=0, break_symmetries:bool=False, sigma = 0):
@@ -271,6 +306,9 @@ def cp_solver_alternative_new(ra_pst_json, warm_start_json=None, log_file = "cpo
     with open(ra_pst_json, "r") as f:
         ra_psts = json.load(f)
     
+    if warm_start_json:
+        warm_start_ra_psts = utils.load_json(warm_start_json)
+    
     # Fix taskIds for deletes: 
     for i, instance in enumerate(ra_psts["instances"]):
         if "fixed" not in instance.keys():
@@ -404,6 +442,19 @@ def cp_solver_alternative_new(ra_pst_json, warm_start_json=None, log_file = "cpo
                     model.add(model.alternative(dummy_task, alternatives))
                     model.add(sum(presence_of(alt) for alt in alternatives) + deleted_by == 1)
 
+    # Starting point for all jobs that are not fixed
+    if warm_start_json:
+        starting_solution = CpoModelSolution()
+        for i, ra_pst in enumerate(ra_psts["instances"]):
+            for jobId, job in ra_pst["jobs"].items():
+                if "fixed" in job.keys(): continue
+                warm_start_job = warm_start_ra_psts["instances"][i]["jobs"][jobId]
+                if warm_start_job["selected"]:
+                    starting_solution.add_interval_var_solution(job["interval"], start=int(warm_start_job["start"]), end=int(warm_start_job["start"] + warm_start_job["cost"]), size=int(warm_start_job["cost"]), presence=True)
+                else:
+                    starting_solution.add_interval_var_solution(job["interval"], presence=False)
+        model.set_starting_point(starting_solution)
+
     #result = model.solve()
     # Solve and write log to file
     with open(log_file, "w") as f:
@@ -1,4 +1,5 @@
 from docplex.cp.model import *
+from src.ra_pst_py import utils
 import json
 import random
 from math import comb
@@ -190,6 +191,19 @@ def cp_solver_decomposed_strengthened_cuts(ra_pst_json, warm_start_json=None, lo
     best_jobs = None
     best_branches = None
 
+    # A warm start gives the initial upper bound and the incumbent until a subproblem improves on it
+    warm_start_ra_psts = None
+    if warm_start_json:
+        warm_start_ra_psts = utils.load_json(warm_start_json)
+        warm_start_objective = max([job["start"] + job["cost"] for ra_pst in warm_start_ra_psts["instances"] for job in ra_pst["jobs"].values() if job["selected"]])
+        if warm_start_objective < upper_bound:
+            upper_bound = warm_start_objective
+            best_branches = [
+                branchId for i, ra_pst in enumerate(ra_psts["instances"]) if not ra_pst["fixed"]
+                for branchId, branch in warm_start_ra_psts["instances"][i]["branches"].items() 
+                if warm_start_ra_psts["instances"][i]["jobs"][branch["jobs"][0]]["selected"]
+            ]
+
     starting_time = time.time()
 
     counter = 0
@@ -267,12 +281,17 @@ def cp_solver_decomposed_strengthened_cuts(ra_pst_json, warm_start_json=None, lo
         #     print(f'E_{resourceId}: {e.X}')
     
     computing_time = time.time() - starting_time
-    for ra_pst in ra_psts["instances"]:
+    for i, ra_pst in enumerate(ra_psts["instances"]):
         if ra_pst["fixed"]: continue
         for jobId, job in ra_pst["jobs"].items():
             job["selected"] = 0
             job["start"] = 0
             if best_jobs is None: 
+                if warm_start_ra_psts is not None:
+                    warm_start_job = warm_start_ra_psts["instances"][i]["jobs"][jobId]
+                    if warm_start_job["selected"]:
+                        job["selected"] = 1
+                        job["start"] = warm_start_job["start"]
                 continue
             for interval in best_jobs:
                 itv = best_schedule.get_var_solution(interval)
@@ -0,0 +1,121 @@
+from src.ra_pst_py.array_heuristic import ProblemTable, ArrayHeuristic, get_problem_tables
+from src.ra_pst_py.core import RA_PST
+
+from enum import StrEnum
+import heapq
+import time
+
+
+class DispatchRuleEnum(StrEnum):
+    SPT = "spt"     # Shortest minimal processing time of the next task first
+    LPT = "lpt"     # Longest minimal processing time of the next task first
+    MWKR = "mwkr"   # Most minimal work remaining in the instance first
+    EDD = "edd"     # Earliest due date of the instance first
+
+
+class DispatchingHeuristic(ArrayHeuristic):
+    """
+    Chooses the next task globally over all queued instances by a dispatching rule
+    instead of by release time. Like Giffler-Thompson, only tasks released before the
+    earliest possible completion of any queued task are eligible. If no task is released before it,
+    the task with the earliest release is eligible.
+    The branch is chosen by earliest finish as in ArrayHeuristic.
+    All queues are heaps, so each step takes O(log n) for n queued instances.
+    Without due dates, the due date of an instance is its release time plus its minimal work.
+    """
+    def __init__(self, rule:DispatchRuleEnum, problem_table:ProblemTable=None, **kwargs):
+        super().__init__(problem_table, **kwargs)
+        self.rule = DispatchRuleEnum(rule)
+        self.due_dates: list[float] = []
+        # Queued instances by earliest possible completion, by release time and eligible ones by priority.
+        # The first two are cleaned lazily, entries are valid while their counter is in queued_counters.
+        self.completion_queue: list[tuple[float, int, int]] = []
+        self.release_queue: list[tuple[float, int]] = []
+        self.eligible_queue: list[tuple[float, float, float, int, int]] = []
+        self.queued_counters: set[int] = set()
+        # Earliest possible completion the eligible queue was built for
+        self.eligible_bound: float = float("inf")
+
+    def add_instances(self, release_times:list[float], problem_table:ProblemTable=None, due_dates:list[float]=None) -> None:
+        table = problem_table or self.table
+        if due_dates is None:
+            due_dates = [release_time + table.remaining_work[0] for release_time in release_times]
+        self.due_dates.extend(due_dates)
+        super().add_instances(release_times, problem_table)
+
+    def push(self, release_time:float, instance_idx:int) -> None:
+        super().push(release_time, instance_idx)
+        counter = self.queue_counter - 1
+        task_idx = self.current_tasks[instance_idx]
+        heapq.heappush(self.completion_queue, (release_time + self.tables[instance_idx].min_costs[task_idx], counter, instance_idx))
+        heapq.heappush(self.release_queue, (release_time, counter))
+        self.queued_counters.add(counter)
+
+    def get_remaining_work(self, instance_idx:int) -> float:
+        table = self.tables[instance_idx]
+        task_idx = self.current_tasks[instance_idx]
+        deleted_work = sum([table.min_costs[deleted_idx] for deleted_idx in self.deleted[instance_idx] if deleted_idx >= task_idx])
+        return table.remaining_work[task_idx] - deleted_work
+
+    def get_priority(self, instance_idx:int) -> float:
+        """ Smaller is dispatched first"""
+        if self.rule == DispatchRuleEnum.SPT:
+            return self.tables[instance_idx].min_costs[self.current_tasks[instance_idx]]
+        elif self.rule == DispatchRuleEnum.LPT:
+            return -self.tables[instance_idx].min_costs[self.current_tasks[instance_idx]]
+        elif self.rule == DispatchRuleEnum.MWKR:
+            return -self.get_remaining_work(instance_idx)
+        elif self.rule == DispatchRuleEnum.EDD:
+            return self.due_dates[instance_idx]
+        raise NotImplementedError(f"Dispatching rule {self.rule} has not been implemented")
+
+    def get_queue_minimum(self, queue:list[tuple]) -> float:
+        """ Returns the smallest valid key of a lazily cleaned queue"""
+        while queue[0][1] not in self.queued_counters:
+            heapq.heappop(queue)
+        return queue[0][0]
+
+    def update_eligible(self) -> None:
+        """ Makes eligible_queue the conflict set for the current earliest possible completion """
+        earliest_completion = self.get_queue_minimum(self.completion_queue)
+        # Move all released tasks that could start before any queued task can finish
+        while self.queue and self.queue[0][0] < earliest_completion:
+            release_time, tie_breaker, counter, instance_idx = heapq.heappop(self.queue)
+            heapq.heappush(self.eligible_queue, (self.get_priority(instance_idx), release_time, tie_breaker, counter, instance_idx))
+        # New instances can lower the bound, tasks that no longer meet it go back
+        if earliest_completion < self.eligible_bound:
+            eligible = []
+            for entry in self.eligible_queue:
+                _, release_time, tie_breaker, counter, instance_idx = entry
+                if release_time < earliest_completion:
+                    eligible.append(entry)
+                else:
+                    heapq.heappush(self.queue, (release_time, tie_breaker, counter, instance_idx))
+            heapq.heapify(eligible)
+            self.eligible_queue = eligible
+        self.eligible_bound = earliest_completion
+        if not self.eligible_queue:
+            release_time, tie_breaker, counter, instance_idx = heapq.heappop(self.queue)
+            heapq.heappush(self.eligible_queue, (self.get_priority(instance_idx), release_time, tie_breaker, counter, instance_idx))
+
+    def simulate(self) -> None:
+        start = time.time()
+        while self.queued_counters:
+            self.update_eligible()
+            # No later task can be released before the earliest queued release time
+            self.timeline.set_horizon(self.get_queue_minimum(self.release_queue))
+            _, _, _, counter, instance_idx = heapq.heappop(self.eligible_queue)
+            self.queued_counters.remove(counter)
+            if self.allocate_next_task(instance_idx):
+                self.push(self.release_times[instance_idx], instance_idx)
+        self.computing_time = time.time() - start
+
+
+def dispatch(rule:DispatchRuleEnum, instances:list[tuple[RA_PST, float]]) -> dict:
+    """ Allocates the instances (RA-PST, release time) with a dispatching rule and returns the schedule"""
+    tables, table_idxs, _ = get_problem_tables([ra_pst for ra_pst, _ in instances])
+    engine = DispatchingHeuristic(rule)
+    for table_idx, (_, release_time) in zip(table_idxs, instances):
+        engine.add_instances([release_time], tables[table_idx])
+    engine.simulate()
+    return engine.get_schedule_dict()
@@ -0,0 +1,135 @@
+from src.ra_pst_py import utils
+from src.ra_pst_py.core import RA_PST
+from src.ra_pst_py.array_heuristic import ProblemTable, ArrayHeuristic
+
+from typing import Iterable, Iterator, Callable
+import heapq
+import json
+import os
+import random
+import time
+
+
+def poisson_arrivals(mean_interarrival:float, count:int=None, until:float=None, start:float=0, seed:int=None, rounded:bool=True) -> Iterator[float]:
+    """
+    Yields the release times of a Poisson process, starting at start, with exponential interarrival times.
+    Rounded like EvalPipeline.generate_release_times. Stops after count arrivals or after until, else never.
+    """
+    rng = random.Random(seed)
+    release_time = start
+    n_arrivals = 0
+    while (count is None or n_arrivals < count) and (until is None or release_time <= until):
+        yield release_time
+        n_arrivals += 1
+        interarrival = rng.expovariate(1 / mean_interarrival)
+        release_time += round(interarrival) if rounded else interarrival
+
+
+def jsonl_arrivals(filepath:os.PathLike | str, key:str="release_time") -> Iterator[float]:
+    """ Yields the release times of a JSONL file, one number or one object with the key per line """
+    with open(filepath, "r") as f:
+        for line in f:
+            if line.strip():
+                arrival = json.loads(line)
+                yield arrival[key] if isinstance(arrival, dict) else arrival
+
+
+def replay_arrivals(source:list[float] | os.PathLike | str) -> Iterator[float]:
+    """ Yields the release times of a list or of metadata.release_times of a schedule or comparison file in order """
+    if not isinstance(source, list):
+        source = utils.load_json(source)["metadata"]["release_times"]
+    yield from sorted(source)
+
+
+class EventSimulation():
+    """
+    Discrete-event simulation of a stream of arrivals of one RA-PST, allocated with the heuristic of ArrayHeuristic.
+    Arrivals are consumed lazily from any iterable of non-decreasing release times.
+    An instance is only created when its arrival is the next event and is retired once all its tasks
+    are allocated: its ilp_rep is passed to on_complete and its state is dropped.
+    Intervals on the timeline that end before the clock are dropped as well,
+    so memory is bounded by the active instances, not by the length of the stream.
+    Gives the same schedule as ArrayHeuristic for the same release times.
+    """
+    def __init__(self, template:RA_PST | ProblemTable, arrivals:Iterable[float], on_complete:Callable[[dict], None]=None, keep_instances:bool=False, **kwargs):
+        self.table = template if isinstance(template, ProblemTable) else ProblemTable(template)
+        # Allocates the tasks and only holds the active instances
+        self.engine = ArrayHeuristic(self.table, retire_instances=True, **kwargs)
+        self.arrivals = iter(arrivals)
+        self.on_complete = on_complete
+        # Completed ilp_reps, only kept with keep_instances
+        self.completed_instances: list[dict] | None = [] if keep_instances else None
+        self.n_active_instances = 0
+        self.next_arrival: float = None
+        self.n_arrivals = 0
+        self.n_completed = 0
+        self.max_active_instances = 0
+        self.total_interval_length = 0
+        self.clock: float = None
+        self.computing_time: float = None
+        self.pull_arrival()
+
+    @property
+    def objective(self) -> float:
+        return self.engine.objective
+
+    def pull_arrival(self) -> None:
+        previous = self.next_arrival
+        self.next_arrival = next(self.arrivals, None)
+        if self.next_arrival is not None and previous is not None and self.next_arrival < previous:
+            raise ValueError(f"Arrivals must not decrease, got {self.next_arrival} after {previous}")
+
+    def create_instance(self) -> None:
+        self.engine.activate_instance(self.next_arrival)
+        self.n_arrivals += 1
+        self.n_active_instances += 1
+        self.max_active_instances = max(self.max_active_instances, self.n_active_instances)
+        self.pull_arrival()
+
+    def retire_instance(self, instance_id:int) -> None:
+        ilp_rep = self.engine.retire_instance(instance_id)
+        self.total_interval_length += sum(job["cost"] for job in ilp_rep["jobs"].values() if job["selected"])
+        self.n_active_instances -= 1
+        self.n_completed += 1
+        if self.on_complete is not None:
+            self.on_complete(ilp_rep)
+        if self.completed_instances is not None:
+            self.completed_instances.append(ilp_rep)
+
+    def simulate(self, until:float=None) -> None:
+        """ Processes the events in order of (release time, instance id), all of them or those up to until """
+        start = time.time()
+        queue = self.engine.queue
+        while queue or self.next_arrival is not None:
+            # Arrivals are queued once the next task is not released earlier, the queue orders ties
+            if self.next_arrival is not None and (not queue or self.next_arrival <= queue[0][0]):
+                if until is not None and self.next_arrival > until:
+                    break
+                self.create_instance()
+                continue
+            release_time, _, _, instance_id = queue[0]
+            if until is not None and release_time > until:
+                break
+            heapq.heappop(queue)
+            self.clock = release_time
+            self.engine.timeline.set_horizon(release_time)
+            if self.engine.allocate_next_task(instance_id):
+                self.engine.push(self.engine.release_times[instance_id], instance_id)
+            else:
+                self.retire_instance(instance_id)
+        self.computing_time = (self.computing_time or 0) + time.time() - start
+
+    def get_schedule_dict(self) -> dict:
+        """ Returns the schedule of the completed instances, only with keep_instances """
+        if self.completed_instances is None:
+            raise ValueError("Completed instances are only kept with keep_instances")
+        return {
+            "instances": sorted(self.completed_instances, key=lambda ilp_rep: ilp_rep["instanceId"]),
+            "resources": list(self.table.ilp_rep["resources"]),
+            "objective": self.objective,
+            "solution": {
+                "objective": self.objective,
+                "computing time": self.computing_time,
+                "total interval length": self.total_interval_length
+            }
+        }
@@ -5,6 +5,8 @@ import uuid
 import os
 from graphviz import Source
 
+from src.ra_pst_py.workspace import Workspace
+
 
 class TreeGraph:
     def __init__(self):
@@ -230,11 +232,13 @@ class TreeGraph:
         self,
         root:etree._Element,
         format="png",
-        output_file="graphs/output_graph",
+        output_file=None,
         view=True,
         res_option="children",
+        workspace:Workspace=None,
     ):
-        out_path, out_file = os.path.split(output_file)
+        workspace = workspace or Workspace()
+        out_path, out_file = os.path.split(output_file or workspace.path("graphs", "output_graph"))
 
         self.tree_iter(root, res_option=res_option)
         self.dot_content += "}\n"
@@ -243,7 +247,7 @@ class TreeGraph:
         if not os.path.exists(out_path):
             os.makedirs(out_path)
 
-        with open("graphs/call_tree.dot", "w") as dot_file:
+        with open(workspace.path("graphs", "call_tree.dot"), "w") as dot_file:
             dot_file.write(self.dot_content)
         source = Source(self.dot_content, filename=f"{out_file}.dot", format=format)
         source.render(
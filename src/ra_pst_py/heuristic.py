@@ -1,9 +1,12 @@
 from src.ra_pst_py import utils
 from src.ra_pst_py.core import Branch, RA_PST
 from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
+from src.ra_pst_py.schedule import Timeline
 from lxml import etree
 import numpy as np
 from collections import defaultdict
+from concurrent.futures import Executor
+from itertools import repeat
 import warnings
 import os
 import json
@@ -34,8 +37,12 @@ class TaskNode():
         self.cp_type:CPType_Enum = None
         self.cp_direction: CPDirction_Enum = None
         self.backwards_delete:bool = False
+        self.id:str = task.attrib.get("id")
+        self.signature: tuple = None
+        self.resources: list[str] = None
         if initialize:
             self.initialize_resource_attributes()
+            self.set_change_patterns()
 
     def initialize_resource_attributes(self):
         self.duration:float = self.get_duration()
@@ -65,107 +72,128 @@ class TaskNode():
         if self.release_time is None:
             raise ValueError("No release time set")
     
+    def set_time_element(self, tag:str, value:float):
+        """
+        Writes a time value as child element of the task.
+        An existing element is overwritten, so repeated write backs do not pile up elements.
+        """
+        elements = self.task.xpath(f"cpee1:{tag}", namespaces=self.ns)
+        element = elements[0] if elements else etree.SubElement(self.task, f"{{{self.ns['cpee1']}}}{tag}")
+        element.text = str(value)
+
     def add_all_times_to_branch(self):
         if self.cp_type != CPType_Enum.DELETE:
-            release_time = etree.SubElement(self.task, f"{{{self.ns['cpee1']}}}release_time")
-            release_time.text = str(self.release_time)
-            start_element = etree.SubElement(self.task, f"{{{self.ns['cpee1']}}}expected_start")
-            start_element.text = str(self.earliest_start)
-            end_element = etree.SubElement(self.task, f"{{{self.ns['cpee1']}}}expected_end")
-            end_element.text = str(self.earliest_start+self.duration)
+            self.set_time_element("release_time", self.release_time)
+            self.set_time_element("expected_start", self.earliest_start)
+            self.set_time_element("expected_end", self.earliest_start+self.duration)
         else:
             if self.deletion_savings < 0:
-                delete_element = etree.SubElement(self.task, f"{{{self.ns['cpee1']}}}expected_delete")
-                delete_element.text = str(self.deletion_savings)
+                self.set_time_element("expected_delete", self.deletion_savings)
         for child in self.change_patterns:
             child.add_all_times_to_branch()
+
+    def get_task_nodes(self) -> list['TaskNode']:
+        """ Returns the node and all change pattern nodes below it in document order"""
+        task_nodes = [self]
+        for child in self.change_patterns:
+            task_nodes.extend(child.get_task_nodes())
+        return task_nodes
     
+    def get_resources(self) -> list[str]:
+        if self.resources is None:
+            self.resources = sorted({node.resource for node in self.get_task_nodes() if node.cp_type != CPType_Enum.DELETE})
+        return self.resources
+
+    def get_signature(self, ra_pst:RA_PST) -> tuple:
+        """
+        Returns everything the evaluation of the tree depends on apart from release time and timeline:
+        the structure, resources and durations of the nodes and the tasks a delete can affect.
+        Trees of copied RA-PSTs have the same signature.
+        """
+        if self.signature is None:
+            task_positions = ra_pst.get_task_positions()
+            min_branch_costs = ra_pst.get_min_branch_costs()
+            signature = []
+            for node in self.get_task_nodes():
+                if node.cp_type == CPType_Enum.DELETE:
+                    affected_task_ids = ra_pst.get_task_ids_by_label().get(node.label, [])
+                    signature.append((node.cp_type, node.cp_direction, len(node.change_patterns), tuple(
+                        (task_positions[task_id] > task_positions[self.id], min_branch_costs.get(task_id)) for task_id in affected_task_ids)))
+                else:
+                    signature.append((node.cp_type, node.cp_direction, len(node.change_patterns), node.resource, node.duration))
+            self.signature = tuple(signature)
+        return self.signature
+
+    def get_times(self) -> list[tuple]:
+        """ Returns the times of the last evaluation for all nodes in document order"""
+        return [(node.release_time, node.earliest_start, node.duration, node.deletion_savings) for node in self.get_task_nodes()]
+
+    def set_times(self, times:list[tuple]):
+        """ Sets the times from get_times on a tree with the same signature"""
+        for node, (release_time, earliest_start, duration, deletion_savings) in zip(self.get_task_nodes(), times):
+            node.release_time = release_time
+            node.earliest_start = earliest_start
+            node.duration = duration
+            node.deletion_savings = deletion_savings
+
     def get_interval(self, ra_pst:RA_PST) -> tuple:
-        starts = self.task.xpath("//cpee1:expected_start/text()", namespaces=self.ns)
-        starts = sorted([float(start) for start in starts])
-        ends = self.task.xpath("//cpee1:expected_end/text()", namespaces=self.ns)
-        ends = sorted([float(end) for end in ends])
-        
-        # Find all <cpee1:expected_delete> nodes
-        # find self.task in ra_pst: 
-        task = [task for task in ra_pst.get_tasklist() if task.attrib["id"] == self.task.attrib["id"]][0]
-        nodes_to_delete = self.task.xpath("//cpee1:expected_delete/parent::*", namespaces=self.ns)
-        nodes_to_delete_ra_pst = []
-        for node in nodes_to_delete:
-            nodes_to_delete_ra_pst.extend([delete_task for delete_task in ra_pst.get_tasklist() if utils.get_label(delete_task) == utils.get_label(node)])
+        """
+        Returns (start, span, deletion savings, end) of the last evaluation.
+        The times are read from the evaluated nodes, nothing has to be written to the branch.
+        """
+        task_nodes = self.get_task_nodes()
+        starts = sorted([node.earliest_start for node in task_nodes if node.cp_type != CPType_Enum.DELETE])
+        ends = sorted([node.earliest_start + node.duration for node in task_nodes if node.cp_type != CPType_Enum.DELETE])
+
+        # Deletes are only allowed for tasks after the anchor task in the RA-PST
+        self.backwards_delete = False
+        task_positions = ra_pst.get_task_positions()
+        task_ids_by_label = ra_pst.get_task_ids_by_label()
+        task_position = task_positions[self.id]
+        nodes_to_delete = [node for node in task_nodes if node.cp_type == CPType_Enum.DELETE and node.deletion_savings < 0]
         
         filtered_deletes = []
-        for delete_task in nodes_to_delete_ra_pst:
-            if ra_pst.get_tasklist().index(delete_task) > ra_pst.get_tasklist().index(task):
-                filtered_deletes.append(utils.get_label(delete_task))
-            else:
-                warnings.warn("Previous tasks can not be deleted from the process")
-                self.backwards_delete = True
+        for node in nodes_to_delete:
+            for task_id in task_ids_by_label.get(node.label, []):
+                if task_positions[task_id] > task_position:
+                    filtered_deletes.append(node.label)
+                else:
+                    warnings.warn("Previous tasks can not be deleted from the process")
+                    self.backwards_delete = True
 
-        nodes_to_delete = sorted([float(delete_task.xpath("cpee1:expected_delete/text()", namespaces=self.ns)[0]) for delete_task in nodes_to_delete if utils.get_label(delete_task) in filtered_deletes])
-        return (starts[0], ends[-1] - starts[0], sum(nodes_to_delete),  ends[-1])
+        deletion_savings = sorted([node.deletion_savings for node in nodes_to_delete if node.label in filtered_deletes])
+        return (starts[0], ends[-1] - starts[0], sum(deletion_savings),  ends[-1])
         
-    def set_earliest_start(self, schedule_dict:dict) -> None:
+    def set_earliest_start(self, timeline:Timeline) -> None:
         """
         Finds best availabe timeslot for one task of an RA-PST.
         """
-        earliest_start = np.inf
-        earliest_finish = np.inf
-        timeslot_matrix = self.get_timeslot_matrix(schedule_dict)
-        possible_slots = np.argwhere(np.diff(timeslot_matrix) >= self.duration)
-        if possible_slots.size > 0:
-            for slot in possible_slots:
-                earliest_slot = float(timeslot_matrix[slot[0]][0])
-                if earliest_slot+self.duration < earliest_finish and earliest_slot >= float(self.release_time):
-                    earliest_start = earliest_slot
-                    earliest_finish = earliest_slot+self.duration
-                elif timeslot_matrix[slot[0]][1] == np.inf and earliest_start == np.inf:
-                    earliest_start = self.release_time
-                    earliest_finish = earliest_slot+self.duration
-        else:
-            raise ValueError("No timeslot found")
-        #print(f" Best start: {earliest_start}, on resource {allocated_resource}")
-        self.earliest_start = earliest_start
-    
-    def get_timeslot_matrix(self, schedule_dict:dict):
-        if not schedule_dict:
-            return np.array([[self.release_time, np.inf]])
-        matrix = []
-        jobs_on_resource = []
-        # Match selected Jobs and resources
-        for instance in schedule_dict["instances"]:
-            jobs_on_resource.extend([job for jobId, job in instance["jobs"].items() if job["selected"] and job["resource"] == self.resource])
-        for block in jobs_on_resource:
-            if float(block["start"]) + float(block["cost"]) >= self.release_time:
-                matrix.append([block["start"], block["start"] + block["cost"]])
-        matrix.sort()
-        matrix.append([np.inf, 0])
-        if matrix:
-            return np.roll(np.array(matrix), 1) 
-        else:
-            return np.array([[self.release_time, np.inf]])
+        self.earliest_start = timeline.get_earliest_start(self.resource, self.release_time, self.duration)
         
-    def calculate_finish_time(self, schedule_dict:dict, ra_pst:RA_PST, backwards_delete:bool=False):
-
-        self.set_change_patterns()
+    def calculate_finish_time(self, timeline:Timeline, ra_pst:RA_PST):
+        """
+        Calculates the times of the node and its change patterns against the timeline.
+        Works on the numeric attributes of the nodes only, the branch is not changed.
+        Use add_all_times_to_branch to write the times back.
+        """
         if self.change_patterns:
-            for child_task_node in self.change_patterns:
+            for child_task_node_idx, child_task_node in enumerate(self.change_patterns):
                 if child_task_node.cp_type == CPType_Enum.INSERT:
                     if child_task_node.cp_direction == CPDirction_Enum.BEFORE:
                         # Insert Before
                         child_task_node.set_release_time(self.release_time)
-                        child_task_node.calculate_finish_time(schedule_dict, ra_pst)
+                        child_task_node.calculate_finish_time(timeline, ra_pst)
                         child_fin = [child_node.earliest_start + child_node.duration for child_node in child_task_node.change_patterns]
                         child_task_node_finish = child_fin.append(child_task_node.earliest_start + child_task_node.duration)
                         child_task_node_finish = max(child_fin)
                         self.set_release_time(child_task_node_finish)
-                        self.set_earliest_start(schedule_dict)
+                        self.set_earliest_start(timeline)
 
                     elif child_task_node.cp_direction == CPDirction_Enum.AFTER:
                         # Insert After
-                        self.set_earliest_start(schedule_dict)
+                        self.set_earliest_start(timeline)
                         child_task_node.set_release_time(self.earliest_start + self.duration)
-                        child_task_node.calculate_finish_time(schedule_dict, ra_pst)
+                        child_task_node.calculate_finish_time(timeline, ra_pst)
                     elif child_task_node.cp_direction == CPDirction_Enum.PARALLEL:
                         # Insert Parallel
                         pass
@@ -174,16 +202,14 @@ class TaskNode():
                     # DELETE Task
                     # TODO calc_minimum deletion savings
                     warnings.warn("The direction of the delete is any, for taskwise allocation, previous tasks can not be deleted from the process")
-                    self.set_earliest_start(schedule_dict)
-                    affected_tasks= [ra_pst_task for ra_pst_task in ra_pst.get_tasklist() if child_task_node.task.attrib["label"] == utils.get_label(ra_pst_task)]
-                    if len(affected_tasks) > 1:
+                    self.set_earliest_start(timeline)
+                    affected_task_ids = ra_pst.get_task_ids_by_label().get(child_task_node.label, [])
+                    if len(affected_task_ids) > 1:
                         warnings.warn("More than one task available to be deleted. Your process has multiple tasks with the same name")
-                    min_deletion_savings = []
-                    for affected_task in affected_tasks:
-                        branches = ra_pst.branches[affected_task.attrib["id"]]
-                        min_deletion_savings.append(sorted([branch.get_branch_costs() for branch in branches])[0])
+                    min_branch_costs = ra_pst.get_min_branch_costs()
+                    min_deletion_savings = [min_branch_costs[task_id] for task_id in affected_task_ids]
                     if min_deletion_savings:
-                        child_task_node.deletion_savings = -float(sorted(min_deletion_savings)[0])
+                        child_task_node.deletion_savings = -float(min(min_deletion_savings))
                     child_task_node.duration = 0.0
                     child_task_node.earliest_start = 0.0
 
@@ -195,7 +221,6 @@ class TaskNode():
                     raise NotImplementedError(f"CP_TYPE {child_task_node.cp_type} not implemented")
             
                 # Handover release time to next child:
-                child_task_node_idx = self.change_patterns.index(child_task_node)
                 if child_task_node_idx < len(self.change_patterns) -1:
                     next_child = self.change_patterns[child_task_node_idx + 1]
                     next_child.set_release_time(child_task_node.earliest_start + child_task_node.duration)
@@ -203,7 +228,7 @@ class TaskNode():
         else:
             # Find earliest timeslot in schedule and set it
             self.check_release_time()
-            self.set_earliest_start(schedule_dict)
+            self.set_earliest_start(timeline)
 
         return self
 
@@ -214,6 +239,9 @@ class CpTaskNode(TaskNode):
         self.cp_direction: CPDirction_Enum = self.get_cp_direction()
         if self.cp_type != CPType_Enum.DELETE:
             self.initialize_resource_attributes()
+        else:
+            self.label:str = utils.get_label(self.task)
+        self.set_change_patterns()
     
     def get_cp_type(self):
         return CPType_Enum(self.task.attrib["type"])
@@ -225,42 +253,163 @@ class CpTaskNode(TaskNode):
             return CPDirction_Enum(self.task.attrib["direction"])
 
 
+def evaluate_branch(task_node:TaskNode, release_time:float, timeline:Timeline, ra_pst:RA_PST) -> tuple:
+    """
+    Evaluates one candidate branch against a read-only timeline and returns its interval.
+    Only the TaskNode tree of the branch is changed, so branches can be evaluated concurrently.
+    """
+    task_node.set_release_time(release_time)
+    task_node.calculate_finish_time(timeline, ra_pst)
+    return task_node.get_interval(ra_pst)
+
+
+class EvaluationCache():
+    """
+    Memoizes evaluate_branch by the signature of the tree, the release time and
+    the versions of the resources the tree uses. A branch is only evaluated again
+    if one of its resources got a new job since the last evaluation.
+    The results are shared by all trees with the same signature, e.g. of instances of the same RA-PST.
+    The cache is cleared once it holds max_size results.
+    """
+    def __init__(self, max_size:int=100000):
+        self.results: dict[tuple, tuple] = {}
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+    def get_key(self, task_node:TaskNode, release_time:float, timeline:Timeline, ra_pst:RA_PST) -> tuple:
+        resource_versions = tuple(timeline.get_resource_version(resource) for resource in task_node.get_resources())
+        return (task_node.get_signature(ra_pst), float(release_time), resource_versions)
+
+    def lookup(self, key:tuple, task_node:TaskNode) -> tuple | None:
+        """ Returns the cached interval and sets the cached times on the tree, None if there is no result"""
+        result = self.results.get(key)
+        if result is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        interval, backwards_delete, times = result
+        task_node.set_times(times)
+        task_node.backwards_delete = backwards_delete
+        return interval
+
+    def store(self, key:tuple, task_node:TaskNode, interval:tuple):
+        if len(self.results) >= self.max_size:
+            self.results.clear()
+        self.results[key] = (interval, task_node.backwards_delete, task_node.get_times())
+
+    def evaluate(self, task_node:TaskNode, release_time:float, timeline:Timeline, ra_pst:RA_PST) -> tuple:
+        """ evaluate_branch with memoization"""
+        key = self.get_key(task_node, release_time, timeline, ra_pst)
+        interval = self.lookup(key, task_node)
+        if interval is None:
+            interval = evaluate_branch(task_node, release_time, timeline, ra_pst)
+            self.store(key, task_node, interval)
+        return interval
+
+
 class TaskAllocator():
 
-    def __init__(self, ra_pst:RA_PST,  change_operation):
+    def __init__(self, ra_pst:RA_PST,  change_operation, executor:Executor=None):
         self.ra_pst = ra_pst
         self.ns = ra_pst.ns
         self.change_operation = change_operation
+        self.task_nodes: dict[Branch, TaskNode] = {}
+        # Optional pool to evaluate the candidate branches of a task concurrently.
+        # TaskNode trees hold lxml elements, so this has to be a thread pool.
+        self.executor: Executor = executor
+        # Optional cache of branch evaluations, can be shared by the allocators of several instances
+        self.evaluation_cache: EvaluationCache = None
+
+    def __getstate__(self):
+        # Copies do not share the executor and cache and rebuild their TaskNode trees from their own branches
+        state = self.__dict__.copy()
+        state["executor"] = None
+        state["evaluation_cache"] = None
+        state["task_nodes"] = {}
+        return state
+
+    def get_task_node(self, branch:Branch) -> TaskNode:
+        """
+        Returns the TaskNode tree of a branch.
+        The tree is built once from the branch XML and rebuilt only if the branch node was replaced.
+        """
+        task_node = self.task_nodes.get(branch)
+        if task_node is None or task_node.task is not branch.node:
+            task_node = TaskNode(branch.node)
+            self.task_nodes[branch] = task_node
+        return task_node
 
-    def allocate_task(self, task:etree._Element, schedule_filepath:os.PathLike | str) -> tuple[Branch, tuple]:
+    def allocate_task(self, task:etree._Element, schedule_filepath:os.PathLike | str=None, branch:Branch=None, schedule_dict:dict=None, evaluation:tuple=None, timeline:Timeline=None) -> tuple[Branch, tuple]:
         """
         Allocates a task to a resource and propagate through ra_pst
+        If a branch is given, only this branch is evaluated and allocated.
+        The schedule is read from schedule_filepath unless schedule_dict or the timeline of the schedule is given.
+        An evaluation of evaluate_task that is still valid for the schedule is used instead of evaluating again.
         """
-        if os.path.getsize(schedule_filepath) > 0:
-            with open(schedule_filepath, "r") as f:
-                schedule_dict = json.load(f)
-        else:
-            schedule_dict = {}
-        branches = self.ra_pst.branches[task.attrib['id']]
+        if evaluation is None:
+            if timeline is None:
+                if schedule_dict is None:
+                    schedule_dict = {}
+                    if os.path.getsize(schedule_filepath) > 0:
+                        with open(schedule_filepath, "r") as f:
+                            schedule_dict = json.load(f)
+                timeline = Timeline.from_schedule_dict(schedule_dict)
+            evaluation = self.evaluate_task(task, timeline, branch)
+        branches, task_nodes, intervals = evaluation
+        
         finish_times = []
-        for branch in branches:
-            #TODO create etree._Element release_time for each task in branch and set time to release_time
-            if branch.check_validity():
-                task_node = TaskNode(branch.node)
-                branch_release = task.xpath("cpee1:release_time", namespaces=self.ns)[0].text
-                task_node.set_release_time(float(branch_release))
-                task_node.calculate_finish_time(schedule_dict, self.ra_pst)
-                task_node.add_all_times_to_branch()
-                branch.node = task_node.task    # Update branch node
-                interval = task_node.get_interval(self.ra_pst)
-                if not task_node.backwards_delete:
-                    finish_times.append((branch, interval))
+        for position, (branch, interval, task_node) in enumerate(zip(branches, intervals, task_nodes)):
+            if not task_node.backwards_delete:
+                finish_times.append((branch, interval, task_node, position))
 
         if not finish_times:
             raise ValueError("No valid branch for this task")
-        finish_times.sort(key=lambda x: sum(x[1][0:3]))
-        #print(finish_times)
-        return finish_times[0]
+        # Ties go to the branch that comes first in the RA-PST, independent of evaluation order
+        finish_times.sort(key=lambda x: (sum(x[1][0:3]), x[3]))
+        
+        # Only the selected branch gets its times written back
+        best_branch, interval, task_node, _ = finish_times[0]
+        task_node.add_all_times_to_branch()
+        best_branch.node = task_node.task    # Update branch node
+        return best_branch, interval
+
+    def evaluate_task(self, task:etree._Element, timeline:Timeline, branch:Branch=None, concurrent:bool=True) -> tuple[list[Branch], list[TaskNode], list[tuple]]:
+        """ 
+        Evaluates the valid branches of the task, or only the given branch, against the timeline.
+        Returns the branches, their TaskNode trees and their intervals.
+        """
+        if branch is not None:
+            branches = [branch] if branch.check_validity() else []
+        else:
+            branches = [branch for branch in self.ra_pst.branches[task.attrib['id']] if branch.check_validity()]
+        task_nodes = [self.get_task_node(branch) for branch in branches]
+        branch_release = float(task.xpath("cpee1:release_time", namespaces=self.ns)[0].text)
+        return branches, task_nodes, self.evaluate_branches(task_nodes, branch_release, timeline, concurrent)
+
+    def evaluate_branches(self, task_nodes:list[TaskNode], release_time:float, timeline:Timeline, concurrent:bool=True) -> list[tuple]:
+        """
+        Returns the intervals of the TaskNode trees. Cached results are reused,
+        the remaining trees are evaluated on the executor if there is one and concurrent is set.
+        """
+        intervals = [None] * len(task_nodes)
+        keys = [None] * len(task_nodes)
+        if self.evaluation_cache is not None:
+            for i, task_node in enumerate(task_nodes):
+                keys[i] = self.evaluation_cache.get_key(task_node, release_time, timeline, self.ra_pst)
+                intervals[i] = self.evaluation_cache.lookup(keys[i], task_node)
+        pending = [i for i, interval in enumerate(intervals) if interval is None]
+
+        evaluation_args = ([task_nodes[i] for i in pending], repeat(release_time), repeat(timeline), repeat(self.ra_pst))
+        if self.executor is not None and concurrent and len(pending) > 1:
+            results = self.executor.map(evaluate_branch, *evaluation_args)
+        else:
+            results = map(evaluate_branch, *evaluation_args)
+        for i, interval in zip(pending, results):
+            intervals[i] = interval
+            if self.evaluation_cache is not None:
+                self.evaluation_cache.store(keys[i], task_nodes[i], interval)
+        return intervals
     
     def set_release_times(self, branch, task):
         # TODO get all tasks in branch and set release_time to task.release_time
@@ -522,11 +671,11 @@ if __name__ == "__main__":
     task_node.set_release_time(0)
     with open("tests/test_data/test_sched.json", "r") as f:
         schedule_dict = json.load(f)
-    task_node.calculate_finish_time(schedule_dict, ra_pst)
+    task_node.calculate_finish_time(Timeline.from_schedule_dict(schedule_dict), ra_pst)
     print("task_node")
     task_node.add_all_times_to_branch()
     tree = etree.ElementTree(task_node.task)
     etree.indent(tree, space="\t", level=0)
     tree.write("test.xml")
-    print(task_node.get_interval())
+    print(task_node.get_interval(ra_pst))
     
\ No newline at end of file
@@ -1,7 +1,8 @@
 from src.ra_pst_py.change_operations import ChangeOperation
 from src.ra_pst_py.heuristic import TaskAllocator
-from src.ra_pst_py.schedule import Schedule
+from src.ra_pst_py.schedule import Schedule, Timeline
 from src.ra_pst_py.core import RA_PST, Branch
+from src.ra_pst_py.workspace import Workspace
 
 from . import utils 
 
@@ -15,7 +16,7 @@ import json
 CURRENT_MIN_DATE = "2024-01-01T00:00" # Placeholder for scheduling heuristics
 
 class Instance():
-    def __init__(self, ra_pst, branches_to_apply:dict, schedule:Schedule=None, id=None, release_time:int = None):
+    def __init__(self, ra_pst, branches_to_apply:dict, schedule:Schedule=None, id=None, release_time:int = None, workspace:Workspace=None):
         self.id = id
         self.ra_pst:RA_PST = ra_pst
         self.ns = ra_pst.ns
@@ -30,7 +31,14 @@ class Instance():
         self.allocator = TaskAllocator(self.ra_pst, self.change_op)
         self.allocated_tasks = set()
         self.times = []
+        # Valid branches of all tasks in order and their positions, which number the branches of the ilp_rep
+        self.valid_branches: list[Branch] = None
+        self.branch_running_ids: dict[Branch, int] = None
+        # Expected (start, end) of the tasks of the last allocated branch by task element
+        self.expected_times: dict[etree._Element, tuple[float, float]] = {}
         self.release_time:int = release_time
+        # Directory for the dumps of apply_to_process, the Simulator sets its own
+        self.workspace:Workspace = workspace or Workspace()
         self.add_release_time(release_time=release_time)
 
     def add_release_time(self, release_time:float):
@@ -42,45 +50,50 @@ class Instance():
         
     def get_ilp_rep(self) -> dict:
         """Returns the RA-PST of the instance as dict for an ILP or CP"""
+        self.set_valid_branches()
         return self.ra_pst.get_ilp_rep(instance_id=self.id)
 
+    def set_valid_branches(self) -> None:
+        self.valid_branches = self.get_all_valid_branches_list()
+        self.branch_running_ids = {branch: running_id for running_id, branch in enumerate(self.valid_branches)}
+
+    def get_branch_running_id(self, branch:Branch) -> int:
+        """ Returns the position of the branch among the valid branches of all tasks, as in the branch ids of the ilp_rep """
+        if self.branch_running_ids is None:
+            self.set_valid_branches()
+        return self.branch_running_ids[branch]
+
     def get_all_valid_branches_list(self) -> list:
         branches = []
         for key, values in self.ra_pst.branches.items():
             branches.extend([branch for branch in values if branch.check_validity()])
         return branches
 
-    def allocate_next_task(self, schedule_filepath:os.PathLike) -> Branch:
-        """ Allocate next task in ra_pst based on earliest finish time heuristic"""
+    def allocate_next_task(self, schedule_filepath:os.PathLike=None, branch:Branch=None, schedule_dict:dict=None, evaluation:tuple=None, timeline:Timeline=None) -> Branch:
+        """ 
+        Allocate next task in ra_pst based on earliest finish time heuristic
+        If a branch is given, the task is allocated with this branch instead.
+        The schedule is read from schedule_filepath or given directly as schedule_dict or as its Timeline.
+        A valid evaluation of the task from TaskAllocator.evaluate_task can be passed to skip the evaluation.
+        """
 
-        best_branch, times = self.allocator.allocate_task(self.current_task, schedule_filepath=schedule_filepath)
+        best_branch, times = self.allocator.allocate_task(self.current_task, schedule_filepath=schedule_filepath, branch=branch, schedule_dict=schedule_dict, evaluation=evaluation, timeline=timeline)
         times = times[0:2]
         task_id = self.current_task.attrib["id"]
         branch_no = self.ra_pst.branches[task_id].index(best_branch)
         self.ra_pst.branches[task_id][branch_no] = best_branch
         self.times.append(times)
-        # transform best branch to job representation
 
-        alloc_times = []
-        for task in best_branch.get_tasklist():
-            cp_type = task.attrib["type"] if "type" in list(task.attrib.keys()) else None
-            if cp_type == "delete":
-                continue
-            if task.xpath("cpee1:children/descendant::cpee1:changepattern", namespaces=self.ns):
-                if task.xpath("cpee1:children/descendant::cpee1:changepattern", namespaces=self.ns)[0].attrib["type"] == "replace":
-                    continue
-                
-            resource = task.xpath("cpee1:children/cpee1:resource", namespaces=self.ns)[0].attrib["id"]
-            start_time = task.xpath("cpee1:expected_start", namespaces=self.ns)[0].text
-            end_time = task.xpath("cpee1:expected_end", namespaces=self.ns)[0].text
-            duration = float(end_time) - float(start_time)
-            
-            #self.allocator.add_task((self, task, start_time), resource, duration, branch_no, schedule_filepath)
-
-            alloc_times.append((start_time, duration))
         # Apply best branch to processmodel
         self.branches_to_apply[self.current_task.attrib["id"]] = best_branch
         self.apply_single_branch(self.current_task, best_branch)       
+        # Index the times for the job representation, applying the branch replaced its node by a copy
+        start_tag, end_tag = f"{{{self.ns['cpee1']}}}expected_start", f"{{{self.ns['cpee1']}}}expected_end"
+        self.expected_times = {}
+        for task in best_branch.get_tasklist():
+            start_element = task.find(start_tag)
+            if start_element is not None:
+                self.expected_times[task] = (float(start_element.text), float(task.find(end_tag).text))
 
         # Set new release time for following task
         self.current_task = utils.get_next_task(self.tasks_iter, self)
@@ -104,7 +117,7 @@ class Instance():
             #self.delayed_deletes.append((branch, task, current_time))
             delete = False
         self.ra_pst.process = branch.apply_to_process(
-            self.change_op.ra_pst, solution=self, earliest_possible_start=current_time, change_op=self.change_op, delete=delete)  # build branch
+            self.change_op.ra_pst, solution=self, earliest_possible_start=current_time, change_op=self.change_op, delete=delete, workspace=self.workspace)  # build branch
         self.change_op.ra_pst = self.ra_pst.process
         branch_no = self.ra_pst.branches[task_id].index(branch)
         self.applied_branches[task_id] = branch_no
@@ -165,7 +178,7 @@ class Instance():
                     delete = True
                 #TODO add branch invalidities on branch building!
                 self.ra_pst.process = branch.apply_to_process(
-                    self.change_op.ra_pst, solution=self, earliest_possible_start=current_time, change_op=self.change_op, delete=delete)  # build branch
+                    self.change_op.ra_pst, solution=self, earliest_possible_start=current_time, change_op=self.change_op, delete=delete, workspace=self.workspace)  # build branch
                 self.change_op.ra_pst = self.ra_pst.process
                 self.applied_branches[task_id] = branch_no
 
@@ -176,7 +189,7 @@ class Instance():
                     # TODO fix deleted task time propagation
                     if self.ra_pst.process.xpath(f"//*[@id='{task.attrib['id']}'][not(ancestor::cpee1:children) and not(ancestor::cpee1:allocation) and not(ancestor::RA_RPST)]", namespaces=self.ns):
                         self.ra_pst.process = branch.apply_to_process(
-                            self.change_op.ra_pst, solution=self, earliest_possible_start=current_time, change_op=self.change_op)  # apply delays
+                            self.change_op.ra_pst, solution=self, earliest_possible_start=current_time, change_op=self.change_op, workspace=self.workspace)  # apply delays
                         self.change_op.ra_pst = self.ra_pst.process
 
                 self.is_final = True
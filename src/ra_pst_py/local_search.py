@@ -0,0 +1,253 @@
+from src.ra_pst_py import utils
+from src.ra_pst_py import multi_start
+from src.ra_pst_py.core import RA_PST
+from src.ra_pst_py.array_heuristic import ProblemTable, ArrayHeuristic, get_problem_tables
+from src.ra_pst_py.schedule import ArrayTimeline
+
+from concurrent.futures import ProcessPoolExecutor
+import bisect
+import heapq
+import math
+import os
+import random
+import time
+
+
+class Solution():
+    """
+    Solution of the local search. The k-th occurrence of an instance index in sequence allocates the
+    k-th remaining task of the instance, tasks holds the index of that task for each step.
+    branches holds the branch position of each allocated (instance index, task index).
+    checkpoints are copies of the engine state before some steps, sorted by step.
+    """
+    def __init__(self, sequence:list[int], tasks:list[int], branches:dict[tuple[int, int], int], objective:float, checkpoints:list[tuple[int, tuple]]):
+        self.sequence = sequence
+        self.tasks = tasks
+        self.branches = branches
+        self.objective = objective
+        self.checkpoints = checkpoints
+
+
+class SequenceDecoder():
+    """
+    Decodes sequences and branch positions with the ArrayHeuristic.
+    Occurrences of finished instances are skipped and tasks left after the sequence are allocated in order of release time,
+    so every neighbour decodes to a feasible schedule. A neighbour is decoded from the last checkpoint
+    of the current solution before its first changed step instead of from the start.
+    """
+    def __init__(self, tables:list[ProblemTable], instances:list[tuple[int, float]], checkpoint_interval:int=None):
+        self.tables = tables
+        self.instances = instances
+        # About sqrt(steps) checkpoints of about sqrt(steps) steps each
+        n_steps = sum(len(tables[table_idx].task_ids) for table_idx, _ in instances)
+        self.checkpoint_interval = checkpoint_interval or max(1, math.isqrt(n_steps))
+        self.branch_positions: list[dict[str, int]] = [
+            {branch.branch_id: position for task_branches in table.branches for position, branch in enumerate(task_branches)}
+            for table in tables
+        ]
+        self.initial_state = self.get_state(self.get_engine())
+
+    def get_engine(self) -> ArrayHeuristic:
+        engine = ArrayHeuristic()
+        for table_idx, release_time in self.instances:
+            engine.add_instances([release_time], self.tables[table_idx])
+        engine.queue = []
+        return engine
+
+    def get_state(self, engine:ArrayHeuristic) -> tuple:
+        # Timeline arrays are replaced on add_job and never changed in place, copying the dicts is enough
+        return (
+            dict(engine.timeline.starts), dict(engine.timeline.ends), engine.release_times.copy(), engine.current_tasks.copy(),
+            [set(deleted) for deleted in engine.deleted], [list(allocations) for allocations in engine.allocations], engine.objective
+        )
+
+    def set_state(self, engine:ArrayHeuristic, state:tuple) -> None:
+        starts, ends, release_times, current_tasks, deleted, allocations, objective = state
+        engine.timeline = ArrayTimeline()
+        engine.timeline.starts, engine.timeline.ends = dict(starts), dict(ends)
+        engine.release_times, engine.current_tasks = release_times.copy(), current_tasks.copy()
+        engine.deleted = [set(instance_deleted) for instance_deleted in deleted]
+        engine.allocations = [list(instance_allocations) for instance_allocations in allocations]
+        engine.objective = objective
+
+    def decode(self, sequence:list[int], branches:dict[tuple[int, int], int], current:Solution=None, first_changed:int=0) -> tuple[Solution, ArrayHeuristic]:
+        """
+        Decodes the sequence, which is equal to the sequence of current before first_changed.
+        Returns the realized solution and the engine with its schedule.
+        """
+        engine = self.get_engine()
+        if current is not None:
+            checkpoint_idx = bisect.bisect_right([step for step, _ in current.checkpoints], first_changed) - 1
+            step, state = current.checkpoints[checkpoint_idx]
+            checkpoints = current.checkpoints[:checkpoint_idx + 1]
+            self.set_state(engine, state)
+            tasks = current.tasks[:step]
+        else:
+            step, checkpoints, tasks = 0, [(0, self.initial_state)], []
+        solution = Solution(list(sequence[:step]), tasks, dict(branches), None, checkpoints)
+
+        def allocate(instance_idx:int) -> bool:
+            step = len(solution.sequence)
+            if step % self.checkpoint_interval == 0 and step > checkpoints[-1][0]:
+                checkpoints.append((step, self.get_state(engine)))
+            task_idx = int(engine.current_tasks[instance_idx])
+            has_next = engine.allocate_next_task(instance_idx, branches.get((instance_idx, task_idx)))
+            solution.sequence.append(instance_idx)
+            solution.tasks.append(task_idx)
+            branch_id = engine.allocations[instance_idx][-1][0]
+            solution.branches[(instance_idx, task_idx)] = self.branch_positions[self.instances[instance_idx][0]][branch_id]
+            return has_next
+
+        for instance_idx in sequence[step:]:
+            if engine.current_tasks[instance_idx] < len(engine.tables[instance_idx].task_ids):
+                allocate(instance_idx)
+        # Tasks left, e.g. because a task is no longer deleted, in order of release time
+        for instance_idx in range(len(self.instances)):
+            if engine.current_tasks[instance_idx] < len(engine.tables[instance_idx].task_ids):
+                engine.push(engine.release_times[instance_idx], instance_idx)
+        while engine.queue:
+            _, _, _, instance_idx = heapq.heappop(engine.queue)
+            if allocate(instance_idx):
+                engine.push(engine.release_times[instance_idx], instance_idx)
+        solution.objective = engine.objective
+        return solution, engine
+
+
+def get_initial_solution(schedule:dict, decoder:SequenceDecoder) -> tuple[list[int], dict[tuple[int, int], int]]:
+    """
+    Returns the sequence and branch positions of a schedule in the format of the Simulator.
+    Tasks are sequenced by their release time, the end of the previous task of the instance, and then by start.
+    """
+    steps = []
+    branches = {}
+    for instance_idx, instance in enumerate(schedule["instances"]):
+        release_time = decoder.instances[instance_idx][1]
+        for task_idx, task in enumerate(instance["tasks"].values()):
+            for position, branch_id in enumerate(task["branches"]):
+                job_ids = instance["branches"][branch_id]["jobs"]
+                if job_ids and instance["jobs"][job_ids[0]]["selected"]:
+                    jobs = [instance["jobs"][job_id] for job_id in job_ids]
+                    steps.append((release_time, min(job["start"] for job in jobs), instance_idx, task_idx))
+                    branches[(instance_idx, task_idx)] = position
+                    release_time = max(job["start"] + job["cost"] for job in jobs)
+                    break
+    steps.sort()
+    return [instance_idx for _, _, instance_idx, _ in steps], branches
+
+
+def search(decoder:SequenceDecoder, sequence:list[int], branches:dict[tuple[int, int], int], time_budget:float, max_iterations:int=None, seed:int=None) -> Solution:
+    """
+    First improvement local search from the solution, accepts neighbours that are not worse.
+    Moves: change the branch of a task, move one step of the sequence, shift all steps of an instance.
+    """
+    start = time.time()
+    rng = random.Random(seed)
+    current, _ = decoder.decode(sequence, branches)
+    best = current
+    iteration = 0
+    while time.time() - start < time_budget and (max_iterations is None or iteration < max_iterations) and len(current.sequence) > 1:
+        iteration += 1
+        sequence, branches = list(current.sequence), current.branches
+        move = rng.randrange(3)
+        if move == 0:
+            step = rng.randrange(len(sequence))
+            instance_idx, task_idx = sequence[step], current.tasks[step]
+            n_branches = len(decoder.tables[decoder.instances[instance_idx][0]].branches[task_idx])
+            if n_branches < 2:
+                continue
+            branches = dict(branches)
+            branches[(instance_idx, task_idx)] = (branches[(instance_idx, task_idx)] + rng.randrange(1, n_branches)) % n_branches
+            first_changed = step
+        elif move == 1:
+            step, new_step = rng.sample(range(len(sequence)), 2)
+            sequence.insert(new_step, sequence.pop(step))
+            first_changed = min(step, new_step)
+        else:
+            instance_idx = rng.choice(sequence)
+            shift = rng.choice([-1, 1]) * rng.randint(1, max(1, len(sequence) // 4))
+            others = [other for other in sequence if other != instance_idx]
+            # Number of other steps before each step of the instance, shifted
+            positions = [max(0, min(len(others), step - count + shift)) for count, step in enumerate(
+                step for step, other in enumerate(sequence) if other == instance_idx)]
+            for count, position in enumerate(positions):
+                others.insert(position + count, instance_idx)
+            first_changed = next(step for step, (old, new) in enumerate(zip(sequence, others)) if old != new) if others != sequence else len(sequence)
+            sequence = others
+        if first_changed >= len(sequence):
+            continue
+        neighbour, _ = decoder.decode(sequence, branches, current, first_changed)
+        if neighbour.objective <= current.objective:
+            current = neighbour
+            if current.objective < best.objective:
+                best = current
+    return best
+
+
+def run_search(seed:int, sequence:list[int], branches:dict[tuple[int, int], int], time_budget:float, max_iterations:int=None) -> tuple[float, list[int], dict]:
+    """ Runs one search in a worker process, with the tables set by multi_start.init_worker"""
+    tables, instances = multi_start.worker_problem
+    best = search(SequenceDecoder(tables, instances), sequence, branches, time_budget, max_iterations, seed)
+    return best.objective, best.sequence, best.branches
+
+
+class LocalSearch():
+    """
+    Improves a schedule of any allocation type over sequences of tasks and branch selections within a time budget.
+    With n_searches > 1, searches with different seeds run in a process pool and the best one is kept.
+    The schedule is only replaced if a strictly better one is found.
+    """
+    def __init__(self, instances:list[tuple[RA_PST, float]], time_budget:float=10.0, max_iterations:int=None, n_searches:int=1, max_workers:int=None, seed:int=0):
+        self.time_budget = time_budget
+        self.max_iterations = max_iterations
+        self.n_searches = n_searches
+        self.max_workers = max_workers
+        self.seed = seed
+        self.tables, table_idxs, self.problems = get_problem_tables([ra_pst for ra_pst, _ in instances])
+        self.instances: list[tuple[int, float]] = [(table_idx, release_time) for table_idx, (_, release_time) in zip(table_idxs, instances)]
+        self.decoder = SequenceDecoder(self.tables, self.instances)
+        self.objective: float = None
+
+    def run(self, schedule:dict | os.PathLike | str = None) -> dict:
+        """ Returns the improved schedule, starts from the heuristic if no schedule is given"""
+        start = time.time()
+        if schedule is None:
+            schedule = multi_start.run_engine(self.tables, self.instances).get_schedule_dict()
+        schedule = utils.load_json(schedule)
+        sequence, branches = get_initial_solution(schedule, self.decoder)
+        initial_objective = max(job["start"] + job["cost"] for instance in schedule["instances"] for job in instance["jobs"].values() if job["selected"])
+
+        if self.n_searches > 1:
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=multi_start.init_worker, initargs=(self.problems, self.instances)) as pool:
+                futures = [pool.submit(run_search, seed, sequence, branches, self.time_budget, self.max_iterations) for seed in range(self.seed, self.seed + self.n_searches)]
+                results = [future.result() for future in futures]
+            objective, sequence, branches = min(results, key=lambda result: result[0])
+        else:
+            best = search(self.decoder, sequence, branches, self.time_budget, self.max_iterations, self.seed)
+            sequence, branches = best.sequence, best.branches
+
+        best, engine = self.decoder.decode(sequence, branches)
+        if best.objective >= initial_objective:
+            self.objective = initial_objective
+            return schedule
+        self.objective = best.objective
+        return update_schedule(schedule, engine.get_schedule_dict(), time.time() - start)
+
+
+def update_schedule(schedule:dict, improved:dict, computing_time:float) -> dict:
+    """
+    Writes start, cost and selection of the jobs of the improved schedule into the schedule, other keys are kept.
+    Jobs are matched by their position in the tasks and branches of each instance, like in get_initial_solution.
+    The computing time of the search is added to the computing time of the schedule.
+    """
+    for instance, improved_instance in zip(schedule["instances"], improved["instances"]):
+        for task, improved_task in zip(instance["tasks"].values(), improved_instance["tasks"].values()):
+            for branch_id, improved_branch_id in zip(task["branches"], improved_task["branches"]):
+                for job_id, improved_job_id in zip(instance["branches"][branch_id]["jobs"], improved_instance["branches"][improved_branch_id]["jobs"]):
+                    improved_job = improved_instance["jobs"][improved_job_id]
+                    instance["jobs"][job_id].update({"start": improved_job["start"], "cost": improved_job["cost"], "selected": improved_job["selected"]})
+    schedule["objective"] = improved["objective"]
+    solution = schedule.setdefault("solution", {})
+    solution["objective"] = improved["solution"]["objective"]
+    solution["total interval length"] = improved["solution"]["total interval length"]
+    solution["computing time"] = (solution.get("computing time") or 0) + computing_time
+    return schedule
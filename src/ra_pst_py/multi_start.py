@@ -0,0 +1,80 @@
+from src.ra_pst_py.core import RA_PST
+from src.ra_pst_py.builder import build_rapst
+from src.ra_pst_py.array_heuristic import ProblemTable, ArrayHeuristic, get_problem_tables
+
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import random
+import time
+
+
+# (problem tables, instances) of a worker process, set by init_worker
+worker_problem: tuple[list[ProblemTable], list[tuple[int, float]]] = None
+
+
+def run_engine(tables:list[ProblemTable], instances:list[tuple[int, float]], seed:int=None, deadline:float=None) -> ArrayHeuristic | None:
+    """
+    Runs the heuristic for the instances (table index, release time), randomized if a seed is given.
+    Returns None if the deadline passed before all tasks were allocated.
+    """
+    engine = ArrayHeuristic(rng=random.Random(seed) if seed is not None else None)
+    for table_idx, release_time in instances:
+        engine.add_instances([release_time], tables[table_idx])
+    return engine if engine.simulate(deadline) else None
+
+
+def init_worker(problems:list[tuple[str, str]], instances:list[tuple[int, float]]):
+    # lxml trees can not be sent to other processes, each worker builds its tables once from the XML
+    global worker_problem
+    tables = [ProblemTable(build_rapst(process, resource)) for process, resource in problems]
+    worker_problem = (tables, instances)
+
+
+def run_variant(seed:int, deadline:float=None) -> tuple[float | None, int]:
+    """ Returns the objective of the variant, None if it did not finish before the deadline"""
+    tables, instances = worker_problem
+    engine = run_engine(tables, instances, seed, deadline)
+    return (engine.objective if engine is not None else None), seed
+
+
+class MultiStartHeuristic():
+    """
+    Runs the heuristic once as it is and then randomized variants in a process pool,
+    until n_starts runs are done or the time budget is used up. Keeps the schedule with the best objective,
+    so the result is never worse than the one of the plain heuristic.
+    """
+    def __init__(self, instances:list[tuple[RA_PST, float]], n_starts:int=32, time_budget:float=10.0, max_workers:int=None, seed:int=0):
+        self.n_starts = n_starts
+        self.time_budget = time_budget
+        self.max_workers = max_workers
+        self.seed = seed
+        # Instances of the same RA-PST share one problem table
+        self.tables, table_idxs, self.problems = get_problem_tables([ra_pst for ra_pst, _ in instances])
+        self.instances: list[tuple[int, float]] = [(table_idx, release_time) for table_idx, (_, release_time) in zip(table_idxs, instances)]
+        # Objective of each finished run by seed, None is the plain heuristic
+        self.objectives: dict[int, float] = {}
+
+    def run(self) -> dict:
+        """ Returns the best schedule in the format of the Simulator"""
+        start = time.time()
+        deadline = start + self.time_budget
+        best_engine = run_engine(self.tables, self.instances)
+        self.objectives[None] = best_engine.objective
+
+        seeds = range(self.seed + 1, self.seed + self.n_starts)
+        if seeds:
+            # Running variants stop at the deadline, so no worker is left busy after the budget
+            with ProcessPoolExecutor(max_workers=self.max_workers, initializer=init_worker, initargs=(self.problems, self.instances)) as pool:
+                pending = {pool.submit(run_variant, seed, deadline) for seed in seeds}
+                while pending and time.time() < deadline:
+                    done, pending = wait(pending, timeout=deadline - time.time(), return_when=FIRST_COMPLETED)
+                    for future in done:
+                        objective, seed = future.result()
+                        if objective is not None:
+                            self.objectives[seed] = objective
+                pool.shutdown(cancel_futures=True)
+
+            # Rerun the best variant to get its schedule, the runs are deterministic for a seed
+            best_seed = min(self.objectives, key=lambda seed: self.objectives[seed])
+            if self.objectives[best_seed] < best_engine.objective:
+                best_engine = run_engine(self.tables, self.instances, best_seed)
+        return best_engine.get_schedule_dict()
@@ -1,6 +1,320 @@
 import numpy as np
 from lxml import etree
 from collections import defaultdict
+import bisect
+import heapq
+import itertools
+import json
+import os
+import time
+
+class Timeline():
+    """
+    Busy intervals (start, end) of the selected jobs per resource, sorted by start.
+    Built once per allocation step from the schedule dict and then only read,
+    so it can be shared between concurrent branch evaluations.
+    """
+    # Ids of the timelines, versions of different timelines never match
+    ids = itertools.count()
+
+    def __init__(self) -> None:
+        self.intervals: dict[str, list[tuple[float, float]]] = defaultdict(list)
+        self.id = next(Timeline.ids)
+        # Number of jobs added per resource
+        self.versions: dict[str, int] = defaultdict(int)
+
+    @classmethod
+    def from_schedule_dict(cls, schedule_dict:dict) -> 'Timeline':
+        timeline = cls()
+        if not schedule_dict:
+            return timeline
+        for instance in schedule_dict["instances"]:
+            for job in instance["jobs"].values():
+                if job["selected"]:
+                    timeline.add_job(job["resource"], job["start"], job["cost"])
+        return timeline
+
+    def add_job(self, resource:str, start:float, cost:float) -> None:
+        bisect.insort(self.intervals[resource], (float(start), float(start) + float(cost)))
+        self.versions[resource] += 1
+
+    def get_resource_intervals(self, resource:str):
+        return self.intervals.get(resource, ())
+
+    def get_resource_version(self, resource:str) -> tuple[int, int]:
+        """
+        Returns a value that changes whenever the intervals of the resource change:
+        the id of the timeline and the number of jobs added to the resource.
+        The ScheduleStore adds new jobs to its timeline, so versions stay valid between allocation steps.
+        """
+        return (self.id, self.versions.get(resource, 0))
+
+    def get_earliest_start(self, resource:str, release_time:float, duration:float) -> float:
+        """
+        Returns the start of the earliest free slot on the resource that begins 
+        at or after release_time and is long enough for duration.
+        Blocks ending before release_time are ignored.
+        """
+        earliest_start = np.inf
+        earliest_finish = np.inf
+        slot_start = 0.0
+        for start, end in self.get_resource_intervals(resource):
+            if end < release_time:
+                continue
+            if start - slot_start >= duration and slot_start >= release_time and slot_start + duration < earliest_finish:
+                earliest_start = slot_start
+                earliest_finish = slot_start + duration
+            slot_start = end
+        # The slot after the last block is open-ended
+        if slot_start >= release_time and slot_start + duration < earliest_finish:
+            earliest_start = slot_start
+        if earliest_start == np.inf:
+            earliest_start = release_time
+        return float(earliest_start)
+
+
+class TimelineOverlay(Timeline):
+    """
+    Read-only base timeline plus the jobs of one tentative allocation.
+    Lets alternative allocations be tried without copying the full timeline.
+    """
+    def __init__(self, base:Timeline, intervals:dict[str, list[tuple[float, float]]]=None) -> None:
+        self.base = base
+        self.intervals = intervals if intervals is not None else {}
+        self.id = next(Timeline.ids)
+        self.versions: dict[str, int] = defaultdict(int)
+
+    def add_job(self, resource:str, start:float, cost:float) -> None:
+        bisect.insort(self.intervals.setdefault(resource, []), (float(start), float(start) + float(cost)))
+        self.versions[resource] += 1
+
+    def get_resource_version(self, resource:str) -> tuple:
+        return (self.base.get_resource_version(resource), self.id, self.versions.get(resource, 0))
+
+    def with_jobs(self, jobs:list[tuple[str, float, float]]) -> 'TimelineOverlay':
+        """ Returns a new overlay with the same base and the additional jobs (resource, start, cost)"""
+        overlay = TimelineOverlay(self.base, {resource: list(intervals) for resource, intervals in self.intervals.items()})
+        for resource, start, cost in jobs:
+            overlay.add_job(resource, start, cost)
+        return overlay
+
+    def get_resource_intervals(self, resource:str):
+        own_intervals = self.intervals.get(resource)
+        if not own_intervals:
+            return self.base.get_resource_intervals(resource)
+        return heapq.merge(self.base.get_resource_intervals(resource), own_intervals)
+
+
+class ArrayTimeline():
+    """
+    Timeline with the busy intervals of each resource in NumPy arrays, sorted like Timeline.
+    Same get_earliest_start as Timeline, but the slot search is vectorized.
+    If no later query can have a release time before the horizon,
+    intervals that end before it are dropped, so the arrays stay short over long runs.
+    """
+    def __init__(self) -> None:
+        self.starts: dict[str, np.ndarray] = {}
+        self.ends: dict[str, np.ndarray] = {}
+        self.horizon: float = -np.inf
+        # Number of jobs added per resource
+        self.versions: dict[str, int] = defaultdict(int)
+
+    def set_horizon(self, horizon:float) -> None:
+        self.horizon = horizon
+
+    def add_job(self, resource:str, start:float, cost:float) -> None:
+        start = float(start)
+        end = start + float(cost)
+        starts = self.starts.get(resource, np.empty(0))
+        ends = self.ends.get(resource, np.empty(0))
+        if len(ends) and ends.min() < self.horizon:
+            relevant = ends >= self.horizon
+            starts, ends = starts[relevant], ends[relevant]
+        # Insert behind equal (start, end) pairs like bisect.insort
+        low, high = np.searchsorted(starts, start, "left"), np.searchsorted(starts, start, "right")
+        position = low + np.searchsorted(ends[low:high], end, "right")
+        self.starts[resource] = np.insert(starts, position, start)
+        self.ends[resource] = np.insert(ends, position, end)
+        self.versions[resource] += 1
+
+    def get_resource_version(self, resource:str) -> int:
+        """ Dropping intervals before the horizon does not change the version, it can not change any result"""
+        return self.versions[resource]
+
+    def get_resource_intervals(self, resource:str):
+        if resource not in self.starts:
+            return ()
+        return list(zip(self.starts[resource].tolist(), self.ends[resource].tolist()))
+
+    def get_earliest_start(self, resource:str, release_time:float, duration:float) -> float:
+        """
+        Returns the start of the earliest free slot on the resource that begins
+        at or after release_time and is long enough for duration.
+        Blocks ending before release_time are ignored.
+        """
+        if resource not in self.starts:
+            return float(release_time)
+        relevant = self.ends[resource] >= release_time
+        slot_starts = np.concatenate(([0.0], self.ends[resource][relevant]))
+        slot_ends = np.concatenate((self.starts[resource][relevant], [np.inf]))
+        fits = (slot_ends - slot_starts >= duration) & (slot_starts >= release_time)
+        finishes = np.where(fits, slot_starts + duration, np.inf)
+        # argmin returns the first slot with the earliest finish
+        best_slot = np.argmin(finishes)
+        if finishes[best_slot] == np.inf:
+            return float(release_time)
+        return float(slot_starts[best_slot])
+
+
+class ScheduleJournal():
+    """
+    Append-only JSONL log of the changes of a schedule, one event per line:
+    {"event": "schedule", "schedule": {...}}     the whole schedule, e.g. a solver result
+    {"event": "instance", "idx": i, "instance": {...}}     an instance added to the schedule
+    {"event": "update", "jobs": {jobId: {...}}, "objective": ..., "resources": [...]}     committed jobs
+    Writing an event costs O(event). fold() replays the events into the schedule,
+    a line cut off by a crash is ignored.
+    """
+    def __init__(self, filepath:os.PathLike | str) -> None:
+        self.filepath = filepath
+
+    def append(self, event:dict) -> None:
+        with open(self.filepath, "a") as f:
+            f.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+    def clear(self) -> None:
+        with open(self.filepath, "w"): pass
+
+    def read(self):
+        if not os.path.exists(self.filepath):
+            return
+        with open(self.filepath, "r") as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    # Last line of a crashed run
+                    break
+
+    def fold(self) -> dict:
+        """ Returns the schedule after all events, None if there are none """
+        schedule = None
+        # Instance index of each job id
+        job_instances: dict[str, int] = {}
+        for event in self.read():
+            if event["event"] == "schedule":
+                schedule = event["schedule"]
+                job_instances = {job_id: idx for idx, instance in enumerate(schedule["instances"]) for job_id in instance["jobs"]}
+            elif event["event"] == "instance":
+                idx = event["idx"]
+                if idx < len(schedule["instances"]):
+                    schedule["instances"][idx] = event["instance"]
+                else:
+                    schedule["instances"].append(event["instance"])
+                job_instances.update({job_id: idx for job_id in event["instance"]["jobs"]})
+            elif event["event"] == "update":
+                for job_id, job in event["jobs"].items():
+                    schedule["instances"][job_instances[job_id]]["jobs"][job_id].update(job)
+                for key, value in event.items():
+                    if key not in ("event", "jobs"):
+                        schedule[key] = value
+        return schedule
+
+    def compact(self) -> dict:
+        """ Replaces the events by one schedule event and returns the schedule """
+        schedule = self.fold()
+        if schedule is not None:
+            temp_filepath = f"{self.filepath}.tmp"
+            with open(temp_filepath, "w") as f:
+                f.write(json.dumps({"event": "schedule", "schedule": schedule}, separators=(",", ":")) + "\n")
+            os.replace(temp_filepath, self.filepath)
+        return schedule
+
+
+class ScheduleStore():
+    """
+    Holds the schedule dict of a Simulator in memory, together with a Timeline of its selected jobs.
+    The schedule file is only written at checkpoints: after checkpoint_events changes,
+    after checkpoint_seconds since the last write and whenever checkpoint() is called.
+    Without either, the file is only written on checkpoint().
+    With a journal, every change is appended to it as well.
+    """
+    def __init__(self, filepath:os.PathLike | str, checkpoint_events:int=None, checkpoint_seconds:float=None, journal:ScheduleJournal=None) -> None:
+        self.filepath = filepath
+        self.checkpoint_events = checkpoint_events
+        self.checkpoint_seconds = checkpoint_seconds
+        self.journal = journal
+        self.schedule: dict = None
+        self.timeline: Timeline = None
+        self.changes = 0
+        self.last_checkpoint = time.time()
+        # Number of instances in the journal
+        self.journaled_instances: int = None
+
+    def get(self) -> dict:
+        """ Returns the schedule, read from the file the first time """
+        if self.schedule is None:
+            self.schedule = {}
+            if os.path.exists(self.filepath) and os.path.getsize(self.filepath) > 0:
+                with open(self.filepath, "r") as f:
+                    self.schedule = json.load(f)
+            if not self.schedule:
+                # Default if file is empty
+                self.schedule = {"instances": [], "resources": [], "objective": 0}
+        return self.schedule
+
+    def set(self, schedule:dict, jobs:dict[str, dict]=None) -> None:
+        """
+        Replaces the schedule. jobs are the jobs by id that got selected since the last change,
+        if given they are added to the timeline instead of building it again
+        and only they are written to the journal, together with the new instances.
+        """
+        if jobs is not None and self.timeline is not None:
+            for job in jobs.values():
+                self.timeline.add_job(job["resource"], job["start"], job["cost"])
+        else:
+            self.timeline = None
+        if self.journal is not None:
+            self.write_events(schedule, jobs)
+        self.schedule = schedule
+        self.changes += 1
+        if (self.checkpoint_events and self.changes >= self.checkpoint_events) or \
+                (self.checkpoint_seconds is not None and time.time() - self.last_checkpoint >= self.checkpoint_seconds):
+            self.checkpoint()
+
+    def write_events(self, schedule:dict, jobs:dict[str, dict]=None) -> None:
+        if jobs is None or self.journaled_instances is None or schedule is not self.schedule:
+            self.journal.append({"event": "schedule", "schedule": schedule})
+            self.journaled_instances = len(schedule["instances"])
+            return
+        for idx in range(self.journaled_instances, len(schedule["instances"])):
+            self.journal.append({"event": "instance", "idx": idx, "instance": schedule["instances"][idx]})
+        self.journaled_instances = len(schedule["instances"])
+        event = {"event": "update", "jobs": {job_id: {"start": job["start"], "cost": job["cost"], "selected": job["selected"]} for job_id, job in jobs.items()}}
+        event.update({key: value for key, value in schedule.items() if key != "instances"})
+        self.journal.append(event)
+
+    def get_timeline(self) -> Timeline:
+        """ Returns the Timeline of the selected jobs, it must not be changed by the caller """
+        if self.timeline is None:
+            self.timeline = Timeline.from_schedule_dict(self.get())
+        return self.timeline
+
+    def checkpoint(self) -> None:
+        """ Writes the schedule to the file if it changed since the last checkpoint """
+        if self.schedule is not None and self.changes:
+            with open(self.filepath, "w") as f:
+                json.dump(self.schedule, f, indent=2)
+        self.changes = 0
+        self.last_checkpoint = time.time()
+
+    def reset(self) -> None:
+        """ Drops the schedule in memory, the next get reads the file """
+        self.schedule = None
+        self.timeline = None
+        self.changes = 0
+        self.journaled_instances = None
+
 
 class Schedule():
     def __init__(self) -> None:
@@ -3,20 +3,41 @@ from src.ra_pst_py.core import Branch, RA_PST
 from src.ra_pst_py.cp_docplex import cp_solver, cp_solver_decomposed, cp_solver_alternative_new, cp_solver_scheduling_only
 from src.ra_pst_py.cp_docplex_decomposed import cp_solver_decomposed_strengthened_cuts, cp_subproblem
 from src.ra_pst_py.ilp import configuration_ilp
+from src.ra_pst_py.beam_search import BeamSearch
+from src.ra_pst_py.heuristic import EvaluationCache
+from src.ra_pst_py.schedule import Timeline, ScheduleStore, ScheduleJournal
+from src.ra_pst_py.multi_start import MultiStartHeuristic
+from src.ra_pst_py.dispatching import DispatchRuleEnum, dispatch
+from src.ra_pst_py.compaction import left_shift_schedule
+from src.ra_pst_py.local_search import LocalSearch
+from src.ra_pst_py.array_heuristic import get_problem_xml
+from src.ra_pst_py.builder import build_rapst
+from src.ra_pst_py.checkpoint import save_state, load_state
+from src.ra_pst_py.workspace import Workspace
 
 from enum import Enum, StrEnum
 from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 import numpy as np
 from lxml import etree
 import json
 import os
 import time
 import itertools
+import copy
+import heapq
+import random
 
 
 class AllocationTypeEnum(StrEnum):
     HEURISTIC = "heuristic"
     SINGLE_INSTANCE_HEURISTIC = "single_instance_heuristic"
+    SINGLE_INSTANCE_BEAM_SEARCH = "single_instance_beam_search"
+    MULTI_START_HEURISTIC = "multi_start_heuristic"
+    DISPATCHING_SPT = "dispatching_spt"
+    DISPATCHING_LPT = "dispatching_lpt"
+    DISPATCHING_MWKR = "dispatching_mwkr"
+    DISPATCHING_EDD = "dispatching_edd"
     SINGLE_INSTANCE_CP = "single_instance_cp"
     SINGLE_INSTANCE_CP_DECOMPOSED = "single_instance_cp_decomposed"
     ALL_INSTANCE_CP = "all_instance_cp"
@@ -34,17 +55,145 @@ class QueueObject():
         self.task = task
         self.release_time = release_time
 
+
+class EventQueue():
+    """
+    Heap of QueueObjects ordered by (release_time, schedule_idx), equal keys in order of push.
+    The key is taken on push. Iterating yields the queued objects in order without removing them.
+    Cancelled objects stay in the heap and are dropped when they reach the top.
+    """
+    def __init__(self, queue_objects:list[QueueObject]=()):
+        self.heap: list[list] = []
+        self.counter = itertools.count()
+        # Heap entry of each queued object by id
+        self.entries: dict[int, list] = {}
+        self.push_all(queue_objects)
+
+    def get_entry(self, queue_object:QueueObject) -> list:
+        if id(queue_object) in self.entries:
+            raise ValueError("QueueObject is already queued")
+        entry = [queue_object.release_time, queue_object.schedule_idx, next(self.counter), queue_object]
+        self.entries[id(queue_object)] = entry
+        return entry
+
+    def push(self, queue_object:QueueObject) -> None:
+        heapq.heappush(self.heap, self.get_entry(queue_object))
+
+    def push_all(self, queue_objects:list[QueueObject]) -> None:
+        """ Pushes all queue objects at once in O(n) """
+        self.heap.extend(self.get_entry(queue_object) for queue_object in queue_objects)
+        heapq.heapify(self.heap)
+
+    def drop_cancelled(self) -> None:
+        while self.heap and self.heap[0][-1] is None:
+            heapq.heappop(self.heap)
+
+    def pop(self) -> QueueObject:
+        self.drop_cancelled()
+        if not self.heap:
+            raise IndexError("pop from an empty EventQueue")
+        queue_object = heapq.heappop(self.heap)[-1]
+        del self.entries[id(queue_object)]
+        return queue_object
+
+    def peek(self, n:int=None) -> QueueObject | list[QueueObject]:
+        """ Returns the next queue object, or a list of the next n ones, without removing them """
+        if n is not None:
+            return [entry[-1] for entry in heapq.nsmallest(n, self.entries.values())]
+        self.drop_cancelled()
+        if not self.heap:
+            raise IndexError("peek into an empty EventQueue")
+        return self.heap[0][-1]
+
+    def cancel(self, queue_object:QueueObject) -> None:
+        """ Removes a queued object """
+        entry = self.entries.pop(id(queue_object))
+        entry[-1] = None
+
+    def __contains__(self, queue_object:QueueObject) -> bool:
+        return id(queue_object) in self.entries
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __iter__(self):
+        return (entry[-1] for entry in sorted(self.entries.values()))
+
+    def __getstate__(self):
+        # Entries are looked up by id, which changes when the queue is loaded again
+        entries = sorted(self.entries.values())
+        return {"entries": entries, "counter": max([entry[2] for entry in entries], default=-1) + 1}
+
+    def __setstate__(self, state):
+        self.heap = state["entries"]
+        self.counter = itertools.count(state["counter"])
+        self.entries = {id(entry[-1]): entry for entry in self.heap}
+
+def solve_instance(schedule_filepath:str, warm_start:dict, decomposed:bool, sigma:int, time_limit:int, rolling_horizon:bool) -> dict:
+    """ Runs the CP of SINGLE_INSTANCE_CP on a schedule file, in a worker process of the Simulator """
+    if decomposed:
+        return cp_solver_decomposed_strengthened_cuts(schedule_filepath, warm_start_json=warm_start, TimeLimit=time_limit, sigma=sigma)
+    return cp_solver(schedule_filepath, warm_start_json=warm_start, log_file=f"{schedule_filepath}.log", sigma=sigma, timeout=time_limit, rolling_horizon=rolling_horizon)
+
+
 class Simulator():
-    def __init__(self, schedule_filepath:str, sigma:int, time_limit:int) -> None:
+    def __init__(self, schedule_filepath:str, sigma:int, time_limit:int, max_workers:int=None, beam_time_budget:float=1.0, warmstart:bool=False, memoize:bool=True, multi_starts:int=32, multi_start_budget:float=10.0, multi_start_workers:int=None, compact:bool=False, local_search_budget:float=None, local_searches:int=1, concurrent_instances:int=None, checkpoint_events:int=None, checkpoint_seconds:float=None, journal_filepath:str=None, rolling_horizon:bool=False, solver_workers:int=None, batch_window:float=None, max_batch_size:int=None, max_batch_latency:float=None, state_filepath:str=None, state_seconds:float=60, state_key:str=None, workspace:Workspace=None) -> None:
         self.schedule_filepath = schedule_filepath
+        # Schedule in memory, written to schedule_filepath at checkpoints and at the end of simulate()
+        # With a journal_filepath, every change is also appended to a ScheduleJournal
+        journal = ScheduleJournal(journal_filepath) if journal_filepath else None
+        self.schedule_store = ScheduleStore(schedule_filepath, checkpoint_events=checkpoint_events, checkpoint_seconds=checkpoint_seconds, journal=journal)
         # List of [{instance:RA_PST_instance, allocation_type:str(allocation_type)}]
-        self.task_queue: list[QueueObject] = []  # List of QueueObject
-        self.expected_instances_queue: list[QueueObject] = [] # List of Queu objects only for online allocation.
+        self.task_queue: EventQueue = EventQueue()
+        self.expected_instances_queue: EventQueue = EventQueue() # Queue objects only for online allocation.
         self.allocation_type: AllocationTypeEnum = None
         self.ns = None
-        self.is_warmstart:bool = None
+        # Start the CP and decomposed solvers from a heuristic solution
+        self.warmstart:bool = warmstart
         self.sigma = sigma
+        # Model only the jobs that can still move in the CP of SINGLE_INSTANCE_CP, earlier jobs block their resources
+        self.rolling_horizon:bool = rolling_horizon
+        # Worker processes for the CP of SINGLE_INSTANCE_CP, with workers the solves run while later arrivals are placed by the heuristic
+        self.solver_workers:int = solver_workers
+        # Micro-batching of SINGLE_INSTANCE_CP and SINGLE_INSTANCE_ILP: arrivals within batch_window of the previous one
+        # are solved together, at most max_batch_size and up to max_batch_latency after the first one
+        self.batch_window:float = batch_window
+        self.max_batch_size:int = max_batch_size
+        self.max_batch_latency:float = max_batch_latency
+        # With a state_filepath, the state is saved between events, at most every state_seconds
+        # as it holds the whole schedule, and simulate() resumes from it. The file is removed once the simulation is complete.
+        # A saved state is only resumed if it has the same state_key, e.g. a hash of the inputs of the run.
+        # The pending solves of solver_workers are not part of the state.
+        if state_filepath and solver_workers:
+            raise ValueError("A simulation with solver_workers can not be resumed, use either state_filepath or solver_workers")
+        self.state_filepath:str = state_filepath
+        self.state_seconds:float = state_seconds
+        self.state_key:str = state_key
+        self.last_state_save:float = None
+        # ILP configuration of the first instance in SINGLE_INSTANCE_ILP
+        self.ilp_result:dict = None
+        # Directory for working files like tmp/ilp_rep.json and the branch dumps of the instances
+        self.workspace:Workspace = workspace or Workspace()
         self.time_limit:int = time_limit
+        # Thread pool shared by all instances to evaluate candidate branches concurrently in the heuristics
+        self.executor = ThreadPoolExecutor(max_workers=max_workers) if max_workers else None
+        # Number of queued instances whose next tasks HEURISTIC evaluates together on the executor
+        self.concurrent_instances:int = concurrent_instances
+        # Branch evaluations shared by all instances in the heuristics
+        self.evaluation_cache = EvaluationCache() if memoize else None
+        # Number of runs, time budget in seconds and worker processes for MULTI_START_HEURISTIC
+        self.multi_starts:int = multi_starts
+        self.multi_start_budget:float = multi_start_budget
+        self.multi_start_workers:int = multi_start_workers
+        # Left shift all jobs of the final schedule
+        self.compact:bool = compact
+        # Time budget in seconds and number of parallel searches to improve the final schedule by local search
+        self.local_search_budget:float = local_search_budget
+        self.local_searches:int = local_searches
+        # Instances of the schedule in order, the RA-PSTs are rebuilt from them for the local search
+        self.instances: list[Instance] = []
+        # Time budget per arrival in seconds for SINGLE_INSTANCE_BEAM_SEARCH
+        self.beam_time_budget:float = beam_time_budget
 
     def add_instance(self, instance: Instance, allocation_type: AllocationTypeEnum, expected_instance:bool=False):  # TODO
         """ 
@@ -57,15 +206,14 @@ class Simulator():
                 self.allocation_type = AllocationTypeEnum(allocation_type)
             else:
                 raise ValueError("Invalid allocation type")
+        self.attach_instance(instance)
         
-        if self.is_warmstart: 
-            schedule_idx = instance.id
-        else:
-            if expected_instance:
-                schedule_idx = len(self.expected_instances_queue)
-            else:    
-                schedule_idx = len(self.task_queue)
+        if expected_instance:
+            schedule_idx = len(self.expected_instances_queue)
+        else:    
+            schedule_idx = len(self.task_queue)
         if expected_instance is False:
+            self.instances.append(instance)
             self.update_task_queue(self.task_queue, QueueObject(
                 instance, schedule_idx, allocation_type, instance.current_task, instance.release_time))
         else:
@@ -73,16 +221,24 @@ class Simulator():
                 instance, schedule_idx, allocation_type, instance.current_task, instance.release_time))
 
 
+    def attach_instance(self, instance:Instance) -> None:
+        """ Lets the instance use the executor, evaluation cache and workspace of the simulator """
+        instance.allocator.executor = self.executor
+        instance.allocator.evaluation_cache = self.evaluation_cache
+        instance.workspace = self.workspace
+
     def set_namespace(self):
         """ Sets the namespaces if it is not set yet """
         if not self.ns:
-            self.ns = self.task_queue[0].instance.ns
+            self.ns = self.task_queue.peek().instance.ns
     
     def set_schedule_file(self):
         # Check/create schedule file:
-        if not self.is_warmstart:
-            os.makedirs(os.path.dirname(self.schedule_filepath), exist_ok=True)
-            with open(self.schedule_filepath, "w"): pass
+        os.makedirs(os.path.dirname(self.schedule_filepath), exist_ok=True)
+        with open(self.schedule_filepath, "w"): pass
+        self.schedule_store.reset()
+        if self.schedule_store.journal is not None:
+            self.schedule_store.journal.clear()
 
     def simulate(self, different_instances:bool=False):
         """
@@ -91,6 +247,13 @@ class Simulator():
         # Prelims
         self.set_namespace()
         self.set_schedule_file()
+        if self.state_filepath and os.path.exists(self.state_filepath):
+            state = load_state(self.state_filepath)
+            if state.get("state_key") == self.state_key:
+                self.set_state(state)
+            else:
+                # Saved by a run with other inputs
+                os.remove(self.state_filepath)
 
         if self.allocation_type == AllocationTypeEnum.HEURISTIC:
             #Start taskwise allocation with process tree heuristic
@@ -104,11 +267,23 @@ class Simulator():
         elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_CP:
             self.all_instance_processing()
         elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_CP_DECOMPOSED:
-            self.all_instance_processing(warmstart=False, decomposed=True)
+            self.all_instance_processing(decomposed=True)
         elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_CP_REPLAN:
             self.single_instance_replan()
         elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC:
             self.single_instance_heuristic()
+        elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_BEAM_SEARCH:
+            self.single_instance_heuristic(beam_search=True)
+        elif self.allocation_type == AllocationTypeEnum.MULTI_START_HEURISTIC:
+            self.multi_start_heuristic()
+        elif self.allocation_type == AllocationTypeEnum.DISPATCHING_SPT:
+            self.dispatching_rule_processing(DispatchRuleEnum.SPT)
+        elif self.allocation_type == AllocationTypeEnum.DISPATCHING_LPT:
+            self.dispatching_rule_processing(DispatchRuleEnum.LPT)
+        elif self.allocation_type == AllocationTypeEnum.DISPATCHING_MWKR:
+            self.dispatching_rule_processing(DispatchRuleEnum.MWKR)
+        elif self.allocation_type == AllocationTypeEnum.DISPATCHING_EDD:
+            self.dispatching_rule_processing(DispatchRuleEnum.EDD)
         elif self.allocation_type == AllocationTypeEnum.SINGLE_INSTANCE_ILP:
             self.single_instance_ilp(different_instances=different_instances)
         elif self.allocation_type == AllocationTypeEnum.ALL_INSTANCE_ILP:
@@ -116,7 +291,66 @@ class Simulator():
         else:
             raise NotImplementedError(
                 f"Allocation_type {self.allocation_type} has not been implemented yet")
+
+        if self.local_search_budget:
+            self.improve_schedule()
+        if self.compact:
+            self.save_schedule(left_shift_schedule(self.get_current_schedule_dict()))
+        self.schedule_store.checkpoint()
+        if self.state_filepath and os.path.exists(self.state_filepath):
+            os.remove(self.state_filepath)
+
+    def get_state(self) -> dict:
+        """ Returns what a resumed simulation needs: queues, instances, schedule and random states """
+        return {
+            "state_key": self.state_key,
+            "allocation_type": self.allocation_type,
+            "task_queue": self.task_queue,
+            "expected_instances_queue": self.expected_instances_queue,
+            "instances": self.instances,
+            "schedule": self.get_current_schedule_dict(),
+            "ilp_result": self.ilp_result,
+            "random_state": random.getstate(),
+            "numpy_random_state": np.random.get_state(),
+        }
+
+    def set_state(self, state:dict) -> None:
+        self.allocation_type = state["allocation_type"]
+        self.task_queue = state["task_queue"]
+        self.expected_instances_queue = state["expected_instances_queue"]
+        self.instances = state["instances"]
+        self.ilp_result = state["ilp_result"]
+        random.setstate(state["random_state"])
+        np.random.set_state(state["numpy_random_state"])
+        for instance in itertools.chain(self.instances, (queue_object.instance for queue_object in itertools.chain(self.task_queue, self.expected_instances_queue))):
+            self.attach_instance(instance)
+        self.save_schedule(state["schedule"])
+
+    def save_state_if_due(self) -> None:
+        """ Saves the state to state_filepath if there is one, called between events """
+        if not self.state_filepath:
+            return
+        if self.last_state_save is not None and time.time() - self.last_state_save < self.state_seconds:
+            return
+        save_state(self.get_state(), self.state_filepath)
+        self.last_state_save = time.time()
+
+    def improve_schedule(self):
+        """ Improves the schedule by local search over task sequences and branches """
+        # The allocation changes the RA-PSTs of the instances, the local search starts from the original ones
+        ra_psts = {}
+        for instance in self.instances:
+            problem = get_problem_xml(instance.ra_pst)
+            if problem not in ra_psts:
+                ra_psts[problem] = build_rapst(*problem)
+        local_search = LocalSearch(
+            [(ra_psts[get_problem_xml(instance.ra_pst)], instance.release_time) for instance in self.instances],
+            time_budget=self.local_search_budget, n_searches=self.local_searches, max_workers=self.multi_start_workers)
+        self.save_schedule(local_search.run(self.get_current_schedule_dict()))
         
+    def get_selected_jobs(self, ilp_rep:dict) -> dict:
+        return {job_id: job for job_id, job in ilp_rep["jobs"].items() if job["selected"]}
+
     def get_current_instance_ilp_rep(self, schedule:dict, queue_object:QueueObject, expected_instance:bool=False):
         if len(schedule["instances"]) > queue_object.schedule_idx and expected_instance is False:
             return schedule["instances"][queue_object.schedule_idx]
@@ -133,33 +367,34 @@ class Simulator():
         schedule["resources"] = list(set(schedule["resources"]).union(ilp_rep["resources"]))
         return schedule
     
-    def save_schedule(self, schedule):
-        with open(self.schedule_filepath, "w") as f:
-            json.dump(schedule, f, indent=2)
+    def save_schedule(self, schedule, jobs:dict[str, dict]=None):
+        """ Replaces the schedule, jobs are the jobs selected since the last save by id if they are known """
+        self.schedule_store.set(schedule, jobs)
+
+    def get_schedule_filepath(self) -> str:
+        """ Writes the schedule and returns its file, for the solvers that read the schedule from a file """
+        self.schedule_store.checkpoint()
+        return self.schedule_filepath
 
     def add_branch_to_ilp_rep(self, branch:Branch, ilp_rep:dict, queue_object:QueueObject):
         task_id = branch.node.attrib["id"]
-        branch_running_id = queue_object.instance.get_all_valid_branches_list().index(branch)
+        branch_running_id = queue_object.instance.get_branch_running_id(branch)
         branch_ilp_id = f"{queue_object.schedule_idx}-{task_id}-{branch_running_id}"
+        if branch_ilp_id not in ilp_rep["branches"]:
+            raise ValueError(f"Branch <{branch_ilp_id}> is not in the ilp_rep of the instance")
     
         branch_ilp_jobs = ilp_rep["branches"][branch_ilp_id]["jobs"]
         branch_ra_pst_tasks = branch.get_serialized_tasklist()
 
         if len(branch_ilp_jobs) != len(branch_ra_pst_tasks):
             raise ValueError(f"Length of Jobs in ilp_rep <{len(branch_ilp_jobs)}> does not match length of jobs in ra_pst_branch <{len(branch_ra_pst_tasks)}>")
-        if len(queue_object.instance.get_all_valid_branches_list()) != len(ilp_rep["branches"]):
-            raise ValueError
         #resource = branch.node.xpath("cpee1:children/cpee1:resource", namespaces=self.ns)[0].attrib["id"]
         for i, jobId in enumerate(branch_ilp_jobs):
             #if i == 0:
             #    if resource != ilp_rep["jobs"][jobId]["resource"]:
             #        raise ValueError(f"Resource <{resource}> != <{ilp_rep["jobs"][jobId]["resource"]}>")
-            task = branch_ra_pst_tasks[i]
-            start_time = float(task.xpath(
-                "cpee1:expected_start", namespaces=self.ns)[0].text)
-            end_time = float(task.xpath("cpee1:expected_end",
-                             namespaces=self.ns)[0].text)
-            duration = float(end_time) - float(start_time)
+            start_time, end_time = queue_object.instance.expected_times[branch_ra_pst_tasks[i]]
+            duration = end_time - start_time
 
             ilp_rep["jobs"][jobId]["start"] = start_time
             ilp_rep["jobs"][jobId]["cost"] = duration
@@ -168,59 +403,94 @@ class Simulator():
         return ilp_rep
     
     def get_current_schedule_dict(self) -> dict:
-        with open(self.schedule_filepath, "r+") as f:
-            if os.path.getsize(self.schedule_filepath) > 0:
-                schedule = json.load(f)
-            else:
-                # Default if file is empty
-                schedule = {"instances": [],
-                            "resources": [], 
-                            "objective": 0}
-        return schedule
+        return self.schedule_store.get()
 
     def single_task_processing(self):
         """
         Calls the heuristic allocation one task at a time. The queue object holds the current task. 
         """
         start = time.time()
+        # Evaluations of queued tasks by queue object: (evaluation, intervals of the resources it read)
+        evaluations: dict[QueueObject, tuple] = {}
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
-            best_branch = queue_object.instance.allocate_next_task(self.schedule_filepath)
+            self.save_state_if_due()
+            queue_object = self.task_queue.pop()
+            timeline = self.schedule_store.get_timeline()
+            evaluation = None
+            if self.concurrent_instances:
+                if queue_object not in evaluations:
+                    evaluations.update(self.evaluate_concurrently([queue_object] + self.task_queue.peek(self.concurrent_instances - 1), timeline))
+                evaluation, resource_intervals = evaluations.pop(queue_object)
+                # Evaluate again if an allocation since the evaluation changed one of its resources
+                if any(tuple(timeline.get_resource_intervals(resource)) != intervals for resource, intervals in resource_intervals.items()):
+                    evaluation = None
+            best_branch = queue_object.instance.allocate_next_task(timeline=timeline, evaluation=evaluation)
             if not best_branch.check_validity():
                 raise ValueError("Invalid Branch chosen")
 
             schedule = self.get_current_schedule_dict()
             instance_ilp_rep = self.get_current_instance_ilp_rep(schedule, queue_object)
+            selected = self.get_selected_jobs(instance_ilp_rep)
             instance_ilp_rep = self.add_branch_to_ilp_rep(best_branch, instance_ilp_rep, queue_object)
             schedule = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule, queue_object)
             queue_object.release_time = sum(queue_object.instance.times[-1])
             if queue_object.release_time > schedule["objective"]:
                 schedule["objective"] = queue_object.release_time
             schedule["resources"] = list(set(schedule["resources"]).union(instance_ilp_rep["resources"]))
-            self.save_schedule(schedule)
+            self.save_schedule(schedule, jobs={job_id: job for job_id, job in self.get_selected_jobs(instance_ilp_rep).items() if job_id not in selected})
             if queue_object.instance.current_task != "end":
                 self.update_task_queue(self.task_queue, queue_object)
 
         end = time.time()
         self.add_allocation_metadata(float(end-start))
 
-    def single_instance_heuristic(self):
+    def evaluate_concurrently(self, queue_objects:list[QueueObject], timeline:Timeline) -> dict[QueueObject, tuple]:
+        """
+        Evaluates the next tasks of the queue objects against the same timeline, on the executor if there is one.
+        The allocations still happen one at a time in queue order, an evaluation is only used
+        if the resources it read are unchanged, so the schedule is the same as without concurrency.
+        """
+        def evaluate(queue_object:QueueObject) -> tuple:
+            # Branches are not evaluated concurrently again, the executor is busy with the instances
+            evaluation = queue_object.instance.allocator.evaluate_task(queue_object.instance.current_task, timeline, concurrent=False)
+            resources = set().union(*[task_node.get_resources() for task_node in evaluation[1]])
+            return evaluation, {resource: tuple(timeline.get_resource_intervals(resource)) for resource in resources}
+        
+        if self.executor is not None and len(queue_objects) > 1:
+            results = self.executor.map(evaluate, queue_objects)
+        else:
+            results = map(evaluate, queue_objects)
+        return dict(zip(queue_objects, results))
+
+    def single_instance_heuristic(self, beam_search:bool=False):
         """
         Calls heuristic allocation for each task in an instance before going over to the next instance
+        With beam_search, the branches of all tasks are chosen by a BeamSearch on arrival 
+        and then allocated one after another.
         """
         # TODO single_instance_heuristic()
         # like single task process but do not update process until the end. 
         # Make sure the deletion of a previous task is also prossible! 
         start = time.time()
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
+            self.save_state_if_due()
+            queue_object = self.task_queue.pop()
+            branch_positions = {}
+            if beam_search:
+                beam = BeamSearch(queue_object.instance, time_budget=self.beam_time_budget)
+                branch_positions = beam.search(self.get_current_schedule_dict())
             while queue_object.instance.current_task != "end":
-                best_branch = queue_object.instance.allocate_next_task(self.schedule_filepath)
+                task_id = queue_object.instance.current_task.attrib["id"]
+                branch = None
+                if task_id in branch_positions:
+                    branch = queue_object.instance.ra_pst.branches[task_id][branch_positions[task_id]]
+                best_branch = queue_object.instance.allocate_next_task(branch=branch, timeline=self.schedule_store.get_timeline())
                 queue_object.release_time = sum(queue_object.instance.times[-1])
                 if not best_branch.check_validity():
                     raise ValueError("Invalid Branch chosen")
                 schedule = self.get_current_schedule_dict()
                 instance_ilp_rep = self.get_current_instance_ilp_rep(schedule, queue_object)
+                selected = self.get_selected_jobs(instance_ilp_rep)
                 instance_ilp_rep = self.add_branch_to_ilp_rep(best_branch, instance_ilp_rep, queue_object)
                 schedule = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule, queue_object)
                 #self.update_task_queue(self.task_queue, queue_object)
@@ -229,46 +499,164 @@ class Simulator():
                 
                 if queue_object.release_time > schedule["objective"]:
                     schedule["objective"] = queue_object.release_time          
-                self.save_schedule(schedule)    
+                self.save_schedule(schedule, jobs={job_id: job for job_id, job in self.get_selected_jobs(instance_ilp_rep).items() if job_id not in selected})
         end = time.time()
         self.add_allocation_metadata(float(end-start))
     
+    def multi_start_heuristic(self):
+        """
+        Allocates all instances with the heuristic and randomized variants of it in a process pool 
+        and keeps the schedule with the best objective.
+        The variants break ties between equal release times and equal finish times randomly.
+        """
+        start = time.time()
+        queue_objects = sorted(self.task_queue, key=lambda queue_object: queue_object.schedule_idx)
+        multi_start = MultiStartHeuristic(
+            [(queue_object.instance.ra_pst, queue_object.release_time) for queue_object in queue_objects], 
+            n_starts=self.multi_starts, time_budget=self.multi_start_budget, max_workers=self.multi_start_workers)
+        schedule = multi_start.run()
+        self.task_queue = EventQueue()
+        self.save_schedule(schedule)
+        end = time.time()
+        self.add_allocation_metadata(float(end-start))
+    
+    def dispatching_rule_processing(self, rule:DispatchRuleEnum):
+        """
+        Allocates the next task over all queued instances by a dispatching rule,
+        each task with the branch of the earliest finish.
+        """
+        start = time.time()
+        queue_objects = sorted(self.task_queue, key=lambda queue_object: queue_object.schedule_idx)
+        schedule = dispatch(rule, [(queue_object.instance.ra_pst, queue_object.release_time) for queue_object in queue_objects])
+        self.task_queue = EventQueue()
+        self.save_schedule(schedule)
+        end = time.time()
+        self.add_allocation_metadata(float(end-start))
+
     def single_instance_processing(self, decomposed:bool=False):
         """
         Allocates each instance on arrival. 
         Already scheduled instances are in the schedule and are added to the cp as fixed. 
         Allowance for rescheduling can be set through self.sigma.
+        With self.rolling_horizon, the CP models only jobs that can still move, see cp_solver.
+        With self.solver_workers, the solves run asynchronously, see single_instance_processing_async.
+        With self.batch_window, the instances of a batch are solved together, see pop_batch.
         """
+        if self.solver_workers:
+            return self.single_instance_processing_async(decomposed)
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
+            self.save_state_if_due()
+            batch = self.pop_batch()
             schedule_dict = self.get_current_schedule_dict()
-            instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
-            schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
-            schedule_dict["resources"] = list(set(schedule_dict["resources"]).union(instance_ilp_rep["resources"]))
-            #if warmstart:
-            #    self.create_warmstart_file(schedule_dict, [queue_object])
+            for queue_object in batch:
+                instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
+                schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
             self.save_schedule(schedule_dict)
+            warm_start = self.create_warmstart(schedule_dict, batch) if self.warmstart else None
 
             if decomposed:
-                result = cp_solver_decomposed_strengthened_cuts(self.schedule_filepath, TimeLimit=self.time_limit, sigma=self.sigma)
+                result = cp_solver_decomposed_strengthened_cuts(self.get_schedule_filepath(), warm_start_json=warm_start, TimeLimit=self.time_limit, sigma=self.sigma)
             else:
-                result = cp_solver(self.schedule_filepath, log_file=f"{self.schedule_filepath}.log", sigma=self.sigma, timeout=self.time_limit)
+                result = cp_solver(self.get_schedule_filepath(), warm_start_json=warm_start, log_file=f"{self.schedule_filepath}.log", sigma=self.sigma, timeout=self.time_limit, rolling_horizon=self.rolling_horizon)
             self.save_schedule(result)
 
+    def single_instance_processing_async(self, decomposed:bool=False):
+        """
+        Like single_instance_processing, but the solves run in a process pool while the next arrivals are handled.
+        On arrival, the instance is placed by the heuristic and the solve starts from a snapshot of the schedule
+        with the instance unallocated. The provisional placement is fixed for the solves of later arrivals.
+        Finished solves are applied in release order before each arrival, a solve that is still running
+        holds back the later ones. The remaining solves are applied in order at the end.
+        Arrivals are not batched.
+        """
+        start = time.time()
+        # Pending solves and the queue objects of their instances, in order of submission
+        pending: dict = {}
+        self.applied_solutions = 0
+        with ProcessPoolExecutor(max_workers=self.solver_workers) as pool:
+            while self.task_queue:
+                queue_object = self.task_queue.pop()
+                for future in list(pending):
+                    if not future.done():
+                        break
+                    self.apply_solution(pending.pop(future), future.result())
+                schedule_dict = self.get_current_schedule_dict()
+                instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
+                schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
+                snapshot_filepath = f"{self.schedule_filepath}.solve-{queue_object.schedule_idx}.json"
+                with open(snapshot_filepath, "w") as f:
+                    json.dump(schedule_dict, f, indent=2)
+                provisional = self.create_warmstart(schedule_dict, [queue_object])
+                provisional["instances"][queue_object.schedule_idx]["fixed"] = True
+                future = pool.submit(solve_instance, snapshot_filepath, provisional, decomposed, self.sigma, self.time_limit, self.rolling_horizon)
+                pending[future] = queue_object
+                self.save_schedule(provisional)
+            for future, queue_object in pending.items():
+                self.apply_solution(queue_object, future.result())
+        end = time.time()
+        self.add_allocation_metadata(float(end-start))
+        schedule = self.get_current_schedule_dict()
+        schedule["solution"]["applied solutions"] = self.applied_solutions
+        self.save_schedule(schedule, jobs={})
 
-    def single_instance_replan(self, warmstart:bool = False):
+    def pop_batch(self) -> list[QueueObject]:
+        """
+        Pops the next arrival and, with a batch_window, the following arrivals released at most batch_window after
+        the previous one. A batch holds at most max_batch_size arrivals released at most max_batch_latency after the first one.
+        """
+        batch = [self.task_queue.pop()]
+        while self.batch_window is not None and self.task_queue and (self.max_batch_size is None or len(batch) < self.max_batch_size):
+            release_time = self.task_queue.peek().release_time
+            if release_time - batch[-1].release_time > self.batch_window:
+                break
+            if self.max_batch_latency is not None and release_time - batch[0].release_time > self.max_batch_latency:
+                break
+            batch.append(self.task_queue.pop())
+        return batch
+
+    def apply_solution(self, queue_object:QueueObject, result:dict) -> bool:
+        """
+        Replaces the provisional placement of the instance of the queue object by the one of the solve
+        if its jobs do not overlap the jobs of the other instances, which may have been committed
+        after the snapshot of the solve, and if it does not end later. Other changes of the solve are ignored.
+        Returns whether the solution was applied.
+        """
+        os.remove(f"{self.schedule_filepath}.solve-{queue_object.schedule_idx}.json")
+        schedule = self.get_current_schedule_dict()
+        solved_ilp_rep = result["instances"][queue_object.schedule_idx]
+        solved_jobs = self.get_selected_jobs(solved_ilp_rep)
+        provisional_jobs = self.get_selected_jobs(schedule["instances"][queue_object.schedule_idx])
+        busy = defaultdict(list)
+        for idx, ilp_rep in enumerate(schedule["instances"]):
+            if idx != queue_object.schedule_idx:
+                for job in self.get_selected_jobs(ilp_rep).values():
+                    busy[job["resource"]].append((job["start"], job["start"] + job["cost"]))
+        for job in solved_jobs.values():
+            if any(start < job["start"] + job["cost"] and job["start"] < end for start, end in busy[job["resource"]]):
+                return False
+        solved_end = max(job["start"] + job["cost"] for job in solved_jobs.values())
+        if solved_end > max(job["start"] + job["cost"] for job in provisional_jobs.values()):
+            return False
+        solved_ilp_rep["fixed"] = True
+        schedule["instances"][queue_object.schedule_idx] = solved_ilp_rep
+        schedule["objective"] = max(job["start"] + job["cost"] for ilp_rep in schedule["instances"] for job in self.get_selected_jobs(ilp_rep).values())
+        self.save_schedule(schedule)
+        self.applied_solutions += 1
+        return True
+
+
+    def single_instance_replan(self):
         """
         Deprecated: 
         Allowed full replaning of scheduled instances.
         """
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
+            queue_object = self.task_queue.pop()
             schedule_dict = self.get_current_schedule_dict()
             instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
             schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
             schedule_dict["resources"] = list(set(schedule_dict["resources"]).union(instance_ilp_rep["resources"]))
-            if warmstart:
-                self.create_warmstart_file(schedule_dict, [queue_object])
+            warm_start = self.create_warmstart(schedule_dict, [queue_object]) if self.warmstart else None
             # set "fixed" to false for all instances
             for ra_pst in schedule_dict["instances"]:
                 ra_pst["fixed"] = False
@@ -280,10 +668,7 @@ class Simulator():
             # create extra online cp_solver method
             release_time = queue_object.release_time
 
-            if warmstart:
-                result = cp_solver(self.schedule_filepath, "tmp/warmstart.json")
-            else:
-                result = cp_solver_alternative_new(self.schedule_filepath, log_file=f"{self.schedule_filepath}.log", replan=True, release_time=release_time, timeout=100)
+            result = cp_solver_alternative_new(self.get_schedule_filepath(), warm_start_json=warm_start, log_file=f"{self.schedule_filepath}.log", replan=True, release_time=release_time, timeout=100)
             self.save_schedule(result)
 
 
@@ -291,37 +676,34 @@ class Simulator():
         """
         Allocates an instance that was previously configured through the ILP
         ILP configuration and scheduling is done in this method
+        With self.batch_window, the instances of a batch are scheduled together, see pop_batch.
         """
-        queue_object = self.task_queue.pop(0)
-        schedule_dict = self.get_current_schedule_dict()
-        instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
-        schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
-        self.save_schedule(schedule_dict)
-
-        # Get optimal configuration through ILP
-        result = configuration_ilp(self.schedule_filepath)
-        with open("tmp/ilp_rep.json", "w") as f:
-            json.dump(result, f, indent=2)
-
-        schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
-        self.save_schedule(schedule_dict)
-        schedule_dict = cp_solver_scheduling_only(self.schedule_filepath, timeout=self.time_limit, sigma=self.sigma)
-        schedule_dict["ilp_objective"] = result["objective"]
-        schedule_dict["ilp_runtime"] = result["runtime"]
-        self.save_schedule(schedule_dict)
-
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
+            self.save_state_if_due()
+            batch = self.pop_batch()
             schedule_dict = self.get_current_schedule_dict()
-            instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
-            schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
-            if different_instances:
-                with open("tmp/ilp_rep.json", "w") as f:
-                    json.dump(instance_ilp_rep, f, indent=2)
-                result = configuration_ilp("tmp/ilp_rep.json")
-            schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
+            for queue_object in batch:
+                instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
+                schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
+                if self.ilp_result is None:
+                    self.save_schedule(schedule_dict)
+                    # Get optimal configuration through ILP
+                    result = self.ilp_result = configuration_ilp(self.get_schedule_filepath())
+                    with open(self.workspace.path("tmp", "ilp_rep.json"), "w") as f:
+                        json.dump(result, f, indent=2)
+                elif different_instances:
+                    ilp_path = self.workspace.path("tmp", "ilp_rep.json")
+                    with open(ilp_path, "w") as f:
+                        json.dump(instance_ilp_rep, f, indent=2)
+                    result = configuration_ilp(ilp_path)
+                else:
+                    result = self.ilp_result
+                schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
             self.save_schedule(schedule_dict)
-            schedule_dict = cp_solver_scheduling_only(self.schedule_filepath, timeout=self.time_limit, sigma=self.sigma)
+            schedule_dict = cp_solver_scheduling_only(self.get_schedule_filepath(), log_file=self.workspace.path("cpo_solver.log"), timeout=self.time_limit, sigma=self.sigma)
+            if "ilp_objective" not in schedule_dict:
+                schedule_dict["ilp_objective"] = self.ilp_result["objective"]
+                schedule_dict["ilp_runtime"] = self.ilp_result["runtime"]
             self.save_schedule(schedule_dict)
     
 
@@ -329,13 +711,13 @@ class Simulator():
         """
         Schedules all instances simultaneously based on the optimal configuration found with ILP
         """
-        queue_object = self.task_queue.pop(0)
+        queue_object = self.task_queue.pop()
         schedule_dict = self.get_current_schedule_dict()
         instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
         schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
         self.save_schedule(schedule_dict)
-        result = configuration_ilp(self.schedule_filepath)
-        with open("tmp/ilp_rep.json", "w") as f:
+        result = configuration_ilp(self.get_schedule_filepath())
+        with open(self.workspace.path("tmp", "ilp_rep.json"), "w") as f:
             json.dump(result, f, indent=2)
         schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
         schedule_dict["ilp_objective"] = result["objective"]
@@ -343,21 +725,22 @@ class Simulator():
         self.save_schedule(schedule_dict)
 
         while self.task_queue:
-            queue_object = self.task_queue.pop(0)
+            queue_object = self.task_queue.pop()
             schedule_dict = self.get_current_schedule_dict()
             instance_ilp_rep = self.get_current_instance_ilp_rep(schedule_dict, queue_object)
             schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
             if different_instances:
-                with open("tmp/ilp_rep.json", "w") as f:
+                ilp_path = self.workspace.path("tmp", "ilp_rep.json")
+                with open(ilp_path, "w") as f:
                     json.dump(instance_ilp_rep, f, indent=2)
-                result = configuration_ilp("tmp/ilp_rep.json")
+                result = configuration_ilp(ilp_path)
             schedule_dict = self.ilp_to_schedule_file(result, schedule_dict, queue_object.instance.id)
             self.save_schedule(schedule_dict)
 
-        schedule_dict = cp_solver_scheduling_only(self.schedule_filepath, timeout=self.time_limit, sigma=self.sigma)
+        schedule_dict = cp_solver_scheduling_only(self.get_schedule_filepath(), log_file=self.workspace.path("cpo_solver.log"), timeout=self.time_limit, sigma=self.sigma)
         self.save_schedule(schedule_dict)
         
-    def all_instance_processing(self, warmstart:bool = False, decomposed:bool=False):
+    def all_instance_processing(self, decomposed:bool=False):
         """
         Schedules all instances simultaneously and also creates the optimal configurations. 
         Integrated CP for scheduling.
@@ -369,56 +752,55 @@ class Simulator():
             schedule_dict = self.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
             self.save_schedule(schedule_dict)
         
-        if warmstart:
-            self.create_warmstart_file(schedule_dict, self.task_queue)
-            result = cp_solver(self.schedule_filepath, "tmp/warmstart.json")
-        elif decomposed:
-            result = cp_solver_decomposed_strengthened_cuts(self.schedule_filepath, TimeLimit=self.time_limit)
+        warm_start = self.create_warmstart(schedule_dict, self.task_queue) if self.warmstart else None
+        if decomposed:
+            result = cp_solver_decomposed_strengthened_cuts(self.get_schedule_filepath(), warm_start_json=warm_start, TimeLimit=self.time_limit)
         else:
             _, logfile = os.path.split(os.path.basename(self.schedule_filepath))
-            result = cp_solver(self.schedule_filepath, log_file=f"{self.schedule_filepath}.log", timeout=self.time_limit, break_symmetries=False)
+            result = cp_solver(self.get_schedule_filepath(), warm_start_json=warm_start, log_file=f"{self.schedule_filepath}.log", timeout=self.time_limit, break_symmetries=False)
         self.save_schedule(result)
             
-    def create_warmstart_file(self, ra_psts:dict, queue_objects:list[QueueObject]):
-        with open("tmp/warmstart.json", "w") as f:
-            ra_psts.setdefault("objective", 0)
-            json.dump(ra_psts, f, indent=2)
-        
-        # Create new sim to create warmsstart file
-        sim = Simulator(schedule_filepath="tmp/warmstart.json", is_warmstart=True)
-        for queue_object in queue_objects:
-            sim.add_instance(queue_object.instance, AllocationTypeEnum.HEURISTIC)
-        sim.simulate()
-        print("Warmstart file created")
-
-    def update_task_queue(self, queue:list[QueueObject], queue_object: QueueObject):
-        # instance, allocation_type, task, release_time = task
-        queue.append(queue_object)
-        queue.sort(key=lambda object: object.release_time)
+    def create_warmstart(self, schedule_dict:dict, queue_objects:list[QueueObject]) -> dict:
+        """
+        Allocates the instances of the queue objects one after another with the heuristic 
+        on a copy of the schedule. The instances are copied, so the originals stay unallocated.
+        Returns the schedule dict to be used as starting point of the solvers.
+        """
+        warm_start = copy.deepcopy(schedule_dict)
+        for queue_object in sorted(queue_objects, key=lambda object: object.release_time):
+            instance = copy.deepcopy(queue_object.instance)
+            warm_start_object = QueueObject(instance, queue_object.schedule_idx, AllocationTypeEnum.HEURISTIC, instance.current_task, queue_object.release_time)
+            ilp_rep = warm_start["instances"][queue_object.schedule_idx]
+            for job in ilp_rep["jobs"].values():
+                job["selected"] = False
+            while instance.current_task != "end":
+                best_branch = instance.allocate_next_task(schedule_dict=warm_start)
+                ilp_rep = self.add_branch_to_ilp_rep(best_branch, ilp_rep, warm_start_object)
+                warm_start["objective"] = max(warm_start.get("objective", 0), sum(instance.times[-1]))
+        return warm_start
+
+    def update_task_queue(self, queue:EventQueue, queue_object: QueueObject):
+        queue.push(queue_object)
 
     def add_allocation_metadata(self, computing_time: float):
-        with open(self.schedule_filepath, "r+") as f:
-            ra_psts = json.load(f)
-            intervals = []
-            for ra_pst in ra_psts["instances"]:
-                for jobId, job in ra_pst["jobs"].items():
-                    if job["selected"]:
-                        intervals.append({
-                            "jobId": jobId,
-                            "start": job["start"],
-                            "duration": job["cost"]
-                        })
-            total_interval_length = sum(
-                [element["duration"] for element in intervals])
-            ra_psts["solution"] = {
-                "objective": ra_psts["objective"],
-                "computing time": computing_time,
-                "total interval length": total_interval_length
-            }
-            # Save back to file
-            f.seek(0)  # Reset file pointer to the beginning
-            json.dump(ra_psts, f, indent=2)
-            f.truncate()
+        ra_psts = self.get_current_schedule_dict()
+        intervals = []
+        for ra_pst in ra_psts["instances"]:
+            for jobId, job in ra_pst["jobs"].items():
+                if job["selected"]:
+                    intervals.append({
+                        "jobId": jobId,
+                        "start": job["start"],
+                        "duration": job["cost"]
+                    })
+        total_interval_length = sum(
+            [element["duration"] for element in intervals])
+        ra_psts["solution"] = {
+            "objective": ra_psts["objective"],
+            "computing time": computing_time,
+            "total interval length": total_interval_length
+        }
+        self.save_schedule(ra_psts, jobs={})
     
     def ilp_to_schedule_file(self, ilp_rep, schedule_dict, instance_id):
         selected_branches = [branch for branchId, branch in ilp_rep["branches"].items() if branch["selected"] == 1.0]
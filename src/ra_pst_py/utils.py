@@ -1,4 +1,5 @@
 from lxml import etree
+import json
 
 def get_label(element):
 
@@ -11,6 +12,13 @@ def get_label(element):
     else:
         raise TypeError("Wrong Element Type: No Task element Given. Type is: ", elem_etree.tag)
     
+def load_json(json_file) -> dict:
+    """ Returns the content of a json file. A dict is returned as it is."""
+    if isinstance(json_file, dict):
+        return json_file
+    with open(json_file, "r") as f:
+        return json.load(f)
+    
 def get_allowed_roles(element):
     elem_et = etree.fromstring(element)
     ns = {"cpee1" : list(elem_et.nsmap.values())[0]}
@@ -0,0 +1,199 @@
+import json
+import os
+import socket
+import threading
+import time
+import traceback
+import uuid
+from typing import Callable
+
+
+class WorkQueue():
+    """
+    Work queue in a directory on a filesystem shared by the workers, without a broker.
+
+    root/tasks/{task_id}.json holds the tasks put by the coordinator,
+    root/leases/{task_id}.lease is created exclusively by the worker that claims a task and touched while it runs,
+    root/results/{task_id}.json holds the result of a finished task.
+    A lease that was not touched for lease_seconds belongs to a dead worker and is removed by requeue_stale.
+    """
+    def __init__(self, root:os.PathLike | str, lease_seconds:float=600):
+        # Absolute, so the queue does not depend on the working directory of a worker
+        root = os.path.abspath(root)
+        self.root = root
+        self.lease_seconds = lease_seconds
+        self.tasks_dir = os.path.join(root, "tasks")
+        self.leases_dir = os.path.join(root, "leases")
+        self.results_dir = os.path.join(root, "results")
+        for directory in (self.tasks_dir, self.leases_dir, self.results_dir):
+            os.makedirs(directory, exist_ok=True)
+
+    def task_path(self, task_id:str) -> str:
+        return os.path.join(self.tasks_dir, f"{task_id}.json")
+
+    def lease_path(self, task_id:str) -> str:
+        return os.path.join(self.leases_dir, f"{task_id}.lease")
+
+    def result_path(self, task_id:str) -> str:
+        return os.path.join(self.results_dir, f"{task_id}.json")
+
+    def put(self, task_id:str, task:dict) -> bool:
+        """
+        Adds a JSON serializable task, returns False if it is already queued.
+        Raises a ValueError if a different task is queued with the same id.
+        """
+        try:
+            with open(self.task_path(task_id), "r") as f:
+                queued_task = json.load(f)
+        except FileNotFoundError:
+            write_json(self.task_path(task_id), task)
+            return True
+        if queued_task != json.loads(json.dumps(task)):
+            raise ValueError(f"Task <{task_id}> is already queued with different content")
+        return False
+
+    def get_task_ids(self) -> list[str]:
+        return sorted(file[:-len(".json")] for file in os.listdir(self.tasks_dir) if file.endswith(".json"))
+
+    def claim(self, worker_id:str) -> tuple[str, dict] | None:
+        """ Claims the first task without result and lease, returns (task_id, task) or None if there is none """
+        for task_id in self.get_task_ids():
+            if os.path.exists(self.result_path(task_id)):
+                continue
+            try:
+                fd = os.open(self.lease_path(task_id), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(worker_id)
+            # The result may have been written between the check and the lease
+            if os.path.exists(self.result_path(task_id)):
+                self.release(task_id, worker_id)
+                continue
+            try:
+                with open(self.task_path(task_id), "r") as f:
+                    return task_id, json.load(f)
+            except FileNotFoundError:
+                self.release(task_id, worker_id)
+        return None
+
+    def get_lease_owner(self, task_id:str) -> str | None:
+        try:
+            with open(self.lease_path(task_id), "r") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def heartbeat(self, task_id:str, worker_id:str) -> bool:
+        """ Renews the lease of worker_id on task_id, returns False if the lease was lost """
+        if self.get_lease_owner(task_id) != worker_id:
+            return False
+        try:
+            os.utime(self.lease_path(task_id))
+        except FileNotFoundError:
+            # Removed by requeue_stale after the check
+            return False
+        return True
+
+    def release(self, task_id:str, worker_id:str) -> None:
+        """ Removes the lease of worker_id, the task can be claimed again unless it has a result """
+        if self.get_lease_owner(task_id) == worker_id:
+            try:
+                os.remove(self.lease_path(task_id))
+            except FileNotFoundError:
+                pass
+
+    def complete(self, task_id:str, worker_id:str, result) -> bool:
+        """
+        Writes the result of task_id and releases its lease, returns False if the result was not written:
+        worker_id lost its lease or another worker finished the task first. The first result is kept.
+        """
+        if self.get_lease_owner(task_id) != worker_id:
+            return False
+        temp_filepath = write_json(f"{self.result_path(task_id)}.{uuid.uuid4().hex}.tmp", {"worker": worker_id, "result": result})
+        try:
+            # Unlike a rename, a link does not replace an existing result
+            os.link(temp_filepath, self.result_path(task_id))
+            written = True
+        except FileExistsError:
+            written = False
+        os.remove(temp_filepath)
+        self.release(task_id, worker_id)
+        return written
+
+    def get_result(self, task_id:str) -> dict | None:
+        try:
+            with open(self.result_path(task_id), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def requeue_stale(self) -> list[str]:
+        """ Removes leases that were not renewed for lease_seconds, returns the ids of the requeued tasks """
+        requeued = []
+        for file in os.listdir(self.leases_dir):
+            if not file.endswith(".lease"):
+                continue
+            lease_path = os.path.join(self.leases_dir, file)
+            try:
+                if time.time() - os.path.getmtime(lease_path) < self.lease_seconds:
+                    continue
+                # Only one of several workers can move the stale lease away
+                stale_path = f"{lease_path}.{uuid.uuid4().hex}.stale"
+                os.rename(lease_path, stale_path)
+            except FileNotFoundError:
+                continue
+            os.remove(stale_path)
+            requeued.append(file[:-len(".lease")])
+        return requeued
+
+    def is_finished(self) -> bool:
+        return all(os.path.exists(self.result_path(task_id)) for task_id in self.get_task_ids())
+
+
+def write_json(filepath:str, data) -> str:
+    """ Writes data to filepath atomically, readers never see a partial file """
+    temp_filepath = f"{filepath}.{uuid.uuid4().hex}.tmp"
+    with open(temp_filepath, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(temp_filepath, filepath)
+    return filepath
+
+
+def get_worker_id() -> str:
+    return f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+
+def run_worker(queue:WorkQueue, run_task:Callable[[str, dict], object], worker_id:str=None, poll_seconds:float=5) -> int:
+    """
+    Claims and runs tasks of the queue until all of them have a result, returns the number of tasks run.
+    The lease is renewed every lease_seconds / 3 while run_task runs.
+    A task that raises gets its traceback as result with "error", so the other tasks still finish.
+    """
+    worker_id = worker_id or get_worker_id()
+    num_tasks = 0
+    while not queue.is_finished():
+        claimed = queue.claim(worker_id)
+        if claimed is None:
+            # Remaining tasks are leased by other workers, take over those of dead workers
+            if not queue.requeue_stale():
+                time.sleep(poll_seconds)
+            continue
+        task_id, task = claimed
+        stop = threading.Event()
+        def renew():
+            while not stop.wait(queue.lease_seconds / 3):
+                if not queue.heartbeat(task_id, worker_id):
+                    return
+        heartbeat = threading.Thread(target=renew, daemon=True)
+        heartbeat.start()
+        try:
+            result = run_task(task_id, task)
+        except Exception:
+            result = {"error": traceback.format_exc()}
+        finally:
+            stop.set()
+            heartbeat.join()
+        queue.complete(task_id, worker_id, result)
+        num_tasks += 1
+    return num_tasks
@@ -0,0 +1,37 @@
+import os
+import shutil
+import tempfile
+
+
+class Workspace():
+    """
+    Directory for the working files of a run, e.g. the ILP input tmp/ilp_rep.json or debug dumps like branch_raw.xml.
+    Paths are relative to root, by default to the current working directory as before.
+    A temporary workspace gets a new directory in root, by default on tmpfs (/dev/shm) where it exists,
+    which is removed by cleanup().
+    """
+    def __init__(self, root:os.PathLike | str = None, temporary:bool=False):
+        if temporary:
+            if root is None and os.path.isdir("/dev/shm"):
+                root = "/dev/shm"
+            root = tempfile.mkdtemp(prefix="ra_pst_", dir=root)
+        self.root = root
+        self.temporary = temporary
+
+    def path(self, *parts:str) -> str:
+        """ Returns the path of a file in the workspace, its directory is created if necessary """
+        path = os.path.join(self.root, *parts) if self.root is not None else os.path.join(*parts)
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return path
+
+    def directory(self, *parts:str) -> str:
+        """ Returns the path of a directory in the workspace and creates it if necessary """
+        path = os.path.join(self.root, *parts) if self.root is not None else os.path.join(*parts)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def cleanup(self) -> None:
+        if self.temporary:
+            shutil.rmtree(self.root, ignore_errors=True)
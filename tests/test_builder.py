@@ -1,4 +1,5 @@
 from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
+from src.ra_pst_py.workspace import Workspace
 import unittest
 from lxml import etree
 
@@ -14,6 +15,10 @@ class BuilderTest(unittest.TestCase):
             process_file="tests/test_data/test_process_2_tasks.xml",
             resource_file="tests/test_data/test_resource_entropy.xml"
         )
+        self.workspace = Workspace(temporary=True)
+
+    def tearDown(self):
+        self.workspace.cleanup()
     
     def test_build_rapst(self):
         target = etree.parse("tests/test_comparison_data/allocation.xml")
@@ -30,7 +35,7 @@ class BuilderTest(unittest.TestCase):
         target = etree.parse("tests/test_comparison_data/allocation.xml")
         ra_pst = build_rapst(process_file="testsets/10_generated/process/BPM_TestSet_10.xml", resource_file="testsets/10_generated/resources/(0.6, 0.4, 0.0)-random-3-uniform-normal-10.xml")
         
-        show_tree_as_graph(ra_pst)
+        show_tree_as_graph(ra_pst, workspace=self.workspace)
         tightness = ra_pst.get_resource_tightness()
         print(tightness)
         #ra_pst.save_ra_pst("tests/outcome/build_ra_pst.xml")
@@ -40,7 +45,7 @@ class BuilderTest(unittest.TestCase):
 
     def test_enthropy(self):
         ra_pst = self.ra_pst
-        show_tree_as_graph(ra_pst)
+        show_tree_as_graph(ra_pst, workspace=self.workspace)
         print(ra_pst.get_enthropy())
 
     
@@ -51,4 +56,4 @@ class BuilderTest(unittest.TestCase):
         )
 
         print(ra_pst.get_problem_size())
-        show_tree_as_graph(ra_pst)
\ No newline at end of file
+        show_tree_as_graph(ra_pst, workspace=self.workspace)
@@ -0,0 +1,65 @@
+from src.ra_pst_py.builder import build_rapst
+from src.ra_pst_py.array_heuristic import ProblemTable, ArrayHeuristic
+from src.ra_pst_py.compaction import left_shift_schedule
+
+import unittest
+import copy
+
+
+def create_job(resource, start, cost, after=[], release_time=0):
+    return {"branch": "b", "resource": resource, "cost": cost, "after": after, "release_time": release_time, "start": start, "selected": True}
+
+
+class CompactionTest(unittest.TestCase):
+
+    def test_left_shift(self):
+        schedule = {"instances": [{"jobs": {
+            "j1": create_job("r1", 0, 2),
+            "j2": create_job("r1", 5, 3, after=["j1"]),
+            "j3": create_job("r2", 10, 2, after=["j2"]),
+            "j4": create_job("r2", 5, 1, release_time=3),
+            "j5": create_job("r1", 12, 1, release_time=3),
+        }}], "resources": ["r1", "r2"], "objective": 13}
+        schedule["instances"][0]["jobs"]["j4"]["fixed"] = True
+
+        result = left_shift_schedule(schedule)
+        jobs = result["instances"][0]["jobs"]
+        self.assertEqual(jobs["j2"]["start"], 2)
+        # j3 waits for j2 and must not overlap the frozen j4
+        self.assertEqual(jobs["j3"]["start"], 6)
+        self.assertEqual(jobs["j4"]["start"], 5)
+        # j5 is released at 3 and fits behind j2
+        self.assertEqual(jobs["j5"]["start"], 5)
+        self.assertEqual(result["objective"], 8)
+        self.assertEqual(result["solution"]["total interval length"], 9)
+
+    def test_frozen_before(self):
+        schedule = {"instances": [{"jobs": {
+            "j1": create_job("r1", 3, 2),
+            "j2": create_job("r1", 8, 2),
+        }}], "resources": ["r1"], "objective": 10}
+        result = left_shift_schedule(schedule, frozen_before=4)
+        self.assertEqual(result["instances"][0]["jobs"]["j1"]["start"], 3)
+        # j2 has not started at 4 and moves right after j1, not into the past
+        self.assertEqual(result["instances"][0]["jobs"]["j2"]["start"], 5)
+
+    def test_heuristic_schedule(self):
+        ra_pst = build_rapst(
+            process_file="testsets_final_online/10_generated/process/BPM_TestSet_10.xml",
+            resource_file="testsets_final_online/10_generated/resources/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml"
+        )
+        engine = ArrayHeuristic(ProblemTable(ra_pst))
+        engine.add_instances([0, 0, 5, 12])
+        engine.simulate()
+        schedule = engine.get_schedule_dict()
+        result = left_shift_schedule(copy.deepcopy(schedule))
+        self.assertLessEqual(result["objective"], schedule["objective"])
+        for instance, compacted_instance in zip(schedule["instances"], result["instances"]):
+            for job_id, job in instance["jobs"].items():
+                if job["selected"]:
+                    self.assertLessEqual(compacted_instance["jobs"][job_id]["start"], job["start"])
+                    self.assertGreaterEqual(compacted_instance["jobs"][job_id]["start"], instance["release_time"])
+
+
+if __name__ == "__main__":
+    unittest.main()
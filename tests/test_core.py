@@ -3,6 +3,8 @@ from src.ra_pst_py.file_parser import parse_process_file, parse_resource_file
 from src.ra_pst_py.instance import Instance
 
 import unittest
+import tempfile
+import os
 from lxml import etree
 from collections import defaultdict
 import warnings
@@ -52,7 +54,8 @@ class CoreTest(unittest.TestCase):
         ra_pst.branches = defaultdict(list)
         task = ra_pst.get_tasklist()[0]
         ra_pst.set_branches_for_task(task)
-        ra_pst.save_ra_pst("branches.xml")
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            ra_pst.save_ra_pst(os.path.join(tmp_dir, "branches.xml"))
         self.assertEqual(len(ra_pst.branches["a1"]), 3)
 
     def test_get_serialized_jobs(self):
@@ -74,6 +77,19 @@ class CoreTest(unittest.TestCase):
         self.assertEqual(ser_jobs[0][1], "4")
         self.assertEqual(deletes[0], "wait")
 
+    def test_task_tables(self):
+        process = parse_process_file("testsets_final_online/10_generated/process/BPM_TestSet_10.xml")
+        resources = parse_resource_file("testsets_final_online/10_generated/resources/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml")
+        ra_pst = RA_PST(process, resources)
+        tasklist = ra_pst.get_tasklist(attribute="id")
+
+        task_positions = ra_pst.get_task_positions()
+        self.assertEqual([task_positions[task_id] for task_id in tasklist], list(range(len(tasklist))))
+        self.assertEqual(ra_pst.get_task_ids_by_label()["a3"], ["a3"])
+        min_branch_costs = ra_pst.get_min_branch_costs()
+        for task_id, branches in ra_pst.branches.items():
+            self.assertEqual(min_branch_costs[task_id], sorted([branch.get_branch_costs() for branch in branches])[0])
+
     def test_get_branches_ilp(self):
         process = parse_process_file("example_data/test_process_cpee.xml")
         resources = parse_resource_file("example_data/test_resource.xml")
@@ -2,11 +2,13 @@ from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
 from src.ra_pst_py.instance import transform_ilp_to_branches, Instance
 from src.ra_pst_py.brute_force import BruteForceSearch
 from src.ra_pst_py.cp_google_or import conf_cp, conf_cp_scheduling
-from src.ra_pst_py.cp_docplex import cp_solver, cp_solver_decomposed
+from src.ra_pst_py.cp_docplex import cp_solver, cp_solver_decomposed, build_cp_model
 from src.ra_pst_py.cp_docplex_decomposed import cp_solver_decomposed_monotone_cuts, cp_solver_decomposed_strengthened_cuts
 from src.ra_pst_py.ilp import configuration_ilp
+from src.ra_pst_py.workspace import Workspace
 
 from lxml import etree
+from io import StringIO
 import unittest
 import json
 
@@ -15,6 +17,9 @@ import json
 class CPTest(unittest.TestCase):
 
     def setUp(self):
+        self.workspace = Workspace(temporary=True)
+        self.addCleanup(self.workspace.cleanup)
+        self.ilp_rep_path = self.workspace.path("ilp_rep.json")
         # Initialize shared variables for tests
         self.ra_pst = build_rapst(
             process_file="test_instances/paper_process_short.xml",
@@ -23,7 +28,7 @@ class CPTest(unittest.TestCase):
 
 
         ilp_rep = self.ra_pst.get_ilp_rep()
-        with open("tests/test_data/ilp_rep.json", "w") as f:
+        with open(self.ilp_rep_path, "w") as f:
             json.dump(ilp_rep, f, indent=2)
             f.close()
     
@@ -36,7 +41,7 @@ class CPTest(unittest.TestCase):
 
     def test_cp_sched(self):
         #show_tree_as_graph(self.ra_pst)
-        result = conf_cp_scheduling("tests/test_data/ilp_rep.json")
+        result = conf_cp_scheduling(self.ilp_rep_path)
         with open("out/cp_result.json", "w") as f:
             json.dump(result, f, indent=2)
         #print([branch for branch in result["branches"] if branch["selected"] == 1])
@@ -47,6 +52,9 @@ class CPTest(unittest.TestCase):
 
 class DocplexTest(unittest.TestCase):
     def setUp(self):
+        self.workspace = Workspace(temporary=True)
+        self.addCleanup(self.workspace.cleanup)
+        self.ilp_rep_path = self.workspace.path("ilp_rep.json")
         # Initialize shared variables for tests
         self.ra_pst = build_rapst(
             process_file="test_instances/paper_process_short.xml",
@@ -68,13 +76,13 @@ class DocplexTest(unittest.TestCase):
         ilp_dict = {"instances" : []}
         ilp_dict["instances"].append(ilp_rep)
         ilp_dict["resources"] = ilp_rep["resources"]
-        with open("tests/test_data/ilp_rep.json", "w") as f:
+        with open(self.ilp_rep_path, "w") as f:
             json.dump(ilp_dict, f, indent=2)
             f.close()
     
     def test_cp(self):
         self.setUp()
-        result = cp_solver_decomposed("tests/test_data/ilp_rep.json")
+        result = cp_solver_decomposed(self.ilp_rep_path)
         # print([branch for branch in result["branches"] if branch["selected"] == 1])
         print(result["solution"]["objective"])
         with open("tests/test_data/cp_result.json", "w") as f:
@@ -92,9 +100,9 @@ class DocplexTest(unittest.TestCase):
 
             ra_psts["instances"].append(ilp_rep)
         ra_psts["resources"] = ilp_rep["resources"]
-        with open("tests/test_data/ilp_rep.json", "w") as f:
+        with open(self.ilp_rep_path, "w") as f:
             json.dump(ra_psts, f, indent=2)
-        result = cp_solver("tests/test_data/ilp_rep.json", TimeLimit=300)
+        result = cp_solver(self.ilp_rep_path, TimeLimit=300)
         # print([branch for branch in result["branches"] if branch["selected"] == 1])
         print(result["solution"]["objective"])
         with open("tests/test_data/cp_result.json", "w") as f:
@@ -104,21 +112,21 @@ class DocplexTest(unittest.TestCase):
         self.setUp()
         ra_psts = {}
         ra_psts["instances"] = []
-        show_tree_as_graph(self.ra_pst)
+        show_tree_as_graph(self.ra_pst, workspace=self.workspace)
         print(f"Problem Size: {self.ra_pst.get_problem_size()}")
         for i in range(5):
             ilp_rep = self.ra_pst.get_ilp_rep(instance_id=f'i{i+1}')
 
             ra_psts["instances"].append(ilp_rep)
         ra_psts["resources"] = ilp_rep["resources"]
-        with open("tests/test_data/ilp_rep.json", "w") as f:
+        with open(self.ilp_rep_path, "w") as f:
             json.dump(ra_psts, f, indent=2)
-        result = cp_solver_decomposed_monotone_cuts("tests/test_data/ilp_rep.json", TimeLimit=50)
+        result = cp_solver_decomposed_monotone_cuts(self.ilp_rep_path, TimeLimit=50)
         print(result["solution"]["objective"])
         with open("tests/test_data/cp_result.json", "w") as f:
             json.dump(result, f, indent=2)
         
-        result = cp_solver_decomposed_strengthened_cuts("tests/test_data/ilp_rep.json", TimeLimit=50)
+        result = cp_solver_decomposed_strengthened_cuts(self.ilp_rep_path, TimeLimit=50)
         print(result["solution"]["objective"])
         with open("tests/test_data/cp_result2.json", "w") as f:
             json.dump(result, f, indent=2)
@@ -164,10 +172,51 @@ class DocplexTest(unittest.TestCase):
 
     def test_ilp(self):
         ilp_rep = self.ra_pst.get_ilp_rep()
-        show_tree_as_graph(self.ra_pst)
-        with open("test.json" , "w") as f:
+        show_tree_as_graph(self.ra_pst, workspace=self.workspace)
+        with open(self.workspace.path("test.json"), "w") as f:
             json.dump(ilp_rep, f, indent=2)
-        result = configuration_ilp("test.json")
-        with open("test.json", "w") as f:
+        result = configuration_ilp(self.workspace.path("test.json"))
+        with open(self.workspace.path("test.json"), "w") as f:
             json.dump(result, f, indent=2)
 
+
+class RollingHorizonTest(unittest.TestCase):
+    def get_ra_psts(self):
+        # Fixed instance with jobs ending before (j0) and in (j1) the window from the release time 10 of instance 1
+        fixed_jobs = {
+            "j0": {"branch": "b0", "resource": "r1", "cost": 5, "after": [], "instance": 0, "release_time": 0, "selected": True, "start": 0},
+            "j1": {"branch": "b1", "resource": "r1", "cost": 10, "after": ["j0"], "instance": 0, "release_time": 0, "selected": True, "start": 5},
+            "j2": {"branch": "b2", "resource": "r2", "cost": 3, "after": [], "instance": 0, "release_time": 0, "selected": False, "start": None},
+        }
+        new_jobs = {
+            "k0": {"branch": "c0", "resource": "r1", "cost": 4, "after": [], "instance": 1, "release_time": 10, "selected": False, "start": None},
+        }
+        return {
+            "resources": ["r1", "r2"],
+            "instances": [
+                {"fixed": True, "jobs": fixed_jobs, "branches": {}, "tasks": {}},
+                {"fixed": False, "jobs": new_jobs, "branches": {"c0": {"task": "t0", "jobs": ["k0"], "deletes": []}}, "tasks": {"t0": {"branches": ["c0"]}}},
+            ],
+        }
+
+    def test_frozen_jobs(self):
+        ra_psts = self.get_ra_psts()
+        model, fixed_intervals = build_cp_model(ra_psts, sigma=0, rolling_horizon=True)
+        # With sigma = 0, no interval of the fixed instance is modeled, j1 blocks r1 in [5, 15)
+        self.assertEqual(fixed_intervals, 0)
+        self.assertEqual([var.get_name() for var in model.get_all_variables()], ["k0"])
+        cpo = StringIO()
+        model.export_as_cpo(out=cpo)
+        self.assertEqual(cpo.getvalue().count("forbidExtent("), 1)
+        self.assertIn("forbidExtent(k0, stepFunction((0, 100), (5, 0), (15, 100)))", cpo.getvalue())
+
+    def test_movable_jobs(self):
+        ra_psts = self.get_ra_psts()
+        model, fixed_intervals = build_cp_model(ra_psts, sigma=2, rolling_horizon=True)
+        # With sigma = 2, only j0 cannot reach the window, j1 can still move by sigma
+        self.assertEqual(fixed_intervals, 1)
+        self.assertEqual(sorted(var.get_name() for var in model.get_all_variables()), ["j1", "k0"])
+        self.assertEqual(ra_psts["instances"][0]["jobs"]["j1"]["interval"].get_start(), (5, 7))
+        cpo = StringIO()
+        model.export_as_cpo(out=cpo)
+        self.assertNotIn("forbidExtent(", cpo.getvalue())
@@ -0,0 +1,388 @@
+from src.ra_pst_py.builder import build_rapst
+from src.ra_pst_py.simulator import Simulator, AllocationTypeEnum, QueueObject, EventQueue
+from src.ra_pst_py.instance import Instance
+from src.ra_pst_py.schedule import Timeline, TimelineOverlay, ArrayTimeline, ScheduleStore, ScheduleJournal
+from src.ra_pst_py.array_heuristic import ProblemTable, ArrayHeuristic
+from src.ra_pst_py.local_search import LocalSearch, get_initial_solution
+from src.ra_pst_py.event_simulation import EventSimulation, poisson_arrivals, jsonl_arrivals, replay_arrivals
+from src.ra_pst_py.workspace import Workspace
+from src.ra_pst_py.dispatching import DispatchingHeuristic, DispatchRuleEnum
+from src.ra_pst_py.checkpoint import save_state, load_state
+
+from unittest import mock
+import unittest
+import tempfile
+import json
+import copy
+import os
+import random
+import time
+from collections import defaultdict
+
+
+class HeuristicTest(unittest.TestCase):
+    def setUp(self):
+        # Initialize shared variables for tests
+        self.ra_pst = build_rapst(
+            process_file="testsets_final_online/10_generated/process/BPM_TestSet_10.xml",
+            resource_file="testsets_final_online/10_generated/resources/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml"
+        )
+        self.release_times = [0, 0, 5, 12]
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workspace = Workspace(self.tmp_dir.name)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def simulate(self, allocation_type:AllocationTypeEnum, **simulator_kwargs) -> dict:
+        schedule_filepath = os.path.join(self.tmp_dir.name, f"{allocation_type}.json")
+        sim = Simulator(schedule_filepath=schedule_filepath, sigma=0, time_limit=10, workspace=self.workspace, **simulator_kwargs)
+        for i, release_time in enumerate(self.release_times):
+            instance = Instance(copy.deepcopy(self.ra_pst), {}, id=i, release_time=release_time)
+            sim.add_instance(instance, allocation_type)
+        sim.simulate()
+        with open(schedule_filepath, "r") as f:
+            return json.load(f)
+
+    def assertNoOverlaps(self, schedule:dict):
+        intervals = defaultdict(list)
+        for instance in schedule["instances"]:
+            for job in instance["jobs"].values():
+                if job["selected"]:
+                    intervals[job["resource"]].append((job["start"], job["start"] + job["cost"]))
+        for resource, resource_intervals in intervals.items():
+            resource_intervals.sort()
+            for (_, end), (start, _) in zip(resource_intervals, resource_intervals[1:]):
+                self.assertLessEqual(end, start, f"Overlapping jobs on {resource}")
+
+    def test_timeline_earliest_start(self):
+        timeline = Timeline()
+        self.assertEqual(timeline.get_earliest_start("r1", 3, 5), 3)
+        timeline.add_job("r1", 0, 4)
+        timeline.add_job("r1", 10, 5)
+        # Slot between both jobs is used if it is long enough
+        self.assertEqual(timeline.get_earliest_start("r1", 0, 6), 4)
+        # Too short for the gap, placed after the last job
+        self.assertEqual(timeline.get_earliest_start("r1", 0, 7), 15)
+        # Jobs that end before the release time are ignored
+        self.assertEqual(timeline.get_earliest_start("r1", 16, 2), 16)
+        self.assertEqual(timeline.get_earliest_start("r2", 1, 2), 1)
+
+    def test_timeline_versions(self):
+        timeline = Timeline()
+        version = timeline.get_resource_version("r1")
+        timeline.add_job("r1", 0, 4)
+        self.assertNotEqual(timeline.get_resource_version("r1"), version)
+        self.assertEqual(timeline.get_resource_version("r2"), (timeline.id, 0))
+        # Timelines with the same jobs count do not share versions
+        other = Timeline()
+        other.add_job("r1", 5, 4)
+        self.assertNotEqual(other.get_resource_version("r1"), timeline.get_resource_version("r1"))
+        overlay = TimelineOverlay(timeline)
+        version = overlay.get_resource_version("r1")
+        overlay.add_job("r1", 10, 1)
+        self.assertNotEqual(overlay.get_resource_version("r1"), version)
+        timeline.add_job("r1", 20, 1)
+        self.assertNotEqual(overlay.with_jobs([]).get_resource_version("r1"), overlay.get_resource_version("r1"))
+
+    def test_array_timeline(self):
+        rng = random.Random(42)
+        timeline, array_timeline = Timeline(), ArrayTimeline()
+        for _ in range(200):
+            resource, release_time, duration = rng.choice(["r1", "r2"]), rng.randint(0, 100), rng.randint(0, 10)
+            start = timeline.get_earliest_start(resource, release_time, duration)
+            self.assertEqual(start, array_timeline.get_earliest_start(resource, release_time, duration))
+            timeline.add_job(resource, start, duration)
+            array_timeline.add_job(resource, start, duration)
+        self.assertEqual(list(timeline.get_resource_intervals("r1")), array_timeline.get_resource_intervals("r1"))
+
+    def test_concurrent_branch_evaluation(self):
+        sequential = self.simulate(AllocationTypeEnum.HEURISTIC)
+        concurrent = self.simulate(AllocationTypeEnum.HEURISTIC, max_workers=4)
+        self.assertEqual(sequential["instances"], concurrent["instances"])
+        self.assertEqual(sequential["objective"], concurrent["objective"])
+
+    def test_evaluation_cache(self):
+        self.release_times = [0, 0, 0, 5]
+        expected = self.simulate(AllocationTypeEnum.HEURISTIC, memoize=False)
+        engine = ArrayHeuristic(ProblemTable(self.ra_pst), memoize=True)
+        engine.add_instances(self.release_times)
+        engine.simulate()
+        schedule = json.loads(json.dumps(engine.get_schedule_dict()))
+        self.assertEqual(schedule["instances"], expected["instances"])
+        self.assertGreater(engine.evaluation_cache.hits, 0)
+        memoized = self.simulate(AllocationTypeEnum.HEURISTIC)
+        self.assertEqual(memoized["instances"], expected["instances"])
+
+    def test_array_heuristic(self):
+        expected = self.simulate(AllocationTypeEnum.HEURISTIC)
+        engine = ArrayHeuristic(ProblemTable(self.ra_pst))
+        engine.add_instances(self.release_times)
+        engine.simulate()
+        schedule = json.loads(json.dumps(engine.get_schedule_dict()))
+        self.assertEqual(schedule["instances"], expected["instances"])
+        self.assertEqual(schedule["objective"], expected["objective"])
+
+    def test_event_simulation(self):
+        table = ProblemTable(self.ra_pst)
+        release_times = list(poisson_arrivals(5, count=12, seed=3))
+        engine = ArrayHeuristic(table)
+        engine.add_instances(release_times)
+        engine.simulate()
+
+        completed = []
+        simulation = EventSimulation(table, iter(release_times), on_complete=completed.append, keep_instances=True)
+        simulation.simulate(until=release_times[5])
+        self.assertLess(simulation.n_arrivals, len(release_times))
+        simulation.simulate()
+        self.assertEqual(simulation.get_schedule_dict()["instances"], engine.get_schedule_dict()["instances"])
+        self.assertEqual(simulation.objective, engine.objective)
+        self.assertEqual(len(completed), len(release_times))
+        # Completed instances are retired
+        self.assertFalse(simulation.engine.allocations)
+        self.assertEqual(simulation.n_active_instances, 0)
+        with self.assertRaises(ValueError):
+            engine.activate_instance(0)
+        self.assertLessEqual(simulation.max_active_instances, len(release_times))
+
+        arrivals_filepath = os.path.join(self.tmp_dir.name, "arrivals.jsonl")
+        with open(arrivals_filepath, "w") as f:
+            f.write("\n".join(json.dumps({"release_time": release_time}) for release_time in release_times))
+        self.assertEqual(list(jsonl_arrivals(arrivals_filepath)), release_times)
+        self.assertEqual(list(replay_arrivals(release_times[::-1])), release_times)
+        with self.assertRaises(ValueError):
+            EventSimulation(table, release_times[::-1]).simulate()
+
+    def test_multi_start_heuristic(self):
+        greedy = self.simulate(AllocationTypeEnum.HEURISTIC)
+        multi_start = self.simulate(AllocationTypeEnum.MULTI_START_HEURISTIC, multi_starts=4, multi_start_budget=60, multi_start_workers=2)
+        self.assertNoOverlaps(multi_start)
+        self.assertLessEqual(multi_start["objective"], greedy["objective"])
+        # Variants stop at the deadline
+        engine = ArrayHeuristic(ProblemTable(self.ra_pst))
+        engine.add_instances(self.release_times)
+        self.assertFalse(engine.simulate(deadline=time.time() - 1))
+        self.assertTrue(engine.queue)
+        for instance in multi_start["instances"]:
+            self.assertTrue(any(job["selected"] for job in instance["jobs"].values()))
+
+    def test_event_queue(self):
+        queue_objects = [QueueObject(None, schedule_idx, AllocationTypeEnum.HEURISTIC, None, release_time)
+                         for schedule_idx, release_time in enumerate([5, 0, 5, 3])]
+        queue = EventQueue(queue_objects[2:])
+        queue.push_all(queue_objects[:2])
+        # Ties by schedule_idx
+        self.assertEqual([queue_object.schedule_idx for queue_object in queue], [1, 3, 0, 2])
+        self.assertIs(queue.peek(), queue_objects[1])
+        self.assertEqual(queue.peek(2), [queue_objects[1], queue_objects[3]])
+
+        queue.cancel(queue_objects[3])
+        self.assertNotIn(queue_objects[3], queue)
+        self.assertEqual(len(queue), 3)
+        self.assertIs(queue.pop(), queue_objects[1])
+        self.assertIs(queue.pop(), queue_objects[0])
+        queue_objects[1].release_time = 5
+        queue.push(queue_objects[1])
+        self.assertEqual([queue.pop().schedule_idx for _ in range(len(queue))], [1, 2])
+        self.assertFalse(queue)
+        with self.assertRaises(IndexError):
+            queue.pop()
+
+    def test_pop_batch(self):
+        sim = Simulator(os.path.join(self.tmp_dir.name, "batch.json"), sigma=0, time_limit=1, batch_window=2, max_batch_size=3, max_batch_latency=3)
+        sim.task_queue.push_all([QueueObject(None, schedule_idx, AllocationTypeEnum.SINGLE_INSTANCE_CP, None, release_time)
+                                 for schedule_idx, release_time in enumerate([0, 1, 3, 4, 10, 10, 10, 10, 20])])
+        batches = []
+        while sim.task_queue:
+            batches.append([queue_object.schedule_idx for queue_object in sim.pop_batch()])
+        # 3 is within the window of 2 but too late for the latency, 7 exceeds the batch size
+        self.assertEqual(batches, [[0, 1, 2], [3], [4, 5, 6], [7], [8]])
+
+    def test_resume(self):
+        def run(schedule_filepath, state_filepath=None, interrupt_after=None):
+            # Save the state on every event, so the interrupted run resumes from its last event
+            sim = Simulator(schedule_filepath, sigma=0, time_limit=1, state_filepath=state_filepath, state_seconds=0, workspace=self.workspace)
+            for i, release_time in enumerate(self.release_times):
+                sim.add_instance(Instance(copy.deepcopy(self.ra_pst), {}, id=i, release_time=release_time), AllocationTypeEnum.HEURISTIC)
+            if interrupt_after is not None:
+                save_state = sim.save_state_if_due
+                def interrupt():
+                    if len(sim.get_current_schedule_dict()["instances"]) >= interrupt_after:
+                        raise KeyboardInterrupt
+                    save_state()
+                sim.save_state_if_due = interrupt
+            sim.simulate()
+            with open(schedule_filepath) as f:
+                schedule = json.load(f)
+            del schedule["solution"]
+            return schedule
+
+        state_filepath = os.path.join(self.tmp_dir.name, "resume.state")
+        with self.assertRaises(KeyboardInterrupt):
+            run(os.path.join(self.tmp_dir.name, "resume.json"), state_filepath, interrupt_after=3)
+        self.assertTrue(os.path.exists(state_filepath))
+        resumed = run(os.path.join(self.tmp_dir.name, "resume.json"), state_filepath)
+        self.assertFalse(os.path.exists(state_filepath))
+        self.assertEqual(resumed, run(os.path.join(self.tmp_dir.name, "full.json")))
+
+    def test_resume_checks(self):
+        schedule_filepath = os.path.join(self.tmp_dir.name, "resume.json")
+        state_filepath = os.path.join(self.tmp_dir.name, "resume.state")
+        def get_simulator(state_key):
+            sim = Simulator(schedule_filepath, sigma=0, time_limit=1, max_workers=2, state_filepath=state_filepath, state_key=state_key, workspace=self.workspace)
+            for i, release_time in enumerate(self.release_times):
+                sim.add_instance(Instance(copy.deepcopy(self.ra_pst), {}, id=i, release_time=release_time), AllocationTypeEnum.HEURISTIC)
+            return sim
+
+        sim = get_simulator("a")
+        sim.set_schedule_file()
+        save_state(sim.get_state(), state_filepath)
+        # The restored instances use the executor, cache and workspace of the new simulator
+        sim = get_simulator("a")
+        sim.set_state(load_state(state_filepath))
+        for instance in sim.instances:
+            self.assertIs(instance.allocator.executor, sim.executor)
+            self.assertIs(instance.allocator.evaluation_cache, sim.evaluation_cache)
+            self.assertIs(instance.workspace, sim.workspace)
+        # A state saved with other inputs is removed instead of resumed
+        sim = get_simulator("b")
+        with mock.patch.object(Simulator, "set_state") as set_state:
+            sim.simulate()
+        set_state.assert_not_called()
+        self.assertFalse(os.path.exists(state_filepath))
+        with self.assertRaises(ValueError):
+            Simulator(schedule_filepath, sigma=0, time_limit=1, state_filepath=state_filepath, solver_workers=2)
+
+    def test_workspace(self):
+        workspace = Workspace(temporary=True)
+        sim = Simulator(os.path.join(self.tmp_dir.name, "workspace.json"), sigma=0, time_limit=1, workspace=workspace)
+        for i, release_time in enumerate(self.release_times):
+            sim.add_instance(Instance(copy.deepcopy(self.ra_pst), {}, id=i, release_time=release_time), AllocationTypeEnum.HEURISTIC)
+        sim.simulate()
+        self.assertTrue(os.path.isfile(os.path.join(workspace.root, "branch_raw.xml")))
+        workspace.cleanup()
+        self.assertFalse(os.path.exists(workspace.root))
+
+    def test_schedule_store(self):
+        schedule_filepath = os.path.join(self.tmp_dir.name, "store.json")
+        store = ScheduleStore(schedule_filepath, checkpoint_events=2)
+        schedule = store.get()
+        self.assertEqual(schedule["instances"], [])
+        job = {"resource": "r1", "start": 0, "cost": 2, "selected": True}
+        self.assertEqual(store.get_timeline().get_resource_intervals("r1"), ())
+
+        schedule["instances"].append({"jobs": {"j1": job}})
+        store.set(schedule, jobs={"j1": job})
+        self.assertFalse(os.path.exists(schedule_filepath))
+        self.assertEqual(store.get_timeline().intervals, Timeline.from_schedule_dict(schedule).intervals)
+
+        # The second change is a checkpoint
+        schedule["objective"] = 2
+        store.set(schedule, jobs={})
+        with open(schedule_filepath, "r") as f:
+            self.assertEqual(json.load(f), schedule)
+        self.assertEqual(ScheduleStore(schedule_filepath).get(), schedule)
+
+    def test_schedule_journal(self):
+        journal_filepath = os.path.join(self.tmp_dir.name, "journal.jsonl")
+        schedule = self.simulate(AllocationTypeEnum.HEURISTIC, journal_filepath=journal_filepath)
+        journal = ScheduleJournal(journal_filepath)
+        events = list(journal.read())
+        self.assertIn("update", [event["event"] for event in events])
+        self.assertEqual(journal.fold(), schedule)
+
+        # A line cut off by a crash is ignored
+        with open(journal_filepath, "a") as f:
+            f.write('{"event": "upd')
+        self.assertEqual(journal.fold(), schedule)
+        self.assertEqual(journal.compact(), schedule)
+        self.assertEqual(len(list(journal.read())), 1)
+        self.assertEqual(journal.fold(), schedule)
+
+    def test_concurrent_instances(self):
+        self.release_times = [0, 0, 0, 0, 5, 5, 12]
+        expected = self.simulate(AllocationTypeEnum.HEURISTIC)
+        for max_workers in [None, 4]:
+            schedule = self.simulate(AllocationTypeEnum.HEURISTIC, max_workers=max_workers, concurrent_instances=4)
+            self.assertEqual(schedule["instances"], expected["instances"])
+            self.assertEqual(schedule["objective"], expected["objective"])
+
+    def test_local_search(self):
+        greedy = self.simulate(AllocationTypeEnum.HEURISTIC)
+        local_search = LocalSearch([(self.ra_pst, release_time) for release_time in self.release_times], max_iterations=200)
+        # The sequence of the heuristic schedule decodes to the same schedule
+        sequence, branches = get_initial_solution(greedy, local_search.decoder)
+        solution, engine = local_search.decoder.decode(sequence, branches)
+        self.assertEqual(json.loads(json.dumps(engine.get_schedule_dict()))["instances"], greedy["instances"])
+
+        greedy["ilp_objective"] = 1
+        improved = local_search.run(copy.deepcopy(greedy))
+        self.assertNoOverlaps(improved)
+        self.assertLessEqual(improved["objective"], solution.objective)
+        # Keys of the schedule are kept and the search time is added to the computing time
+        self.assertEqual(improved["ilp_objective"], 1)
+        self.assertGreaterEqual(improved["solution"]["computing time"], greedy["solution"]["computing time"])
+        for instance in improved["instances"]:
+            self.assertTrue(any(job["selected"] for job in instance["jobs"].values()))
+
+        simulated = self.simulate(AllocationTypeEnum.HEURISTIC, local_search_budget=1)
+        self.assertNoOverlaps(simulated)
+        self.assertLessEqual(simulated["objective"], greedy["objective"])
+
+    def test_dispatching_rules(self):
+        self.release_times = [0, 0, 5, 12, 12, 20]
+        for allocation_type in [AllocationTypeEnum.DISPATCHING_SPT, AllocationTypeEnum.DISPATCHING_LPT, 
+                                AllocationTypeEnum.DISPATCHING_MWKR, AllocationTypeEnum.DISPATCHING_EDD]:
+            schedule = self.simulate(allocation_type)
+            self.assertNoOverlaps(schedule)
+            for instance in schedule["instances"]:
+                selected = [job for job in instance["jobs"].values() if job["selected"]]
+                self.assertTrue(selected)
+                self.assertGreaterEqual(min(job["start"] for job in selected), instance["release_time"])
+                self.assertLessEqual(max(job["start"] + job["cost"] for job in selected), schedule["objective"])
+
+    def test_dispatching_conflict_set(self):
+        engine = DispatchingHeuristic(DispatchRuleEnum.SPT, ProblemTable(self.ra_pst))
+        engine.add_instances([10, 10])
+        engine.update_eligible()
+        self.assertEqual(sorted(entry[-1] for entry in engine.eligible_queue), [0, 1])
+        # The new instance can finish its first task at 1, before the others are released
+        engine.add_instances([0])
+        engine.update_eligible()
+        self.assertEqual([entry[-1] for entry in engine.eligible_queue], [2])
+        engine.simulate()
+        self.assertFalse(engine.queued_counters)
+
+    def test_beam_search(self):
+        greedy = self.simulate(AllocationTypeEnum.SINGLE_INSTANCE_HEURISTIC)
+        beam = self.simulate(AllocationTypeEnum.SINGLE_INSTANCE_BEAM_SEARCH, beam_time_budget=0.5)
+        self.assertNoOverlaps(beam)
+        self.assertLessEqual(beam["objective"], greedy["objective"])
+        for instance in beam["instances"]:
+            self.assertTrue(any(job["selected"] for job in instance["jobs"].values()))
+
+    def test_warmstart(self):
+        schedule_filepath = os.path.join(self.tmp_dir.name, "warmstart.json")
+        sim = Simulator(schedule_filepath=schedule_filepath, sigma=0, time_limit=10, warmstart=True, workspace=self.workspace)
+        for i, release_time in enumerate(self.release_times):
+            instance = Instance(copy.deepcopy(self.ra_pst), {}, id=i, release_time=release_time)
+            sim.add_instance(instance, AllocationTypeEnum.ALL_INSTANCE_CP)
+        sim.set_namespace()
+        sim.set_schedule_file()
+        schedule_dict = sim.get_current_schedule_dict()
+        for queue_object in sim.task_queue:
+            instance_ilp_rep = sim.get_current_instance_ilp_rep(schedule_dict, queue_object)
+            schedule_dict = sim.add_ilp_rep_to_schedule(instance_ilp_rep, schedule_dict, queue_object)
+        
+        warm_start = sim.create_warmstart(schedule_dict, sim.task_queue)
+        self.assertNoOverlaps(warm_start)
+        for instance in warm_start["instances"]:
+            self.assertTrue(any(job["selected"] for job in instance["jobs"].values()))
+        # The queued instances and the schedule itself stay untouched
+        for queue_object in sim.task_queue:
+            self.assertEqual(queue_object.instance.current_task.attrib["id"], "a1")
+        self.assertFalse(any(job["selected"] for instance in schedule_dict["instances"] for job in instance["jobs"].values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,6 +2,7 @@ from src.ra_pst_py.builder import build_rapst, show_tree_as_graph
 from src.ra_pst_py.instance import transform_ilp_to_branches, Instance
 from src.ra_pst_py.schedule import Schedule
 from src.ra_pst_py.simulator import Simulator
+from src.ra_pst_py.workspace import Workspace
 
 from lxml import etree
 import unittest
@@ -17,14 +18,18 @@ class InstanceTest(unittest.TestCase):
             process_file="test_instances/paper_process.xml",
             resource_file="test_instances/offer_resources_many_invalid_branches.xml",
         )
-        self.instance = Instance(self.ra_pst, {}, id=1)
+        self.workspace = Workspace(temporary=True)
+        self.instance = Instance(self.ra_pst, {}, id=1, workspace=self.workspace)
+
+    def tearDown(self):
+        self.workspace.cleanup()
 
     def test_transform_ilp_to_branchmap(self):
         ra_pst = build_rapst(
             process_file="tests/test_data/test_instance_data/BPM_TestSet_10.xml",
             resource_file="tests/test_data/test_instance_data/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml",
         )
-        self.instance = Instance(ra_pst, {}, id=1)
+        self.instance = Instance(ra_pst, {}, id=1, workspace=self.workspace)
         schedule_file = "tests/test_data/test_instance_data/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.json"
         branches_to_apply = self.instance.transform_ilp_to_branchmap(schedule_file)
         target = {
@@ -48,17 +53,17 @@ class InstanceTest(unittest.TestCase):
         )
         #show_tree_as_graph(ra_pst)
         for i in range(8):
-            self.instance = Instance(copy.deepcopy(ra_pst), {}, id=i)
+            self.instance = Instance(copy.deepcopy(ra_pst), {}, id=i, workspace=self.workspace)
             schedule_file = "tests/test_data/test_instance_data/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.json"
             optimal_instance = self.instance.get_optimal_instance_from_schedule(
                 schedule_file=schedule_file
             )
             tree = etree.ElementTree(optimal_instance)
             etree.indent(tree, space="\t", level=0)
-            tree.write("test.xml")
+            tree.write(self.workspace.path("test.xml"))
 
             tasks, jobs = compare_task_w_jobs(
-                "test.xml", schedule_file, self.instance.id
+                self.workspace.path("test.xml"), schedule_file, self.instance.id
             )
             self.assertEqual(len(tasks), len(jobs))
 
@@ -74,7 +79,7 @@ class InstanceTest(unittest.TestCase):
             task1 = etree.fromstring(etree.tostring(task1))
             created_instances.append([instance, "heuristic"])
         instances_to_sim = created_instances
-        sim = Simulator()
+        sim = Simulator(workspace=self.workspace)
         sim.initialize(instances_to_sim, "heuristic")
         sched = Schedule()
         for i, task in enumerate(sim.task_queue):
@@ -84,8 +89,8 @@ class InstanceTest(unittest.TestCase):
             print(sched.schedule)
         print(sched.get_timeslot_matrix(0, "res1"))
 
-        show_tree_as_graph(self.ra_pst)
-        instance = Instance(self.ra_pst, {}, sched)
+        show_tree_as_graph(self.ra_pst, workspace=self.workspace)
+        instance = Instance(self.ra_pst, {}, sched, workspace=self.workspace)
         while instance.optimal_process is None:
             instance.allocate_next_task()
         print(instance.branches_to_apply)
@@ -104,7 +109,7 @@ class InstanceTest(unittest.TestCase):
                     resource_file=f"tests/test_data/resource_cp_tests/{file}",
                 )
             sched = Schedule()
-            instance = Instance(ra_pst, {}, sched)
+            instance = Instance(ra_pst, {}, sched, workspace=self.workspace)
             task1 = instance.ra_pst.get_tasklist()[0]
             child = etree.SubElement(task1, f"{{{instance.ns['cpee1']}}}release_time")
             child.text = str(0)
@@ -132,7 +137,7 @@ class InstanceTest(unittest.TestCase):
                     resource_file=f"tests/test_data/resource_cp_tests_w_del/{file}",
                 )
             sched = Schedule()
-            instance = Instance(ra_pst, {}, sched)
+            instance = Instance(ra_pst, {}, sched, workspace=self.workspace)
             task1 = instance.ra_pst.get_tasklist()[0]
             child = etree.SubElement(task1, f"{{{instance.ns['cpee1']}}}release_time")
             child.text = str(0)
@@ -163,7 +168,7 @@ class InstanceTest(unittest.TestCase):
             print(f"{str(file)}")
             # show_tree_as_graph(ra_pst)
             sched = Schedule()
-            instance = Instance(ra_pst, {}, sched)
+            instance = Instance(ra_pst, {}, sched, workspace=self.workspace)
             task1 = instance.ra_pst.get_tasklist()[0]
             child = etree.SubElement(task1, f"{{{instance.ns['cpee1']}}}release_time")
             child.text = str(0)
@@ -203,18 +208,24 @@ def compare_task_w_jobs(ra_pst, ilp, instance_id):
     return task_nodes, jobs
 
 class BranchTest(unittest.TestCase):
+     def setUp(self):
+        self.workspace = Workspace(temporary=True)
+
+     def tearDown(self):
+        self.workspace.cleanup()
+
      def test_apply_branches(self):
         ra_pst = build_rapst(
             process_file="tests/test_data/test_process.xml",
             resource_file=f"tests/test_data/resource_cp_tests/insert_after_before.xml",
         )
-        show_tree_as_graph(ra_pst)
-        instance = Instance(ra_pst=ra_pst, branches_to_apply={}, id=0)
+        show_tree_as_graph(ra_pst, workspace=self.workspace)
+        instance = Instance(ra_pst=ra_pst, branches_to_apply={}, id=0, workspace=self.workspace)
         for task_id in instance.ra_pst.get_tasklist(attribute="id"):
             branch = instance.ra_pst.get_branches()[task_id][0]
             allocated_ra_pst = branch.apply_to_process_refactor(instance)
         
         self.assertEqual(instance.ra_pst, allocated_ra_pst)
-        show_tree_as_graph(instance.ra_pst)
-        instance.ra_pst.save_ra_pst("test.xml")
+        show_tree_as_graph(instance.ra_pst, workspace=self.workspace)
+        instance.ra_pst.save_ra_pst(self.workspace.path("test.xml"))
 
@@ -5,12 +5,17 @@ from src.ra_pst_py.instance import Instance
 from src.ra_pst_py.schedule import Schedule, print_schedule
 from src.ra_pst_py.cp_docplex import cp_solver_scheduling_only
 from src.ra_pst_py.cp_docplex_decomposed import cp_subproblem
+from src.ra_pst_py.workspace import Workspace
 
+from concurrent.futures import ThreadPoolExecutor
+from unittest import mock
 from lxml import etree
 import unittest
+import tempfile
 import json
 import copy
 import time
+import os
 
 class ScheduleTest(unittest.TestCase):
 
@@ -333,4 +338,68 @@ class ScheduleTest(unittest.TestCase):
 
         result_sub, all_jobs = cp_subproblem(schedule_dict, branches)
         solve_details = result_sub.get_solver_infos()
-        print(f"CP_Sched: {result_sched['solution']['objective']} in {result_sched['solution']['computing time']}, Subproblem: {result_sub.get_objective_value()} in {solve_details.get('TotalTime', 'N/A')}")
\ No newline at end of file
+        print(f"CP_Sched: {result_sched['solution']['objective']} in {result_sched['solution']['computing time']}, Subproblem: {result_sub.get_objective_value()} in {solve_details.get('TotalTime', 'N/A')}")
+
+
+class SolverSchedulingTest(unittest.TestCase):
+    """ Batching and asynchronous solves of SINGLE_INSTANCE_CP with the solvers mocked """
+    def setUp(self):
+        self.ra_pst = build_rapst(
+            process_file="testsets_final_online/10_generated/process/BPM_TestSet_10.xml",
+            resource_file="testsets_final_online/10_generated/resources/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml"
+        )
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.workspace = Workspace(temporary=True)
+
+    def tearDown(self):
+        self.workspace.cleanup()
+        self.tmp_dir.cleanup()
+
+    def get_simulator(self, release_times:list[float], **kwargs) -> Simulator:
+        sim = Simulator(os.path.join(self.tmp_dir.name, "schedule.json"), sigma=0, time_limit=1, workspace=self.workspace, **kwargs)
+        for i, release_time in enumerate(release_times):
+            sim.add_instance(Instance(copy.deepcopy(self.ra_pst), {}, id=i, release_time=release_time), AllocationTypeEnum.SINGLE_INSTANCE_CP)
+        return sim
+
+    def test_batches(self):
+        batches = []
+        def solve(schedule_filepath, warm_start_json=None, **kwargs):
+            # The unfixed instances of the schedule file are the batch, the warm start is returned as solution
+            with open(schedule_filepath) as f:
+                schedule = json.load(f)
+            batches.append([idx for idx, ilp_rep in enumerate(schedule["instances"]) if not ilp_rep.get("fixed")])
+            for ilp_rep in warm_start_json["instances"]:
+                ilp_rep["fixed"] = True
+            return warm_start_json
+
+        sim = self.get_simulator([0, 1, 2, 10, 10, 10], warmstart=True, batch_window=1, max_batch_latency=1.5, max_batch_size=2)
+        with mock.patch("src.ra_pst_py.simulator.cp_solver", side_effect=solve) as cp_solver:
+            sim.simulate()
+        # 2 is within the window of 1 but too late for the latency, the third arrival at 10 exceeds the batch size
+        self.assertEqual(cp_solver.call_count, 4)
+        self.assertEqual(batches, [[0, 1], [2], [3, 4], [5]])
+        schedule = sim.get_current_schedule_dict()
+        self.assertTrue(all(sim.get_selected_jobs(ilp_rep) for ilp_rep in schedule["instances"]))
+
+    def test_async_apply_order(self):
+        def solve_instance(schedule_filepath, warm_start, *args):
+            # The solve of the first arrival finishes after the later ones
+            if schedule_filepath.endswith("solve-0.json"):
+                time.sleep(1)
+            return copy.deepcopy(warm_start)
+
+        sim = self.get_simulator([0, 1, 2, 3], solver_workers=4)
+        applied = []
+        apply_solution = Simulator.apply_solution
+        def record(self, queue_object, result):
+            applied.append(queue_object.schedule_idx)
+            return apply_solution(self, queue_object, result)
+        with mock.patch("src.ra_pst_py.simulator.solve_instance", side_effect=solve_instance) as solver, \
+                mock.patch("src.ra_pst_py.simulator.ProcessPoolExecutor", ThreadPoolExecutor), \
+                mock.patch.object(Simulator, "apply_solution", autospec=True, side_effect=record):
+            sim.simulate()
+        self.assertEqual(solver.call_count, 4)
+        self.assertEqual(applied, [0, 1, 2, 3])
+        schedule = sim.get_current_schedule_dict()
+        self.assertEqual(schedule["solution"]["applied solutions"], 4)
+        self.assertEqual(os.listdir(self.tmp_dir.name), ["schedule.json"])
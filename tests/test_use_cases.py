@@ -1,6 +1,16 @@
-from use_cases import EvalPipeline
+from use_cases import EvalPipeline, run_queue_worker, get_job_id
+from src.ra_pst_py.builder import build_rapst
+from src.ra_pst_py.instance import Instance
+from src.ra_pst_py.simulator import AllocationTypeEnum
+from src.ra_pst_py.workspace import Workspace
 
+from pathlib import Path
 import unittest
+import tempfile
+import shutil
+import json
+import copy
+import multiprocessing as mp
 
 class UseCaseTest(unittest.TestCase):
     def test_generator(self):
@@ -8,3 +18,60 @@ class UseCaseTest(unittest.TestCase):
         release_times = ep.generate_release_times(5, 5)
         print(release_times)
         print(sum(release_times) / len(release_times))
+
+    def test_run_matrix(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dirpath = Path(tmp_dir) / "10_generated"
+            shutil.copytree("testsets_final_online/10_generated", dirpath)
+            ep = EvalPipeline()
+            jobs = ep.get_matrix_jobs("run_same_release", [dirpath], [AllocationTypeEnum.HEURISTIC, AllocationTypeEnum.HEURISTIC], num_instances=2, add_metadata=False)
+            self.assertEqual(len(jobs), len(list((dirpath / "resources").iterdir())))
+            summary = ep.run_matrix(jobs, workers=2, work_dir=Path(tmp_dir) / "matrix", summary_path=Path(tmp_dir) / "summary.json")
+            self.assertEqual([record["job"] for record in summary], list(range(len(jobs))))
+            for record, job in zip(summary, jobs):
+                self.assertEqual(Path(record["schedule"]).stem, job["resource_files"][0].stem)
+                with open(record["schedule"]) as f:
+                    self.assertEqual(json.load(f)["solution"]["objective"], record["objective"])
+                # Working files of each job are in its own directory
+                self.assertTrue((Path(tmp_dir) / "matrix" / f"job_{record['job']}" / "branch_raw.xml").is_file())
+
+    def test_reuse_results(self):
+        process_file = Path("testsets_final_online/10_generated/process/BPM_TestSet_10.xml")
+        resource_file = Path("testsets_final_online/10_generated/resources/(0.6, 0.4, 0.0)-random-3-uniform-resource_based-2-1-10.xml")
+        ra_pst = build_rapst(process_file, resource_file)
+        other_ra_pst = build_rapst(process_file, resource_file.with_name("(0.6, 0.4, 0.0)-random-3-uniform-resource_based-4-2-10.xml"))
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            def run(time_limit=100, first_ra_pst=ra_pst):
+                ep = EvalPipeline(workspace=Workspace(tmp_dir))
+                ep.sim = None
+                instances = [Instance(copy.deepcopy(first_ra_pst if i == 0 else ra_pst), {}, id=i, release_time=0) for i in range(2)]
+                ep.execute_simulation(instances, Path(tmp_dir), AllocationTypeEnum.HEURISTIC, resource_file, time_limit=time_limit, add_metadata=False)
+                return ep.sim
+            self.assertIsNotNone(run())
+            # Same inputs are skipped, a different time limit is computed again
+            self.assertIsNone(run())
+            self.assertIsNotNone(run(time_limit=50))
+            # Different resources of an instance other than the last one are computed again
+            self.assertIsNotNone(run(time_limit=50, first_ra_pst=other_ra_pst))
+
+    def test_work_queue(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            dirpath = Path(tmp_dir) / "10_generated"
+            shutil.copytree("testsets_final_online/10_generated", dirpath)
+            ep = EvalPipeline()
+            jobs = ep.get_matrix_jobs("run_same_release", [dirpath], [AllocationTypeEnum.HEURISTIC], num_instances=2, add_metadata=False)
+            queue_dir = Path(tmp_dir) / "queue"
+            ep.enqueue_matrix(jobs[1:], queue_dir)
+            # Extending the sweep in another order does not change the ids of queued jobs
+            ep.enqueue_matrix(jobs[::-1], queue_dir)
+            workers = [mp.Process(target=run_queue_worker, args=(queue_dir, Path(tmp_dir) / "work"), kwargs={"poll_seconds": 0.1}) for _ in range(2)]
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+                self.assertEqual(worker.exitcode, 0)
+            summary = ep.get_queue_summary(queue_dir)
+            jobs = {get_job_id(job): job for job in jobs}
+            self.assertEqual(sorted(record["job"] for record in summary), sorted(jobs))
+            for record in summary:
+                self.assertEqual(Path(record["schedule"]).stem, jobs[record["job"]]["resource_files"][0].stem)
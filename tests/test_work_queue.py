@@ -0,0 +1,75 @@
+from src.ra_pst_py.work_queue import WorkQueue, run_worker
+
+import multiprocessing as mp
+import unittest
+import tempfile
+import time
+import os
+
+
+def square(task_id, task):
+    if task["x"] < 0:
+        raise ValueError("negative")
+    return {"square": task["x"] ** 2, "pid": os.getpid()}
+
+
+def run_square_worker(queue_dir):
+    run_worker(WorkQueue(queue_dir, lease_seconds=5), square, poll_seconds=0.05)
+
+
+class WorkQueueTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp_dir = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(self.tmp_dir.name, lease_seconds=5)
+
+    def tearDown(self):
+        self.tmp_dir.cleanup()
+
+    def test_claim(self):
+        self.assertTrue(self.queue.put("a", {"x": 1}))
+        self.assertFalse(self.queue.put("a", {"x": 1}))
+        with self.assertRaises(ValueError):
+            self.queue.put("a", {"x": 2})
+        self.assertEqual(self.queue.claim("w1"), ("a", {"x": 1}))
+        # The lease is exclusive
+        self.assertIsNone(self.queue.claim("w2"))
+        self.assertFalse(self.queue.heartbeat("a", "w2"))
+        self.assertTrue(self.queue.heartbeat("a", "w1"))
+        self.queue.complete("a", "w1", 1)
+        self.assertIsNone(self.queue.claim("w2"))
+        self.assertTrue(self.queue.is_finished())
+        self.assertEqual(self.queue.get_result("a"), {"worker": "w1", "result": 1})
+
+    def test_requeue_stale(self):
+        self.queue.put("a", {"x": 1})
+        self.queue.claim("dead")
+        self.assertEqual(self.queue.requeue_stale(), [])
+        past = time.time() - 10
+        os.utime(self.queue.lease_path("a"), (past, past))
+        self.assertEqual(self.queue.requeue_stale(), ["a"])
+        self.assertEqual(self.queue.claim("w1"), ("a", {"x": 1}))
+        self.assertFalse(self.queue.heartbeat("a", "dead"))
+        # The worker that lost its lease does not overwrite the result of the new owner
+        self.assertFalse(self.queue.complete("a", "dead", "late"))
+        self.assertTrue(self.queue.complete("a", "w1", "first"))
+        self.assertEqual(self.queue.get_result("a")["result"], "first")
+        self.assertFalse(os.path.exists(self.queue.lease_path("a")))
+
+    def test_workers(self):
+        for x in range(-1, 20):
+            self.queue.put(f"task_{x + 1:02d}", {"x": x})
+        # A dead worker left a lease on one of the tasks
+        self.queue.claim("dead")
+        past = time.time() - 10
+        os.utime(self.queue.lease_path("task_00"), (past, past))
+        workers = [mp.Process(target=run_square_worker, args=(self.tmp_dir.name,)) for _ in range(3)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(timeout=60)
+            self.assertEqual(worker.exitcode, 0)
+        self.assertTrue(self.queue.is_finished())
+        self.assertEqual(os.listdir(self.queue.leases_dir), [])
+        self.assertIn("ValueError", self.queue.get_result("task_00")["result"]["error"])
+        for x in range(20):
+            self.assertEqual(self.queue.get_result(f"task_{x + 1:02d}")["result"]["square"], x ** 2)
@@ -4,10 +4,19 @@ from src.ra_pst_py.instance import Instance
 from src.ra_pst_py.schedule import Schedule
 from src.ra_pst_py.core import RA_PST
 from src.ra_pst_py.ilp import configuration_ilp
-
+from src.ra_pst_py.event_simulation import EventSimulation
+from src.ra_pst_py.workspace import Workspace
+from src.ra_pst_py.work_queue import WorkQueue, run_worker
+
+from docplex.cp.config import context
+from concurrent.futures import ProcessPoolExecutor
+import gurobipy as gp
+import functools
+import hashlib
 import copy
 import os
 from pathlib import Path
+from typing import Iterable
 import numpy as np
 from lxml import etree
 import xmltodict
@@ -18,9 +27,17 @@ import json
 
 
 class EvalPipeline:
-    def __init__(self):
+    def __init__(self, resumable:bool=False, workspace:Workspace=None, reuse_results:bool=True):
         self.sim: Simulator
         self.release_times: list
+        # Save the state of each simulation next to its schedule, so an interrupted run resumes where it stopped
+        self.resumable = resumable
+        # Schedule files written by execute_simulation
+        self.schedule_paths: list[Path] = []
+        # Directory for working files of the simulators and the metadata ILP
+        self.workspace = workspace or Workspace()
+        # Skip simulations whose schedule file already has the run key of their inputs, see get_run_key
+        self.reuse_results = reuse_results
 
     def setup_simulator(
         self,
@@ -29,6 +46,8 @@ class EvalPipeline:
         schedule_dir: os.PathLike | str = "out/sim_schedule.json",
         sigma: int = 0,
         time_limit: int = 100,
+        state_filepath: os.PathLike | str = None,
+        state_key: str = None,
     ) -> None:
         # Check for replace pattern:
         for instance in instances:
@@ -39,7 +58,7 @@ class EvalPipeline:
 
         # Instantiate simulator
         self.sim = Simulator(
-            schedule_filepath=schedule_dir, sigma=sigma, time_limit=time_limit
+            schedule_filepath=schedule_dir, sigma=sigma, time_limit=time_limit, state_filepath=state_filepath, state_key=state_key, workspace=self.workspace
         )
         
         # Add instances to simulator
@@ -104,7 +123,7 @@ class EvalPipeline:
 
         # Parallelity measure:
         if ra_pst is not None:
-            ilp_path = "tmp/ilp_rep.json"
+            ilp_path = self.workspace.path("tmp", "ilp_rep.json")
             with open(ilp_path, "w") as f:
                 ilp_rep = ra_pst.get_ilp_rep()
                 json.dump(ilp_rep, f, indent=2)
@@ -141,7 +160,8 @@ class EvalPipeline:
 
     def combine_info_during_solving(self, schedule_path):
         """Adds solution_combined info dict for the schedule, which tracks metadata
-        for each solver run (only for single instance solving)
+        for each solver run (only for single instance solving).
+        Instances without a solution of their own, e.g. those solved in a batch with a later instance, are skipped.
 
         parameters:
             schedule_path: path of schedule file
@@ -160,6 +180,8 @@ class EvalPipeline:
         }
 
         for instance in schedule["instances"]:
+            if "solution" not in instance:
+                continue
             solution = instance["solution"]
 
             solution_concat["objective"].append(solution["objective"])
@@ -175,7 +197,7 @@ class EvalPipeline:
             json.dump(schedule, f, indent=2)
 
     def run_same_release(
-        self, dirpath: os.PathLike, allocation_types: list = [], num_instances:int=10, time_limit:int=100, sigma:int = None, suffix:str="", add_metadata:bool=True,
+        self, dirpath: os.PathLike, allocation_types: list = [], num_instances:int=10, time_limit:int=100, sigma:int = None, suffix:str="", add_metadata:bool=True, resource_files:list[Path]=None,
     ):
         """
         Executes various solution approaches for all subdirectories within `dirpath`.
@@ -194,6 +216,7 @@ class EvalPipeline:
             time_limit (int): Timeout for the allocation approach.
             sigma (Optional[int]): Sigma value for online allocation.  
                 If `None`, it defaults to 1 times the average task size.
+            resource_files (Optional[list[Path]]): Only these files of the resource directory are used.
         """
 
         if not allocation_types:
@@ -210,7 +233,7 @@ class EvalPipeline:
                 raise ValueError("Resource Dir does not exist")
 
             # Iterate over each file in the resources directory
-            for resource_file in tqdm(sorted(resources_dir.iterdir(), reverse=True)):
+            for resource_file in tqdm(sorted(resource_files or resources_dir.iterdir(), reverse=True)):
                 if not resource_file.is_file():
                     raise ValueError("Resource file is not a file")
 
@@ -248,7 +271,7 @@ class EvalPipeline:
 
 
     def run_generated_release(
-        self, dirpath: os.PathLike, allocation_types: list = [], num_instances:int=10, time_limit:int=100, sigma:int = None, suffix:str="", spread:int=None, add_metadata:bool=True, fixed_release_times:callable = None
+        self, dirpath: os.PathLike, allocation_types: list = [], num_instances:int=10, time_limit:int=100, sigma:int = None, suffix:str="", spread:int=None, add_metadata:bool=True, fixed_release_times:callable = None, resource_files:list[Path]=None
     ):
         """
         Executes various solution approaches for all subdirectories within `dirpath`.
@@ -267,6 +290,7 @@ class EvalPipeline:
             time_limit (int): Timeout for the allocation approach.
             sigma (Optional[int]): Sigma value for online allocation.  
                 If `None`, it defaults to 1 times the average task size.
+            resource_files (Optional[list[Path]]): Only these files of the resource directory are used.
         """
 
         if not allocation_types:
@@ -283,7 +307,7 @@ class EvalPipeline:
                 raise ValueError("Resource Dir does not exist")
 
             # Iterate over each file in the resources directory
-            for resource_file in tqdm(sorted(resources_dir.iterdir(), reverse=True)):
+            for resource_file in tqdm(sorted(resource_files or resources_dir.iterdir(), reverse=True)):
                 if not resource_file.is_file():
                     raise ValueError("Resource file is not a file")
 
@@ -493,6 +517,12 @@ class EvalPipeline:
         )
         # Ensure the parent directory exists
         schedule_path.parent.mkdir(parents=True, exist_ok=True)
+        self.schedule_paths.append(schedule_path)
+
+        run_key = self.get_run_key(instances, allocation_type, resource_file, sigma, time_limit, add_metadata, different_instances)
+        if self.reuse_results and get_schedule_run_key(schedule_path) == run_key:
+            print(f"Skip {str(allocation_type)} allocation of {resource_file.name}, {schedule_path} is up to date")
+            return
 
         # Setup the simulator
         self.setup_simulator(
@@ -501,6 +531,8 @@ class EvalPipeline:
             schedule_dir=schedule_path,
             sigma=sigma,
             time_limit=time_limit,
+            state_filepath=schedule_path.with_suffix(".state") if self.resumable else None,
+            state_key=run_key,
         )
 
         # Run the simulation
@@ -529,6 +561,138 @@ class EvalPipeline:
         }:
             self.combine_info_during_solving(schedule_path)
 
+        # The run key is added last, so interrupted runs are not skipped
+        with open(schedule_path, "r") as f:
+            schedule = json.load(f)
+        schedule["run_key"] = run_key
+        with open(schedule_path, "w") as f:
+            json.dump(schedule, f, indent=2)
+
+    def get_run_key(
+        self,
+        instances: list[Instance],
+        allocation_type: AllocationTypeEnum,
+        resource_file: Path,
+        sigma=0,
+        time_limit=100,
+        add_metadata:bool = True,
+        different_instances:bool = False
+    ) -> str:
+        """
+        Returns a hash of the inputs of execute_simulation: processes and resources of the instances, resource file,
+        release times, allocation type, sigma, time limit and the code version.
+        """
+        run_hash = hashlib.sha256()
+        for instance in instances:
+            run_hash.update(etree.tostring(instance.ra_pst.raw_process))
+            run_hash.update(etree.tostring(instance.ra_pst.resource_data))
+            run_hash.update(str(instance.release_time).encode())
+        with open(resource_file, "rb") as f:
+            run_hash.update(f.read())
+        run_hash.update(json.dumps([str(allocation_type), sigma, time_limit, add_metadata, different_instances]).encode())
+        run_hash.update(get_code_version().encode())
+        return run_hash.hexdigest()
+
+
+    def run_streaming_arrivals(self, process_file:os.PathLike, resource_file:os.PathLike, arrivals:Iterable[float], output_path:os.PathLike, until:float=None) -> dict:
+        """
+        Allocates a stream of arrivals of one RA-PST with the heuristic of EventSimulation.
+        Instances are created on arrival and appended to output_path as JSONL once they are completed,
+        so the number of arrivals is not limited by memory.
+
+        Args:
+            arrivals (Iterable[float]): Non-decreasing release times, e.g. of poisson_arrivals or jsonl_arrivals.
+            until (float): Only events up to this time are simulated.
+
+        Returns:
+            dict: The solution of the completed instances.
+        """
+        output_path = Path(output_path)
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(output_path, "w") as f:
+            write_instance = lambda ilp_rep: f.write(json.dumps(ilp_rep) + "\n")
+            simulation = EventSimulation(build_rapst(process_file, resource_file), arrivals, on_complete=write_instance)
+            simulation.simulate(until=until)
+        return {
+            "objective": simulation.objective,
+            "computing time": simulation.computing_time,
+            "total interval length": simulation.total_interval_length,
+            "completed instances": simulation.n_completed,
+            "max active instances": simulation.max_active_instances
+        }
+
+    def get_matrix_jobs(self, method:str, dirpaths:list[Path], allocation_types:list, **kwargs) -> list[dict]:
+        """
+        Returns the jobs of run_matrix for a run method, one per directory, resource file and allocation type.
+        kwargs are passed to the run method, e.g. num_instances, time_limit or suffix.
+        Only for run_same_release and run_generated_release, run_random_instances picks its resource files itself.
+        """
+        jobs = []
+        for dirpath in dirpaths:
+            for resource_file in sorted(Path(dirpath / "resources").iterdir(), reverse=True):
+                # Equal allocation types would write the same schedule file concurrently
+                for allocation_type in dict.fromkeys(allocation_types):
+                    jobs.append({"method": method, "dirpath": Path(dirpath), "allocation_types": [allocation_type], "resource_files": [resource_file], **kwargs})
+        return jobs
+
+    def run_matrix(self, jobs:list[dict], workers:int=None, threads_per_job:int=1, work_dir:os.PathLike="tmp/matrix", seed:int=None, summary_path:os.PathLike=None) -> list[dict]:
+        """
+        Runs independent jobs of the run methods in a process pool and returns a summary of their schedules.
+
+        Each job is a dict with the name of the run method as "method" and its arguments, see get_matrix_jobs.
+        The solvers of a job use threads_per_job threads and by default cpu_count // threads_per_job jobs run at once.
+        Schedules are written to dirpath/evaluation of each job as in the run methods,
+        working files of a job like tmp/ilp_rep.json go to its own workspace in work_dir/job_{i}.
+        With a seed, job i seeds the random generators with seed + i, so release times do not depend on the order of the jobs.
+
+        Returns:
+            list[dict]: Per schedule file the job index, path, objective, computing time and metadata,
+                in order of the jobs. Also written to summary_path if given.
+        """
+        workers = workers or max(1, (os.cpu_count() or 1) // threads_per_job)
+        work_dir = Path(work_dir).resolve()
+        jobs = [resolve_job_paths(job) for job in jobs]
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_matrix_worker, initargs=(threads_per_job,)) as pool:
+            futures = [
+                pool.submit(run_matrix_job, job, work_dir / f"job_{i}", None if seed is None else seed + i, self.resumable)
+                for i, job in enumerate(jobs)
+            ]
+            summary = [dict(record, job=i) for i, future in enumerate(futures) for record in future.result()]
+        if summary_path is not None:
+            with open(summary_path, "w") as f:
+                json.dump(summary, f, indent=2)
+        return summary
+
+    def enqueue_matrix(self, jobs:list[dict], queue_dir:os.PathLike, seed:int=None) -> WorkQueue:
+        """
+        Puts the jobs of get_matrix_jobs into a WorkQueue in queue_dir, with task ids of get_job_id.
+        Workers on any host that shares queue_dir run them with run_queue_worker.
+        Jobs that are already queued are not added again, so a sweep can be extended in any order.
+        With a seed, each job seeds the random generators with seed plus a number derived from its id.
+        """
+        queue = WorkQueue(queue_dir)
+        for job in jobs:
+            job = json.loads(json.dumps(resolve_job_paths(job), default=str))
+            job_id = get_job_id(job)
+            queue.put(job_id, {"job": job, "seed": None if seed is None else (seed + int(job_id[len("job_"):], 16)) % 2**32})
+        return queue
+
+    def get_queue_summary(self, queue_dir:os.PathLike, summary_path:os.PathLike=None) -> list[dict]:
+        """ Returns the records of the finished tasks in queue_dir like run_matrix, failed tasks have an "error" """
+        queue = WorkQueue(queue_dir)
+        summary = []
+        for task_id in queue.get_task_ids():
+            result = queue.get_result(task_id)
+            if result is None:
+                continue
+            if isinstance(result["result"], dict):
+                summary.append({"job": task_id, "worker": result["worker"], **result["result"]})
+                continue
+            summary.extend(dict(record, job=task_id, worker=result["worker"]) for record in result["result"])
+        if summary_path is not None:
+            with open(summary_path, "w") as f:
+                json.dump(summary, f, indent=2)
+        return summary
 
     def generate_release_times(self, num_instances:int, spread:int):
         """
@@ -554,6 +718,83 @@ class EvalPipeline:
         return release_times
 
 
+def get_schedule_run_key(schedule_path:os.PathLike) -> str:
+    """ Returns the run key of a schedule file written by execute_simulation, None if there is none """
+    try:
+        with open(schedule_path, "r") as f:
+            return json.load(f).get("run_key")
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+@functools.cache
+def get_code_version() -> str:
+    """ Hash of the sources of src/ra_pst_py, results of other code versions are not reused """
+    code_hash = hashlib.sha256()
+    for source_file in sorted(Path(__file__).resolve().parent.glob("src/ra_pst_py/*.py")):
+        code_hash.update(source_file.name.encode())
+        code_hash.update(source_file.read_bytes())
+    return code_hash.hexdigest()
+
+
+def get_job_id(job:dict) -> str:
+    """ Returns an id of a job of get_matrix_jobs from its method, paths, allocation types and arguments """
+    job = json.dumps(resolve_job_paths(job), default=str, sort_keys=True)
+    return f"job_{hashlib.sha256(job.encode()).hexdigest()[:16]}"
+
+
+def init_matrix_worker(threads:int) -> None:
+    """ Limits the threads of the CP and ILP solvers in a worker process of run_matrix """
+    context.params.Workers = threads
+    gp.setParam("Threads", threads)
+
+
+def resolve_job_paths(job:dict) -> dict:
+    """ Makes the paths of a job absolute, so jobs do not depend on the working directory of the worker """
+    job = dict(job)
+    job["dirpath"] = Path(job["dirpath"]).resolve()
+    for key in ("resource_files", "selected_resource_files"):
+        if job.get(key):
+            job[key] = [Path(resource_file).resolve() for resource_file in job[key]]
+    return job
+
+
+def run_matrix_job(job:dict, job_dir:Path, seed:int=None, resumable:bool=False) -> list[dict]:
+    """ Runs one job of EvalPipeline.run_matrix with its workspace in job_dir and returns the records of its schedules """
+    job_dir.mkdir(parents=True, exist_ok=True)
+    if seed is not None:
+        random.seed(seed)
+        np.random.seed(seed)
+    kwargs = dict(job)
+    method = kwargs.pop("method")
+    pipeline = EvalPipeline(resumable=resumable, workspace=Workspace(job_dir))
+    getattr(pipeline, method)(**kwargs)
+    records = []
+    for schedule_path in dict.fromkeys(pipeline.schedule_paths):
+        with open(schedule_path) as f:
+            schedule = json.load(f)
+        records.append({
+            "schedule": str(schedule_path),
+            "objective": schedule.get("solution", {}).get("objective"),
+            "computing time": schedule.get("solution", {}).get("computing time"),
+            "metadata": schedule.get("metadata")
+        })
+    return records
+
+
+def run_queue_worker(queue_dir:os.PathLike, work_dir:os.PathLike="tmp/queue", resumable:bool=False, threads:int=1, lease_seconds:float=600, poll_seconds:float=5) -> int:
+    """
+    Runs tasks of EvalPipeline.enqueue_matrix until the queue in queue_dir is finished, returns the number of tasks run.
+    Each task runs in work_dir/{task_id} like a job of run_matrix, its records are the result of the task.
+    """
+    init_matrix_worker(threads)
+    queue = WorkQueue(queue_dir, lease_seconds=lease_seconds)
+    work_dir = Path(work_dir).resolve()
+    def run_task(task_id:str, task:dict) -> list[dict]:
+        return run_matrix_job(resolve_job_paths(task["job"]), work_dir / task_id, task["seed"], resumable)
+    return run_worker(queue, run_task, poll_seconds=poll_seconds)
+
+
 def pos_random_normal(mean, sigma):
     x = round(np.random.normal(mean, sigma))
     return x if x >= 0 else pos_random_normal(mean, sigma)